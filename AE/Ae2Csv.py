@@ -1,9 +1,10 @@
 import os.path as op
-import csv
 import sys
 
 sys.path.append(op.join(op.dirname(__file__), "site-packages"))
-import xmltodict
+import fcpxml
+import timecode
+import xml2csv
 from PySide2.QtWidgets import (
     QApplication,
     QFileDialog,
@@ -114,130 +115,46 @@ class MainWindow(QMainWindow):
         )
         self.output_path_le.setText(folder_path)
 
-    def frames_to_TC(self, frames):
-        # h = int(frames / fps**60)
-        fps = float(self.fps_cbb.currentText())
-        m = int(frames / (fps * 60)) % 60
-        s = int((frames % (fps * 60)) / fps)
-        f = int(frames % (fps * 60) % fps)
-        # return ( "%02d:%02d:%02d:%02d" % ( h, m, s, f))
-        return "{:02d}:{:02d}:{:02d}".format(m, s, f)
-
-    def frames_to_second(self, frames):
-        # h = int(frames / fps**60)
-        fps = float(self.fps_cbb.currentText())
-        m = int(frames / (fps * 60)) % 60
-        s = int((frames % (fps * 60)) / fps)
-        f = int(frames % (fps * 60) % fps)
-        # return ( "%02d:%02d:%02d:%02d" % ( h, m, s, f))
-        second = "{}秒{}格".format(s, f)
-        if m > 0:
-            second = "{}分{}".format(m, second)
-        return second
-
     def read_xml_fps(self, fpath):
+        # The whole file is parsed here once; write_csv reuses the result.
         try:
-            with open(fpath) as xml_file:
-                data_dict = xmltodict.parse(xml_file.read())
-            fps = data_dict["xmeml"]["sequence"]["rate"]["timebase"]
-            return fps
-        except KeyError:
-            with open(fpath) as xml_file:
-                data_dict = xmltodict.parse(xml_file.read())
-            fps = data_dict["xmeml"]["project"]["children"]["clip"]["rate"]["timebase"]
-            return fps
-        except:
+            data = fcpxml.read(fpath)
+            return timecode.rate_label(timecode.rate_from_xml(data["timebase"], data["ntsc"]))
+        except Exception:
             dlg = QMessageBox(self)
             dlg.setWindowTitle("Invalid XML format")
             dlg.setText(f"Invalid XML format.\nError XML:{fpath}")
             dlg.exec_()
             return False
 
-    def read_xml(self, fpath):
-        check_list = ["generatoritem", "clipitem"]
-        with open(fpath) as xml_file:
-            data_dict = xmltodict.parse(xml_file.read())
-        tracks_data = data_dict["xmeml"]["sequence"]["media"]["video"]["track"]
-        row_list = []
-        if type(tracks_data) is list:
-            for tracks in tracks_data:
-                item_list = [i for i in tracks.keys() if i in check_list]
-                for item in item_list:
-                    if type(tracks[item]) is list:
-                        for track in tracks[item]:
-                            row_list.append(self.track_to_row(track))
-                    else:
-                        row_list.append(self.track_to_row(tracks[item]))
+    def write_csv(self):
+        # The conversion itself lives in xml2csv, which also runs without
+        # the window. It stays in this process, where the files picked were
+        # already parsed; failed files are listed in one message at the end.
+        report = xml2csv.convert_all(
+            self.fname_list, self.output_path_le.text(),
+            self.fps_cbb.currentText(), workers=1,
+        )
+        dlg = QMessageBox(self)
+        if report["errors"]:
+            dlg.setWindowTitle("Failed!")
+            dlg.setText(
+                "Convert failed!\n"
+                + "\n".join("{xml}: {error}".format(**i) for i in report["errors"])
+            )
         else:
-            item_list = [i for i in tracks_data.keys() if i in check_list]
-            for item in item_list:
-                if type(tracks_data[item]) is list:
-                    for track in tracks_data[item]:
-                        row_list.append(self.track_to_row(track))
-                else:
-                    row_list.append(self.track_to_row(tracks_data[item]))
-        return row_list
-
-    def track_to_row(self, track):
-        start_frame = int(track["start"])
-        end_frame = int(track["end"])
-        cut_duration = end_frame - start_frame
-        time_in = self.frames_to_TC(start_frame + 1)
-        time_out = self.frames_to_TC(end_frame)
-        duration_TC = self.frames_to_second(cut_duration)
-        row = [
-            track["name"],
-            time_in,
-            time_out,
-            duration_TC,
-            start_frame + 1,
-            end_frame,
-            cut_duration,
-        ]
-        return row
+            dlg.setWindowTitle("Success!")
+            dlg.setText(
+                "Convert success!\n{converted} converted, {skipped} unchanged".format(**report)
+            )
+        dlg.exec_()
 
-    def write_csv(self):
-        for xml in self.fname_list:
-            row_list = self.read_xml(xml)
-            fname = op.basename(xml).split(".")[0] + ".csv"
-            output_fpath = op.join(self.output_path_le.text(), fname)
-            with open(output_fpath, "w", newline="") as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(
-                    [
-                        "NO",
-                        "段落",
-                        "time in",
-                        "time out",
-                        "秒數",
-                        "frame in",
-                        "frame out",
-                        "cut duration",
-                    ]
-                )
-
-                def sort_list(row):
-                    return row[2]
-
-                row_list.sort(key=sort_list)
-                for idx, row in enumerate(row_list):
-                    writer.writerow([idx + 1] + row)
-            if op.exists(output_fpath):
-                dlg = QMessageBox(self)
-                dlg.setWindowTitle("Success!")
-                dlg.setText("Convert success!")
-                dlg.exec_()
-            else:
-                dlg = QMessageBox(self)
-                dlg.setWindowTitle("Failed!")
-                dlg.setText("Convert failed!")
-                dlg.exec_()
-
-
-app = QApplication([])
-
-window = MainWindow()
-window.resize(500, 200)
-window.show()
-
-app.exec_()
+
+if __name__ == "__main__":
+    app = QApplication([])
+
+    window = MainWindow()
+    window.resize(500, 200)
+    window.show()
+
+    app.exec_()
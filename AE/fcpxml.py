@@ -0,0 +1,120 @@
+import os.path as op
+import xml.etree.ElementTree as ET
+
+ITEM_TAGS = ("clipitem", "generatoritem")
+TRANSITION_TAG = "transitionitem"
+ITEM_FIELDS = ("name", "start", "end", "alignment")
+TRACK_PATH = ("xmeml", "sequence", "media", "video", "track")
+# The sequence rate, or the rate of the first clip in a project export.
+RATE_PATHS = (
+    ("xmeml", "sequence", "rate"),
+    ("xmeml", "project", "children", "clip", "rate"),
+)
+TIMECODE_PATH = ("xmeml", "sequence", "timecode")
+
+_cache = {}
+
+
+def cut_point(transition):
+    # The edit a transition sits on: its start or end when it is aligned to
+    # one side of the cut, the middle otherwise.
+    alignment = transition.get("alignment", "center")
+    if alignment in ("start", "start-black"):
+        return transition["start"]
+    if alignment in ("end", "end-black"):
+        return transition["end"]
+    return (transition["start"] + transition["end"]) // 2
+
+
+def resolve_transitions(elements):
+    # A clip that runs into a transition has end -1, and one that comes out
+    # of it has start -1; both are the transition's cut point.
+    for idx, element in enumerate(elements):
+        if element["type"] == TRANSITION_TAG:
+            continue
+        before = elements[idx - 1] if idx > 0 else None
+        after = elements[idx + 1] if idx + 1 < len(elements) else None
+        if element["start"] < 0 and before and before["type"] == TRANSITION_TAG:
+            element["start"] = cut_point(before)
+        if element["end"] < 0 and after and after["type"] == TRANSITION_TAG:
+            element["end"] = cut_point(after)
+    return elements
+
+
+def parse(fpath):
+    # One pass over the file. Every element is dropped from its parent once
+    # it is closed, so memory stays flat however long the cut is. Items are
+    # the clipitems and generatoritems directly on a sequence video track,
+    # in file order, with the -1 ends next to transitions filled in from the
+    # transitions, which are listed separately.
+    path = []
+    parents = []
+    rates = {}
+    display_format = ""
+    items = []
+    transitions = []
+    track_elements = []
+    track = -1
+    item = None
+    for event, elem in ET.iterparse(fpath, events=("start", "end")):
+        if event == "start":
+            path.append(elem.tag)
+            parents.append(elem)
+            if len(path) == 5 and tuple(path) == TRACK_PATH:
+                track += 1
+                track_elements = []
+            elif (
+                len(path) == 6
+                and elem.tag in ITEM_TAGS + (TRANSITION_TAG,)
+                and tuple(path[:5]) == TRACK_PATH
+            ):
+                item = {"track": track, "type": elem.tag}
+            continue
+        if item is not None:
+            if len(path) == 7 and elem.tag in ITEM_FIELDS:
+                item[elem.tag] = (elem.text or "").strip()
+            elif len(path) == 6:
+                item = dict(item, start=int(item["start"]), end=int(item["end"]))
+                if item["type"] != TRANSITION_TAG:
+                    item["name"] = item.get("name", "")
+                    item.pop("alignment", None)
+                track_elements.append(item)
+                item = None
+        elif len(path) == 5 and tuple(path) == TRACK_PATH:
+            for element in resolve_transitions(track_elements):
+                if element["type"] == TRANSITION_TAG:
+                    transitions.append(element)
+                else:
+                    items.append(element)
+            track_elements = []
+        elif elem.tag in ("timebase", "ntsc") and tuple(path[:-1]) in RATE_PATHS:
+            rates.setdefault(tuple(path[:-1]), {})[elem.tag] = (elem.text or "").strip()
+        elif elem.tag == "displayformat" and tuple(path[:-1]) == TIMECODE_PATH:
+            display_format = (elem.text or "").strip().upper()
+        path.pop()
+        parents.pop()
+        if parents:
+            parents[-1].remove(elem)
+
+    rate = next((rates[i] for i in RATE_PATHS if rates.get(i, {}).get("timebase")), None)
+    if rate is None:
+        raise ValueError(f"No timebase in {fpath}")
+    return {
+        "timebase": rate["timebase"],
+        "ntsc": rate.get("ntsc", "").upper() == "TRUE",
+        "drop_frame": display_format == "DF",
+        "items": items,
+        "transitions": transitions,
+    }
+
+
+def read(fpath):
+    # parse() once per file and session; a file that changed on disk is
+    # parsed again.
+    fpath = op.abspath(fpath)
+    stat = op.getmtime(fpath), op.getsize(fpath)
+    cached = _cache.get(fpath)
+    if cached is None or cached[0] != stat:
+        cached = (stat, parse(fpath))
+        _cache[fpath] = cached
+    return cached[1]
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import fcpxml
+
+SEQUENCE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE xmeml>
+<xmeml version="4">
+<sequence id="seq">
+<name>Cut</name>
+<rate><timebase>30</timebase><ntsc>TRUE</ntsc></rate>
+<timecode><rate><timebase>30</timebase><ntsc>TRUE</ntsc></rate><displayformat>DF</displayformat></timecode>
+<media>
+<video>
+<track>
+<clipitem id="a"><name>A</name><start>0</start><end>48</end><in>10</in><out>58</out>
+<file id="f"><name>a.mov</name><rate><timebase>24</timebase></rate></file>
+</clipitem>
+<generatoritem id="g"><name>Slug</name><start>48</start><end>60</end></generatoritem>
+</track>
+<track>
+<clipitem id="b"><name>B</name><start>30</start><end>90</end>
+<sequence id="nested"><media><video><track>
+<clipitem id="n"><name>Nested</name><start>0</start><end>5</end></clipitem>
+</track></video></media></sequence>
+</clipitem>
+</track>
+</video>
+<audio><track><clipitem id="s"><name>Sound</name><start>0</start><end>90</end></clipitem></track></audio>
+</media>
+</sequence>
+</xmeml>
+"""
+
+
+def write(tmp_path, text, name="cut.xml"):
+    fpath = tmp_path / name
+    fpath.write_text(text, encoding="utf-8")
+    return str(fpath)
+
+
+def test_parse(tmp_path):
+    data = fcpxml.parse(write(tmp_path, SEQUENCE_XML))
+    assert (data["timebase"], data["ntsc"], data["drop_frame"]) == ("30", True, True)
+    assert [(i["track"], i["type"], i["name"], i["start"], i["end"]) for i in data["items"]] == [
+        (0, "clipitem", "A", 0, 48),
+        (0, "generatoritem", "Slug", 48, 60),
+        (1, "clipitem", "B", 30, 90),
+    ]
+    assert data["transitions"] == []
+
+
+def test_parse_without_rate(tmp_path):
+    with pytest.raises(ValueError):
+        fcpxml.parse(write(tmp_path, "<xmeml><sequence><media/></sequence></xmeml>"))
+
+
+def test_read_cache(tmp_path):
+    fpath = write(tmp_path, SEQUENCE_XML)
+    assert fcpxml.read(fpath) is fcpxml.read(fpath)
+    first = fcpxml.read(fpath)
+    with open(fpath, "a", encoding="utf-8") as f:
+        f.write("\n")
+    os.utime(fpath, (0, 0))
+    assert fcpxml.read(fpath) is not first
+    assert fcpxml.read(fpath) == first
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+import timecode
+
+
+def test_parse_rate():
+    assert timecode.parse_rate("23.976") == timecode.NTSC_RATES["23.976"]
+    assert timecode.parse_rate(29.97) == timecode.NTSC_RATES["29.97"]
+    assert timecode.parse_rate("25") == 25
+    assert timecode.rate_from_xml("30", True) == timecode.NTSC_RATES["29.97"]
+    assert timecode.rate_label(timecode.rate_from_xml("24", True)) == "23.976"
+
+
+def test_drop_frame_boundaries():
+    assert timecode.frames_to_tc(1799, "29.97", drop=True) == "00:00:59;29"
+    assert timecode.frames_to_tc(1800, "29.97", drop=True) == "00:01:00;02"
+    assert timecode.frames_to_tc(17982, "29.97", drop=True) == "00:10:00;00"
+    assert timecode.frames_to_tc(3599, "59.94", drop=True) == "00:00:59;59"
+    assert timecode.frames_to_tc(3600, "59.94", drop=True) == "00:01:00;04"
+    assert timecode.frames_to_tc(1800, "29.97") == "00:01:00:00"
+
+
+@pytest.mark.parametrize("rate", ["29.97", "59.94"])
+def test_drop_frame_round_trip(rate):
+    for frames in list(range(0, 40000, 7)) + [107892 * 3 - 1, 107892 * 3]:
+        tc = timecode.frames_to_tc(frames, rate, drop=True)
+        assert timecode.tc_to_frames(tc, rate) == frames
+
+
+def test_no_drop_frame_at_whole_rates():
+    with pytest.raises(ValueError):
+        timecode.frames_to_tc(100, "25", drop=True)
+
+
+def test_duration():
+    assert timecode.frames_to_duration(36, 24) == "1秒12格"
+    assert timecode.frames_to_duration(24 * 64 + 12, "23.976") == "1分4秒12格"
+    assert timecode.frames_to_duration(24 * 3600 * 25, 24) == "25小時0分0秒0格"
+
+
+@pytest.mark.parametrize("rate, drop", [("23.976", False), ("29.97", True), ("59.94", True)])
+def test_batch_matches_scalar(rate, drop):
+    rng = random.Random(0)
+    frames = [rng.randrange(0, 24 * 3600 * 30) for _ in range(500)] + [0, 1799, 1800, 17982]
+    assert timecode.frames_to_tc_batch(frames, rate, drop) == [
+        timecode.frames_to_tc(i, rate, drop) for i in frames
+    ]
+    assert timecode.frames_to_duration_batch(frames, rate) == [
+        timecode.frames_to_duration(i, rate) for i in frames
+    ]
+    assert timecode.frames_to_tc_batch([], rate, drop) == []
+
+
+def test_batch_without_numpy(monkeypatch):
+    monkeypatch.setattr(timecode, "np", None)
+    assert timecode.frames_to_tc_batch([1799, 1800], "29.97", True) == ["00:00:59;29", "00:01:00;02"]
+    assert timecode.frames_to_duration_batch([36], 24) == ["1秒12格"]
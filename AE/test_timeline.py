@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+import fcpxml
+from timeline import Timeline
+
+DISSOLVE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<xmeml version="4"><sequence><rate><timebase>30</timebase><ntsc>TRUE</ntsc></rate>
+<media><video><track>
+<clipitem><name>A</name><start>0</start><end>-1</end></clipitem>
+<transitionitem><start>80</start><end>120</end><alignment>center</alignment></transitionitem>
+<clipitem><name>B</name><start>-1</start><end>-1</end></clipitem>
+<transitionitem><start>190</start><end>200</end><alignment>start</alignment></transitionitem>
+<clipitem><name>C</name><start>-1</start><end>250</end></clipitem>
+</track></video></media></sequence></xmeml>
+"""
+
+
+def random_items(rng, tracks=3):
+    # Clips laid out per track with random gaps and overlaps.
+    items = []
+    for track in range(tracks):
+        pos = rng.randint(0, 20)
+        for n in range(rng.randint(0, 15)):
+            length = rng.randint(1, 20)
+            items.append({
+                "name": f"{track}_{n}", "track": track, "type": "clipitem",
+                "start": pos, "end": pos + length,
+            })
+            pos = max(pos + length + rng.randint(-5, 8), 0)
+    return items
+
+
+def empty_runs(covered):
+    gaps = []
+    for frame, is_covered in enumerate(covered):
+        if is_covered:
+            continue
+        if gaps and gaps[-1][1] == frame:
+            gaps[-1] = (gaps[-1][0], frame + 1)
+        else:
+            gaps.append((frame, frame + 1))
+    return gaps
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_against_brute_force(seed):
+    rng = random.Random(seed)
+    items = random_items(rng)
+    index = Timeline(items)
+    order = {id(item): n for n, item in enumerate(items)}
+    last = max((i["end"] for i in items), default=0)
+    assert len(index) == len(items)
+
+    for frame in range(-2, last + 3):
+        expected = sorted(
+            (i for i in items if i["start"] <= frame < i["end"]),
+            key=lambda i: (i["track"], order[id(i)]),
+        )
+        assert index.at(frame) == expected
+        assert index.top(frame) is (expected[-1] if expected else None)
+
+    for _ in range(30):
+        start = rng.randint(-3, last + 3)
+        end = start + rng.randint(0, 30)
+        expected = sorted(
+            (i for i in items if i["start"] < end and start < i["end"]),
+            key=lambda i: (i["start"], order[id(i)]),
+        )
+        assert index.range(start, end) == (expected if end > start else [])
+
+    assert index.gaps() == empty_runs(
+        [any(i["start"] <= f < i["end"] for i in items) for f in range(last)]
+    )
+    for track in range(3):
+        assert index.gaps(track) == empty_runs(
+            [any(i["start"] <= f < i["end"] and i["track"] == track for i in items)
+             for f in range(last)]
+        )
+
+    def overlapping(a, b):
+        return a["start"] < b["end"] and b["start"] < a["end"]
+
+    same_track = {
+        (a["name"], b["name"])
+        for n, a in enumerate(items) for b in items[n + 1:]
+        if a["track"] == b["track"] and overlapping(a, b)
+    }
+    assert {(a["name"], b["name"]) for a, b, _, _ in index.overlaps()} == same_track
+    for a, b, start, end in index.overlaps(same_track=False):
+        assert overlapping(a, b)
+        assert max(a["start"], b["start"]) <= start < end <= min(a["end"], b["end"])
+
+    cuts = index.cut_list()
+    for start, end, item in cuts:
+        assert all(index.top(f) is item for f in range(start, end))
+    covered = sum(end - start for start, end, _ in cuts)
+    assert covered == last - sum(end - start for start, end in index.gaps())
+
+
+def test_transition_is_not_a_gap(tmp_path):
+    fpath = tmp_path / "dissolve.xml"
+    fpath.write_text(DISSOLVE_XML)
+    index = Timeline(fcpxml.parse(str(fpath))["items"])
+    assert [(i["name"], i["start"], i["end"]) for i in index.items] == [
+        ("A", 0, 100), ("B", 100, 190), ("C", 190, 250),
+    ]
+    assert index.gaps() == [] and index.overlaps() == []
+    assert index.top(99)["name"] == "A" and index.top(100)["name"] == "B"
+
+
+def test_empty():
+    index = Timeline([])
+    assert len(index) == 0
+    assert index.at(0) == [] and index.top(0) is None
+    assert index.range(0, 10) == []
+    assert index.gaps() == [] and index.overlaps() == [] and index.cut_list() == []
@@ -0,0 +1,69 @@
+import csv
+
+import xml2csv
+
+CUT_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<xmeml version="4"><sequence><rate><timebase>24</timebase><ntsc>TRUE</ntsc></rate>
+<media><video><track>
+<clipitem><name>B</name><start>36</start><end>60</end></clipitem>
+<clipitem><name>A</name><start>0</start><end>36</end></clipitem>
+</track></video></media></sequence></xmeml>
+"""
+
+
+def make_tree(tmp_path):
+    src = tmp_path / "src"
+    (src / "reel2").mkdir(parents=True)
+    (src / "cut.xml").write_text(CUT_XML)
+    (src / "reel2" / "cut.xml").write_text(CUT_XML)
+    (src / "broken.xml").write_text("<xmeml><sequence>")
+    return src
+
+
+def test_convert_all_collects_errors(tmp_path):
+    src = make_tree(tmp_path)
+    out = tmp_path / "out"
+    report = xml2csv.convert_all([str(src)], str(out), workers=1)
+    assert (report["files"], report["converted"], report["rows"]) == (3, 2, 4)
+    assert [e["xml"] for e in report["errors"]] == [str(src / "broken.xml")]
+    assert report["errors"][0]["error"].startswith("ParseError")
+    with open(out / "reel2" / "cut.csv", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == xml2csv.HEADER
+    assert [row[1] for row in rows[1:]] == ["A", "B"]
+    # The same through the process pool.
+    report = xml2csv.convert_all([str(src)], str(out), workers=2, force=True)
+    assert (report["converted"], len(report["errors"])) == (2, 1)
+    assert xml2csv.main([str(src), "-o", str(out), "-j", "1"]) == 1
+
+
+def test_manifest_skips_unchanged(tmp_path):
+    src = make_tree(tmp_path)
+    (src / "broken.xml").unlink()
+    out = tmp_path / "out"
+    first = xml2csv.convert_all([str(src)], str(out), workers=1)
+    assert (first["converted"], first["skipped"]) == (2, 0)
+
+    report = xml2csv.convert_all([str(src)], str(out), workers=1)
+    assert (report["converted"], report["skipped"]) == (0, 2)
+
+    # A changed XML, another fps, a deleted CSV, an older manifest version
+    # and --force each convert again.
+    (src / "cut.xml").write_text(CUT_XML.replace("<end>60</end>", "<end>72</end>"))
+    report = xml2csv.convert_all([str(src)], str(out), workers=1)
+    assert (report["converted"], report["skipped"]) == (1, 1)
+    report = xml2csv.convert_all([str(src)], str(out), fps="25", workers=1)
+    assert (report["converted"], report["skipped"]) == (2, 0)
+    (out / "reel2" / "cut.csv").unlink()
+    report = xml2csv.convert_all([str(src)], str(out), fps="25", workers=1)
+    assert (report["converted"], report["skipped"]) == (1, 1)
+    manifest = xml2csv.load_manifest(str(out))
+    for entry in manifest.values():
+        entry["settings"] = entry["settings"].replace(
+            str(xml2csv.MANIFEST_VERSION) + "|", str(xml2csv.MANIFEST_VERSION - 1) + "|", 1
+        )
+    xml2csv.save_manifest(str(out), manifest)
+    report = xml2csv.convert_all([str(src)], str(out), fps="25", workers=1)
+    assert (report["converted"], report["skipped"]) == (2, 0)
+    report = xml2csv.convert_all([str(src)], str(out), fps="25", workers=1, force=True)
+    assert (report["converted"], report["skipped"]) == (2, 0)
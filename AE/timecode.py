@@ -0,0 +1,156 @@
+from fractions import Fraction
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The NTSC rates are 1000/1001 of the whole number rates; "23.976" is only
+# their label.
+NTSC_RATES = {
+    "23.976": Fraction(24000, 1001),
+    "29.97": Fraction(30000, 1001),
+    "47.952": Fraction(48000, 1001),
+    "59.94": Fraction(60000, 1001),
+    "119.88": Fraction(120000, 1001),
+}
+
+
+def parse_rate(value):
+    # "23.976", "24", 29.97, Fraction(30000, 1001) -> exact Fraction.
+    if isinstance(value, Fraction):
+        return value
+    text = str(value).strip()
+    if text in NTSC_RATES:
+        return NTSC_RATES[text]
+    rate = Fraction(text)
+    for ntsc in NTSC_RATES.values():
+        if abs(rate - ntsc) < Fraction(1, 100):
+            return ntsc
+    if rate <= 0:
+        raise ValueError(f"Invalid frame rate: {value}")
+    return rate
+
+
+def rate_from_xml(timebase, ntsc=False):
+    # FCP XML stores the whole number timebase plus an NTSC flag.
+    rate = Fraction(int(timebase))
+    return rate * Fraction(1000, 1001) if ntsc else rate
+
+
+def rate_label(rate):
+    for label, ntsc in NTSC_RATES.items():
+        if rate == ntsc:
+            return label
+    return str(int(rate)) if rate.denominator == 1 else str(float(rate))
+
+
+def nominal(rate):
+    # Frames per timecode second: 24 for 23.976, 30 for 29.97.
+    return round(rate)
+
+
+def supports_drop(rate):
+    return rate.denominator == 1001 and nominal(rate) % 30 == 0
+
+
+def _dropped(rate):
+    # Frame numbers skipped at the start of every minute but each tenth:
+    # 2 at 29.97, 4 at 59.94.
+    if not supports_drop(rate):
+        raise ValueError(f"No drop-frame timecode at {rate_label(rate)} fps")
+    return nominal(rate) // 15
+
+
+def _split(frames, base):
+    f = frames % base
+    seconds = frames // base
+    return seconds // 3600 % 24, seconds // 60 % 60, seconds % 60, f
+
+
+def _drop_adjust(frames, rate):
+    # Frame count -> the frame number the drop-frame timecode shows.
+    d = _dropped(rate)
+    per_minute = nominal(rate) * 60 - d
+    per_10_minutes = per_minute * 10 + d
+    tens, rest = divmod(frames, per_10_minutes)
+    return frames + 9 * d * tens + d * (max(rest - d, 0) // per_minute)
+
+
+def frames_to_tc(frames, rate, drop=False):
+    # SMPTE HH:MM:SS:FF, or HH:MM:SS;FF for drop-frame.
+    rate = parse_rate(rate)
+    frames = int(frames)
+    if drop:
+        frames = _drop_adjust(frames, rate)
+    h, m, s, f = _split(frames, nominal(rate))
+    return "{:02d}:{:02d}:{:02d}{}{:02d}".format(h, m, s, ";" if drop else ":", f)
+
+
+def tc_to_frames(tc, rate):
+    # Inverse of frames_to_tc; a ";" before the frames means drop-frame.
+    rate = parse_rate(rate)
+    drop = ";" in tc
+    h, m, s, f = (int(i) for i in tc.replace(";", ":").split(":"))
+    base = nominal(rate)
+    frames = ((h * 60 + m) * 60 + s) * base + f
+    if drop:
+        minutes = h * 60 + m
+        frames -= _dropped(rate) * (minutes - minutes // 10)
+    return frames
+
+
+def frames_to_duration(frames, rate):
+    # "1分4秒12格": minutes, seconds and frames of a cut, counted in
+    # timecode seconds. Hours only show up on very long cuts.
+    seconds, f = divmod(int(frames), nominal(parse_rate(rate)))
+    h, m, s = seconds // 3600, seconds // 60 % 60, seconds % 60
+    text = "{}秒{}格".format(s, f)
+    if m or h:
+        text = "{}分{}".format(m, text)
+    if h:
+        text = "{}小時{}".format(h, text)
+    return text
+
+
+def frames_to_tc_batch(frames, rate, drop=False):
+    # Whole columns at once. With NumPy the arithmetic runs on arrays and
+    # only the final join is per row.
+    rate = parse_rate(rate)
+    if np is None:
+        return [frames_to_tc(i, rate, drop) for i in frames]
+    frames = np.asarray(frames, dtype=np.int64)
+    if len(frames) == 0:
+        return []
+    if drop:
+        d = _dropped(rate)
+        per_minute = nominal(rate) * 60 - d
+        tens, rest = np.divmod(frames, per_minute * 10 + d)
+        frames = frames + 9 * d * tens + d * (np.maximum(rest - d, 0) // per_minute)
+    base = nominal(rate)
+    seconds, f = np.divmod(frames, base)
+    parts = [seconds // 3600 % 24, seconds // 60 % 60, seconds % 60, f]
+    parts = [np.char.zfill(i.astype("U"), 2) for i in parts]
+    sep = ";" if drop else ":"
+    joined = np.char.add(np.char.add(np.char.add(parts[0], ":"), parts[1]), ":")
+    joined = np.char.add(np.char.add(np.char.add(joined, parts[2]), sep), parts[3])
+    return joined.tolist()
+
+
+def frames_to_duration_batch(frames, rate):
+    rate = parse_rate(rate)
+    if np is None:
+        return [frames_to_duration(i, rate) for i in frames]
+    seconds, f = np.divmod(np.asarray(frames, dtype=np.int64), nominal(rate))
+    texts = []
+    for h, m, s, f in zip(
+        (seconds // 3600).tolist(), (seconds // 60 % 60).tolist(), (seconds % 60).tolist(),
+        f.tolist(),
+    ):
+        text = "{}秒{}格".format(s, f)
+        if m or h:
+            text = "{}分{}".format(m, text)
+        if h:
+            text = "{}小時{}".format(h, text)
+        texts.append(text)
+    return texts
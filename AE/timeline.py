@@ -0,0 +1,154 @@
+import argparse
+import sys
+from bisect import bisect_left, bisect_right
+
+import fcpxml
+import timecode
+
+
+class Timeline:
+    # Sorted-array index over the items of all video tracks. The sequence
+    # is cut at every item start and end; for each piece between two cuts
+    # the index keeps the items that cover it, ordered by track. A frame
+    # is found with one bisect, and a range with two plus the pieces in it.
+    # Items use sequence frames with the end excluded, like the XML, and
+    # fcpxml has already put the clips next to a transition on its cut
+    # point; an item that still has no start or end (-1) is left out.
+
+    def __init__(self, items):
+        self.items = [i for i in items if 0 <= i["start"] < i["end"]]
+        events = {}
+        for idx, item in enumerate(self.items):
+            events.setdefault(item["start"], ([], []))[0].append(idx)
+            events.setdefault(item["end"], ([], []))[1].append(idx)
+        self.bounds = sorted(events)
+        self.covers = []
+        active = set()
+        for bound in self.bounds:
+            starting, ending = events[bound]
+            active.difference_update(ending)
+            active.update(starting)
+            self.covers.append(
+                tuple(sorted(active, key=lambda i: (self.items[i]["track"], i)))
+            )
+
+    def __len__(self):
+        return len(self.items)
+
+    def at(self, frame):
+        # Items under the frame, lowest track first.
+        piece = bisect_right(self.bounds, frame) - 1
+        if piece < 0:
+            return []
+        return [self.items[i] for i in self.covers[piece]]
+
+    def top(self, frame):
+        # The item that is seen at the frame, or None.
+        items = self.at(frame)
+        return items[-1] if items else None
+
+    def range(self, start, end):
+        # Items overlapping [start, end), in order of start.
+        if end <= start:
+            return []
+        first = max(bisect_right(self.bounds, start) - 1, 0)
+        last = bisect_left(self.bounds, end)
+        found = set()
+        for cover in self.covers[first:last]:
+            found.update(cover)
+        return [self.items[i] for i in sorted(found, key=lambda i: (self.items[i]["start"], i))]
+
+    def pieces(self):
+        # (start, end, [item indexes]) for every piece up to the last end.
+        for idx in range(len(self.bounds) - 1):
+            yield self.bounds[idx], self.bounds[idx + 1], self.covers[idx]
+
+    def overlaps(self, same_track=True):
+        # (item, item, start, end) for items that cover the same frames.
+        # Stacked tracks are how an edit is built, so by default only
+        # items on one track are reported, which the XML shouldn't have.
+        found = {}
+        for start, end, cover in self.pieces():
+            for a_idx, a in enumerate(cover):
+                for b in cover[a_idx + 1:]:
+                    if same_track and self.items[a]["track"] != self.items[b]["track"]:
+                        continue
+                    pair = (a, b)
+                    if pair in found:
+                        found[pair][1] = end
+                    else:
+                        found[pair] = [start, end]
+        return [
+            (self.items[a], self.items[b], start, end)
+            for (a, b), (start, end) in sorted(found.items(), key=lambda i: (i[1][0], i[0]))
+        ]
+
+    def gaps(self, track=None):
+        # (start, end) of the frames between 0 and the last end that have
+        # no item, on any track or on the one given.
+        gaps = []
+        last = 0
+        for start, end, cover in self.pieces():
+            if any(track is None or self.items[i]["track"] == track for i in cover):
+                if start > last:
+                    gaps.append((last, start))
+                last = end
+        end = self.bounds[-1] if self.bounds else 0
+        if track is not None and last < end:
+            gaps.append((last, end))
+        return gaps
+
+    def cut_list(self):
+        # The edit as it plays: (start, end, item) for the top item over
+        # time, with neighbouring pieces of one item joined. Gaps are left
+        # out.
+        cuts = []
+        for start, end, cover in self.pieces():
+            if not cover:
+                continue
+            item = self.items[cover[-1]]
+            if cuts and cuts[-1][2] is item and cuts[-1][1] == start:
+                cuts[-1][1] = end
+            else:
+                cuts.append([start, end, item])
+        return [tuple(i) for i in cuts]
+
+
+def read(fpath):
+    return Timeline(fcpxml.read(fpath)["items"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check a Final Cut Pro XML timeline for overlaps and gaps."
+    )
+    parser.add_argument("xml")
+    parser.add_argument("--at", type=int, action="append", default=[], help="frame to look up")
+    parser.add_argument("--cuts", action="store_true", help="print the flattened cut list")
+    args = parser.parse_args(argv)
+
+    data = fcpxml.read(args.xml)
+    rate = timecode.rate_from_xml(data["timebase"], data["ntsc"])
+
+    def tc(frame):
+        return timecode.frames_to_tc(frame, rate, data["drop_frame"])
+
+    index = Timeline(data["items"])
+    overlaps = index.overlaps()
+    gaps = index.gaps()
+    print("{} items, {} overlaps, {} gaps".format(len(index), len(overlaps), len(gaps)))
+    for a, b, start, end in overlaps:
+        print("Overlap {} - {}: {} / {}".format(tc(start), tc(end), a["name"], b["name"]))
+    for start, end in gaps:
+        print("Gap {} - {}".format(tc(start), tc(end)))
+    for frame in args.at:
+        names = ", ".join(i["name"] for i in reversed(index.at(frame))) or "-"
+        print("At {}: {}".format(tc(frame), names))
+    if args.cuts:
+        for start, end, item in index.cut_list():
+            print("{} {} {}".format(tc(start), tc(end), item["name"]))
+    return 1 if overlaps else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
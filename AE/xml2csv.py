@@ -0,0 +1,226 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import os.path as op
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fcpxml
+import timecode
+
+HEADER = [
+    "NO",
+    "段落",
+    "time in",
+    "time out",
+    "秒數",
+    "frame in",
+    "frame out",
+    "cut duration",
+]
+# Kept in the output folder; bump the version when the CSV layout, row order
+# or values change so old outputs are written again.
+MANIFEST_NAME = ".xml2csv.manifest.json"
+MANIFEST_VERSION = 3
+
+
+def items_to_rows(items, rate, drop=False):
+    # Timecodes for the whole cut list in one call per column.
+    starts = [int(i["start"]) for i in items]
+    ends = [int(i["end"]) for i in items]
+    durations = [end - start for start, end in zip(starts, ends)]
+    time_in = timecode.frames_to_tc_batch([i + 1 for i in starts], rate, drop)
+    time_out = timecode.frames_to_tc_batch(ends, rate, drop)
+    seconds = timecode.frames_to_duration_batch(durations, rate)
+    return [
+        [item["name"], *row]
+        for item, row in zip(
+            items, zip(time_in, time_out, seconds, [i + 1 for i in starts], ends, durations)
+        )
+    ]
+
+
+def read_rows(fpath, fps=None, drop_frame=None):
+    # fps is the FPS setting of the window, such as "23.976"; without one
+    # the rate in the file is used. Drop-frame follows the sequence unless
+    # set, and only applies at 29.97 and 59.94.
+    data = fcpxml.read(fpath)
+    if fps:
+        rate = timecode.parse_rate(fps)
+    else:
+        rate = timecode.rate_from_xml(data["timebase"], data["ntsc"])
+    drop = data["drop_frame"] if drop_frame is None else drop_frame
+    return items_to_rows(data["items"], rate, drop and timecode.supports_drop(rate))
+
+
+def csv_fpath_for(fpath, output_dir):
+    return op.join(output_dir, op.basename(fpath).split(".")[0] + ".csv")
+
+
+def write_csv(fpath, output_dir, fps=None, drop_frame=None):
+    row_list = read_rows(fpath, fps, drop_frame)
+    # In order of frame out, as the "time out" column used to be sorted.
+    row_list.sort(key=lambda row: row[5])
+    output_fpath = csv_fpath_for(fpath, output_dir)
+    with open(output_fpath, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADER)
+        for idx, row in enumerate(row_list):
+            writer.writerow([idx + 1] + row)
+    return output_fpath, len(row_list)
+
+
+def collect_xmls(paths, output_dir):
+    # [(xml, output folder)]; folders are walked and their structure is
+    # kept under output_dir, so equal names in different folders don't
+    # overwrite each other.
+    jobs = []
+    for path in paths:
+        if op.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                out_dir = op.normpath(op.join(output_dir, op.relpath(root, path)))
+                for fname in sorted(files):
+                    if fname.lower().endswith(".xml"):
+                        jobs.append((op.join(root, fname), out_dir))
+        else:
+            jobs.append((path, output_dir))
+    return jobs
+
+
+def file_hash(fpath):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_key(fps, drop_frame):
+    return "{}|{}|{}".format(MANIFEST_VERSION, fps or "xml", drop_frame)
+
+
+def load_manifest(output_dir):
+    try:
+        with open(op.join(output_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_manifest(output_dir, manifest):
+    os.makedirs(output_dir, exist_ok=True)
+    fpath = op.join(output_dir, MANIFEST_NAME)
+    tmp_fpath = "{}.{}.tmp".format(fpath, os.getpid())
+    with open(tmp_fpath, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_fpath, fpath)
+
+
+def is_unchanged(entry, digest, settings):
+    return (
+        entry is not None
+        and entry.get("hash") == digest
+        and entry.get("settings") == settings
+        and op.isfile(entry.get("csv", ""))
+    )
+
+
+def convert_one(job):
+    fpath, output_dir, fps, drop_frame = job
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        output_fpath, rows = write_csv(fpath, output_dir, fps, drop_frame)
+        return {"xml": fpath, "csv": output_fpath, "rows": rows}
+    except Exception as e:
+        return {"xml": fpath, "error": "{}: {}".format(type(e).__name__, e)}
+
+
+def convert_all(
+    paths, output_dir, fps=None, workers=None, drop_frame=None, force=False
+):
+    # Files that can't be read end up under "errors" instead of stopping
+    # the batch. The manifest in output_dir remembers the content hash and
+    # settings each CSV was written with, so XMLs that were exported again
+    # unchanged are only hashed, not parsed.
+    started = time.monotonic()
+    settings = settings_key(fps, drop_frame)
+    manifest = {} if force else load_manifest(output_dir)
+    jobs = []
+    digests = {}
+    skipped = []
+    for fpath, out_dir in collect_xmls(paths, output_dir):
+        key = op.abspath(fpath)
+        try:
+            digests[key] = file_hash(fpath)
+        except OSError:
+            pass
+        if is_unchanged(manifest.get(key), digests.get(key), settings):
+            skipped.append(manifest[key])
+        else:
+            jobs.append((fpath, out_dir, fps, drop_frame))
+    if workers == 1 or len(jobs) < 2:
+        results = [convert_one(i) for i in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(convert_one, jobs, chunksize=4))
+    converted = [i for i in results if "error" not in i]
+    for result in results:
+        key = op.abspath(result["xml"])
+        if "error" in result or key not in digests:
+            manifest.pop(key, None)
+        else:
+            manifest[key] = {
+                "hash": digests[key], "settings": settings,
+                "csv": op.abspath(result["csv"]), "rows": result["rows"],
+            }
+    if results or force:
+        save_manifest(output_dir, manifest)
+    seconds = time.monotonic() - started
+    files = len(jobs) + len(skipped)
+    return {
+        "files": files,
+        "converted": len(converted),
+        "skipped": len(skipped),
+        "rows": sum(i["rows"] for i in converted),
+        "errors": [i for i in results if "error" in i],
+        "seconds": round(seconds, 3),
+        "files_per_second": round(files / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert Final Cut Pro XML cut lists to CSV without the window."
+    )
+    parser.add_argument("input", nargs="+", help="XML files or folders")
+    parser.add_argument("-o", "--output", default=os.getcwd(), help="output folder")
+    parser.add_argument("--fps", default=None, help="e.g. 23.976; default: the XML rate")
+    parser.add_argument(
+        "--drop-frame", action=argparse.BooleanOptionalAction, default=None,
+        help="drop-frame timecode at 29.97/59.94; default: as in the XML",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes")
+    parser.add_argument(
+        "--force", action="store_true", help="convert unchanged XMLs again"
+    )
+    args = parser.parse_args(argv)
+
+    report = convert_all(
+        args.input, args.output, args.fps, args.jobs, args.drop_frame, args.force
+    )
+    for error in report["errors"]:
+        print("Failed: {xml}\n  {error}".format(**error), file=sys.stderr)
+    print(
+        "{converted}/{files} files ({skipped} unchanged), {rows} rows in {seconds}s "
+        "({files_per_second} files/s)".format(**report)
+    )
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -51,6 +51,7 @@ from PySide6.QtWidgets import (
     QProgressBar,
     QPushButton,
     QSizePolicy,
+    QSpinBox,
     QWidget,
     QStyle,
     QFileDialog,
@@ -61,13 +62,16 @@ class Ui_Form(object):
     def setupUi(self, Form):
         if not Form.objectName():
             Form.setObjectName("Form")
-        Form.resize(400, 245)
+        Form.resize(400, 370)
         self.start_button = QPushButton(Form)
         self.start_button.setObjectName("start_button")
-        self.start_button.setGeometry(QRect(90, 190, 75, 23))
+        self.start_button.setGeometry(QRect(40, 330, 75, 23))
+        self.preview_button = QPushButton(Form)
+        self.preview_button.setObjectName("preview_button")
+        self.preview_button.setGeometry(QRect(162, 330, 75, 23))
         self.abort_button = QPushButton(Form)
         self.abort_button.setObjectName("abort_button")
-        self.abort_button.setGeometry(QRect(220, 190, 75, 23))
+        self.abort_button.setGeometry(QRect(285, 330, 75, 23))
         self.progress_bar = QProgressBar(Form)
         self.progress_bar.setObjectName("progress_bar")
         self.progress_bar.setGeometry(QRect(170, 150, 201, 23))
@@ -104,6 +108,59 @@ class Ui_Form(object):
         self.tta_checkBox = QCheckBox(Form)
         self.tta_checkBox.setObjectName("tta_checkBox")
         self.tta_checkBox.setGeometry(QRect(40, 150, 73, 21))
+        self.stream_checkBox = QCheckBox(Form)
+        self.stream_checkBox.setObjectName("stream_checkBox")
+        self.stream_checkBox.setGeometry(QRect(40, 185, 111, 21))
+        self.jobs_label = QLabel(Form)
+        self.jobs_label.setObjectName("jobs_label")
+        self.jobs_label.setGeometry(QRect(170, 185, 31, 20))
+        self.jobs_spinBox = QSpinBox(Form)
+        self.jobs_spinBox.setObjectName("jobs_spinBox")
+        self.jobs_spinBox.setGeometry(QRect(200, 185, 51, 22))
+        self.jobs_spinBox.setMinimum(1)
+        self.jobs_spinBox.setMaximum(64)
+        self.decode_label = QLabel(Form)
+        self.decode_label.setObjectName("decode_label")
+        self.decode_label.setGeometry(QRect(40, 215, 61, 18))
+        self.decode_bar = QProgressBar(Form)
+        self.decode_bar.setObjectName("decode_bar")
+        self.decode_bar.setGeometry(QRect(110, 215, 221, 18))
+        self.decode_bar.setValue(0)
+        self.decode_workers_spinBox = QSpinBox(Form)
+        self.decode_workers_spinBox.setObjectName("decode_workers_spinBox")
+        self.decode_workers_spinBox.setGeometry(QRect(335, 215, 36, 18))
+        self.decode_workers_spinBox.setMinimum(1)
+        self.decode_workers_spinBox.setMaximum(8)
+        self.upscale_label = QLabel(Form)
+        self.upscale_label.setObjectName("upscale_label")
+        self.upscale_label.setGeometry(QRect(40, 240, 61, 18))
+        self.upscale_bar = QProgressBar(Form)
+        self.upscale_bar.setObjectName("upscale_bar")
+        self.upscale_bar.setGeometry(QRect(110, 240, 221, 18))
+        self.upscale_bar.setValue(0)
+        self.upscale_workers_spinBox = QSpinBox(Form)
+        self.upscale_workers_spinBox.setObjectName("upscale_workers_spinBox")
+        self.upscale_workers_spinBox.setGeometry(QRect(335, 240, 36, 18))
+        self.upscale_workers_spinBox.setMinimum(1)
+        self.upscale_workers_spinBox.setMaximum(8)
+        self.encode_label = QLabel(Form)
+        self.encode_label.setObjectName("encode_label")
+        self.encode_label.setGeometry(QRect(40, 265, 61, 18))
+        self.encode_bar = QProgressBar(Form)
+        self.encode_bar.setObjectName("encode_bar")
+        self.encode_bar.setGeometry(QRect(110, 265, 221, 18))
+        self.encode_bar.setValue(0)
+        self.encode_workers_spinBox = QSpinBox(Form)
+        self.encode_workers_spinBox.setObjectName("encode_workers_spinBox")
+        self.encode_workers_spinBox.setGeometry(QRect(335, 265, 36, 18))
+        self.encode_workers_spinBox.setMinimum(1)
+        self.encode_workers_spinBox.setMaximum(8)
+        self.dedup_checkBox = QCheckBox(Form)
+        self.dedup_checkBox.setObjectName("dedup_checkBox")
+        self.dedup_checkBox.setGeometry(QRect(270, 185, 111, 21))
+        self.frame_cache_checkBox = QCheckBox(Form)
+        self.frame_cache_checkBox.setObjectName("frame_cache_checkBox")
+        self.frame_cache_checkBox.setGeometry(QRect(40, 295, 101, 21))
         self.model_comboBox = QComboBox(Form)
         self.model_comboBox.addItem("")
         self.model_comboBox.addItem("")
@@ -124,6 +181,7 @@ class Ui_Form(object):
     def retranslateUi(self, Form):
         Form.setWindowTitle(QCoreApplication.translate("Form", "Form", None))
         self.start_button.setText(QCoreApplication.translate("Form", "Start", None))
+        self.preview_button.setText(QCoreApplication.translate("Form", "Preview", None))
         self.abort_button.setText(QCoreApplication.translate("Form", "Abort", None))
         self.input_label.setText(QCoreApplication.translate("Form", "Input File", None))
         self.output_label.setText(
@@ -144,6 +202,31 @@ class Ui_Form(object):
         )
         self.scale_label.setText(QCoreApplication.translate("Form", "Scale", None))
         self.tta_checkBox.setText(QCoreApplication.translate("Form", "TTA mode", None))
+        self.stream_checkBox.setText(
+            QCoreApplication.translate("Form", "Streaming mode", None)
+        )
+        self.jobs_label.setText(QCoreApplication.translate("Form", "Jobs", None))
+        self.decode_label.setText(QCoreApplication.translate("Form", "Decode", None))
+        self.upscale_label.setText(QCoreApplication.translate("Form", "Upscale", None))
+        self.encode_label.setText(QCoreApplication.translate("Form", "Encode", None))
+        self.decode_workers_spinBox.setToolTip(
+            QCoreApplication.translate("Form", "Workers for this stage in a batch", None)
+        )
+        self.upscale_workers_spinBox.setToolTip(
+            QCoreApplication.translate("Form", "Workers for this stage in a batch", None)
+        )
+        self.encode_workers_spinBox.setToolTip(
+            QCoreApplication.translate("Form", "Workers for this stage in a batch", None)
+        )
+        self.dedup_checkBox.setText(
+            QCoreApplication.translate("Form", "Skip held frames", None)
+        )
+        self.frame_cache_checkBox.setToolTip(
+            QCoreApplication.translate("Form", "Reuse upscaled frames from earlier jobs", None)
+        )
+        self.frame_cache_checkBox.setText(
+            QCoreApplication.translate("Form", "Frame cache", None)
+        )
         self.model_comboBox.setItemText(
             0, QCoreApplication.translate("Form", "realesrgan-x4plus", None)
         )
@@ -166,12 +249,12 @@ class Ui_Form(object):
 
     @Slot()
     def slot_read_input(self):
-        input_fpath = QFileDialog.getOpenFileName(
-            self, "Open File", QDir.homePath(), "Video (*.mp4 *.mkv *.flv)"
+        input_fpaths = QFileDialog.getOpenFileNames(
+            self, "Open Files", QDir.homePath(), "Video (*.mp4 *.mkv *.flv)"
         )[0]
 
-        if input_fpath:
-            self.input_lineEdit.setText(input_fpath)
+        if input_fpaths:
+            self.input_lineEdit.setText(";".join(input_fpaths))
 
     @Slot()
     def slot_set_output(self):
@@ -0,0 +1,349 @@
+import functools
+import io
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pipeline
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+
+# A backend upscales either a folder of images into another folder
+# (upscale_dir, calling on_done(src, out) for every finished frame) or a
+# batch of bgr24 frames from memory into PNG data (upscale_frames, used by
+# the streaming pipeline).
+
+
+class NcnnBackend:
+    # realesrgan-ncnn-vulkan, or the command in AI2X_UPSCALER. args are
+    # extra flags such as the tuned -j and -t.
+    name = "ncnn"
+
+    def __init__(self, args=()):
+        self.args = list(args)
+
+    def command(self, input_dir, output_dir, model, scale, tta, ext):
+        cmd = [
+            *pipeline.upscaler_cmd(), "-i", input_dir, "-o", output_dir,
+            "-n", model, "-s", str(scale), "-f", ext, "-v", *self.args,
+        ]
+        if tta:
+            cmd.append("-x")
+        return cmd
+
+    def upscale_dir(
+        self, input_dir, output_dir, model, scale, tta=False, ext="png", on_done=None, aborted=None
+    ):
+        # With -v realesrgan prints "<in> -> <out> done" after saving each
+        # frame; the percentage lines in between are per tile.
+        def on_line(line):
+            line = line.rstrip()
+            if on_done and line.endswith(" done") and " -> " in line:
+                src, out = line[:-len(" done")].split(" -> ", 1)
+                on_done(src.strip(), out.strip())
+
+        return pipeline.run_process(
+            self.command(input_dir, output_dir, model, scale, tta, ext), on_line, aborted
+        )
+
+    def upscale_frames(
+        self, frames, width, height, model, scale, tta=False, work_dir=None, aborted=None
+    ):
+        # The executable only reads files, so the batch goes through BMPs,
+        # which cost nothing to write.
+        in_dir = os.path.join(work_dir, "in")
+        out_dir = os.path.join(work_dir, "out")
+        os.makedirs(in_dir, exist_ok=True)
+        os.makedirs(out_dir, exist_ok=True)
+        try:
+            for idx, frame in enumerate(frames):
+                pipeline.write_bmp(os.path.join(in_dir, f"{idx:08d}.bmp"), frame, width, height)
+            if not self.upscale_dir(in_dir, out_dir, model, scale, tta, "png", aborted=aborted):
+                if aborted and aborted():
+                    return None
+                raise RuntimeError("realesrgan-ncnn-vulkan failed")
+            scaled = []
+            for idx in range(len(frames)):
+                with open(os.path.join(out_dir, f"{idx:08d}.png"), "rb") as f:
+                    scaled.append(f.read())
+            return scaled
+        finally:
+            for d in (in_dir, out_dir):
+                for name in os.listdir(d):
+                    os.remove(os.path.join(d, name))
+
+
+LANCZOS_A = 3
+
+
+@functools.lru_cache(maxsize=8)
+def lanczos_phases(scale, a=LANCZOS_A):
+    # With an integer scale, output pixel scale * i + p always sits at the
+    # same distance from source pixel i, so the weights only depend on the
+    # phase p. Pixel centers are aligned like ffmpeg and Pillow do it.
+    center = (np.arange(scale) + 0.5) / scale - 0.5
+    offsets = np.floor(center).astype(np.int64)[:, None] - a + 1 + np.arange(2 * a)
+    x = center[:, None] - offsets
+    weights = np.sinc(x) * np.sinc(x / a)
+    weights[np.abs(x) >= a] = 0
+    weights /= weights.sum(axis=1, keepdims=True)
+    return offsets, weights.astype(np.float32)
+
+
+def resize_axis(src, scale, axis, a=LANCZOS_A):
+    # Every tap is a shifted slice of the edge-padded input, so the whole
+    # batch is resampled with plain array arithmetic.
+    offsets, weights = lanczos_phases(scale, a)
+    pad = [(0, 0)] * src.ndim
+    pad[axis] = (a, a)
+    padded = np.pad(src, pad, mode="edge")
+    size = src.shape[axis]
+    shape = list(src.shape)
+    shape[axis] *= scale
+    out = np.empty(shape, np.float32)
+    acc = np.empty(src.shape, np.float32)
+    tmp = np.empty(src.shape, np.float32)
+    index = [slice(None)] * src.ndim
+    for phase in range(scale):
+        acc.fill(0)
+        for offset, weight in zip(offsets[phase], weights[phase]):
+            if weight == 0:
+                continue
+            index[axis] = slice(a + offset, a + offset + size)
+            np.multiply(padded[tuple(index)], weight, out=tmp)
+            acc += tmp
+        index[axis] = slice(phase, None, scale)
+        out[tuple(index)] = acc
+    return out
+
+
+def lanczos_resize(frames, scale):
+    # frames is uint8 (N, H, W, C), resampled along y and then along x.
+    rows = resize_axis(frames.astype(np.float32), scale, 1)
+    out = resize_axis(rows, scale, 2)
+    return np.clip(np.rint(out), 0, 255).astype(np.uint8)
+
+
+def frame_mode(image):
+    # Alpha is kept, as realesrgan keeps it; everything else becomes RGB.
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        return "RGBA"
+    return "RGB"
+
+
+class LanczosBackend:
+    # CPU Lanczos-3 for drafts, tests and machines without Vulkan. model
+    # and tta are ignored, and the output only depends on the input, so
+    # runs are reproducible. Batches of frames are resampled in a thread
+    # pool; NumPy and Pillow release the GIL for the heavy parts.
+    name = "lanczos"
+
+    def __init__(self, workers=None, chunk=4):
+        if np is None:
+            raise RuntimeError("The lanczos backend needs NumPy and Pillow")
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk = chunk
+
+    def chunks(self, items):
+        return [items[i:i + self.chunk] for i in range(0, len(items), self.chunk)]
+
+    def upscale_dir(
+        self, input_dir, output_dir, model, scale, tta=False, ext="png", on_done=None, aborted=None
+    ):
+        os.makedirs(output_dir, exist_ok=True)
+        lock = threading.Lock()
+
+        def run(fnames):
+            if aborted and aborted():
+                return False
+            srcs = [os.path.join(input_dir, i) for i in fnames]
+            images = []
+            for src in srcs:
+                with Image.open(src) as image:
+                    images.append(np.asarray(image.convert(frame_mode(image))))
+            # Frames of one video share a size, but a folder might not, nor
+            # have alpha in all of its images.
+            groups = {}
+            for n, image in enumerate(images):
+                groups.setdefault(image.shape, []).append(n)
+            for members in groups.values():
+                scaled = lanczos_resize(np.stack([images[n] for n in members]), int(scale))
+                for n, frame in zip(members, scaled):
+                    out = os.path.join(output_dir, os.path.splitext(fnames[n])[0] + "." + ext)
+                    image = Image.fromarray(frame)
+                    if ext == "jpg":
+                        image.convert("RGB").save(out, quality=95)
+                    else:
+                        image.save(out, compress_level=1)
+                    if on_done:
+                        with lock:
+                            on_done(srcs[n], out)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(run, self.chunks(pipeline.list_frames(input_dir))))
+        return all(results)
+
+    def upscale_frames(
+        self, frames, width, height, model, scale, tta=False, work_dir=None, aborted=None
+    ):
+        def run(batch):
+            array = np.frombuffer(b"".join(batch), np.uint8).reshape(len(batch), height, width, 3)
+            pngs = []
+            for frame in lanczos_resize(array[..., ::-1], int(scale)):
+                buf = io.BytesIO()
+                Image.fromarray(frame).save(buf, "PNG", compress_level=1)
+                pngs.append(buf.getvalue())
+            return pngs
+
+        if aborted and aborted():
+            return None
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return [png for pngs in pool.map(run, self.chunks(frames)) for png in pngs]
+
+
+# Mean absolute luma difference between samples ROUTE_STEP pixels apart,
+# in 8 bit levels, below which a frame counts as flat. Black frames,
+# fades and plain title cards sit well under it.
+ROUTE_THRESHOLD = 2.0
+ROUTE_STEP = 4
+
+
+def complexity(luma, step=ROUTE_STEP):
+    luma = luma[::step, ::step].astype(np.float32)
+    if luma.shape[0] < 2 or luma.shape[1] < 2:
+        return 0.0
+    dx = np.abs(np.diff(luma, axis=1)).mean()
+    dy = np.abs(np.diff(luma, axis=0)).mean()
+    return float(dx + dy) / 2
+
+
+def file_complexity(fpath):
+    with Image.open(fpath) as image:
+        width = image.width
+        # JPEGs decode straight to a smaller size, which is all we need.
+        image.draft("L", (image.width // ROUTE_STEP, image.height // ROUTE_STEP))
+        luma = np.asarray(image.convert("L"))
+    reduced = max(width // max(luma.shape[1], 1), 1)
+    return complexity(luma, max(ROUTE_STEP // reduced, 1))
+
+
+class RoutedBackend:
+    # Flat frames go to Lanczos, the rest to the main backend; the model
+    # adds nothing to a frame without detail. Counts the split for the
+    # job report.
+
+    def __init__(self, main, threshold=ROUTE_THRESHOLD):
+        self.main = main
+        self.cheap = LanczosBackend()
+        self.threshold = threshold
+        self.name = f"{main.name}+lanczos<{threshold}"
+        self.counts = {main.name: 0, "lanczos": 0}
+        self.lock = threading.Lock()
+
+    def count(self, detailed, flat):
+        with self.lock:
+            self.counts[self.main.name] += detailed
+            self.counts["lanczos"] += flat
+
+    def upscale_dir(
+        self, input_dir, output_dir, model, scale, tta=False, ext="png", on_done=None, aborted=None
+    ):
+        fnames = pipeline.list_frames(input_dir)
+        flat = [
+            i for i in fnames if file_complexity(os.path.join(input_dir, i)) < self.threshold
+        ]
+        if not flat:
+            self.count(len(fnames), 0)
+            return self.main.upscale_dir(
+                input_dir, output_dir, model, scale, tta, ext, on_done, aborted
+            )
+        flat_set = set(flat)
+        detailed = [i for i in fnames if i not in flat_set]
+        self.count(len(detailed), len(flat))
+        # The two groups are linked into folders of their own, next to the
+        # output so they end up on the same drive.
+        work_dir = tempfile.mkdtemp(prefix="route_", dir=os.path.dirname(output_dir))
+        try:
+            ok = True
+            groups = (("flat", flat, self.cheap), ("detail", detailed, self.main))
+            for name, group, backend in groups:
+                if not group:
+                    continue
+                group_dir = os.path.join(work_dir, name)
+                pipeline.link_frames(input_dir, group_dir, group)
+                ok = backend.upscale_dir(
+                    group_dir, output_dir, model, scale, tta, ext, on_done, aborted
+                ) and ok
+            return ok
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def upscale_frames(
+        self, frames, width, height, model, scale, tta=False, work_dir=None, aborted=None
+    ):
+        flat = []
+        for frame in frames:
+            bgr = np.frombuffer(frame, np.uint8).reshape(height, width, 3)
+            # Rec. 601 luma from the bgr24 samples.
+            luma = bgr[..., 0] * 0.114 + bgr[..., 1] * 0.587 + bgr[..., 2] * 0.299
+            flat.append(complexity(luma) < self.threshold)
+        self.count(flat.count(False), flat.count(True))
+        pngs = [None] * len(frames)
+        for backend, wanted in ((self.cheap, True), (self.main, False)):
+            group = [n for n, is_flat in enumerate(flat) if is_flat == wanted]
+            if not group:
+                continue
+            scaled = backend.upscale_frames(
+                [frames[n] for n in group], width, height, model, scale, tta, work_dir, aborted
+            )
+            if scaled is None:
+                return None
+            for n, png in zip(group, scaled):
+                pngs[n] = png
+        return pngs
+
+    def report(self):
+        total = sum(self.counts.values())
+        return dict(
+            self.counts, threshold=self.threshold,
+            ratio=round(self.counts["lanczos"] / total, 3) if total else 0.0,
+        )
+
+
+BACKENDS = {"ncnn": NcnnBackend, "lanczos": LanczosBackend}
+
+
+def make_backend(options, args=()):
+    name = options.get("backend") or "ncnn"
+    if name == "ncnn":
+        backend = NcnnBackend(args)
+    else:
+        backend = BACKENDS[name]()
+    # route_threshold True takes the default threshold.
+    threshold = options.get("route_threshold")
+    if threshold is not None and threshold is not False and name != "lanczos":
+        backend = RoutedBackend(backend, ROUTE_THRESHOLD if threshold is True else threshold)
+    return backend
+
+
+def merge_reports(reports):
+    reports = [i for i in reports if i]
+    if not reports:
+        return None
+    merged = dict(reports[0])
+    for report in reports[1:]:
+        for name, value in report.items():
+            if name not in ("threshold", "ratio"):
+                merged[name] += value
+    total = sum(v for k, v in merged.items() if k not in ("threshold", "ratio"))
+    merged["ratio"] = round(merged["lanczos"] / total, 3) if total else 0.0
+    return merged
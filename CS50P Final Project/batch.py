@@ -0,0 +1,297 @@
+import json
+import os
+import queue
+import threading
+import traceback
+
+import config
+import job
+import media
+import pipeline
+import telemetry
+
+
+QUEUE_FPATH = os.path.join(config.CACHE_DIR, "queue.json")
+VIDEO_EXTS = (".mp4", ".mkv", ".flv", ".mov", ".avi", ".webm", ".m4v", ".ts")
+PENDING, DONE, FAILED = "pending", "done", "failed"
+
+
+def collect_jobs(paths, output_dir):
+    # [(video, output folder)]. A folder is mirrored into output_dir, like
+    # images.collect_images does, so equal names in different subfolders
+    # don't share an output, manifest or temp folder; with several inputs
+    # every folder gets a subfolder named after it. An output folder inside
+    # the input isn't read back in. Without output_dir only the videos are
+    # collected and their output folder is None.
+    jobs = []
+    skip_dir = os.path.abspath(output_dir) if output_dir else None
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.normpath(path)
+            dst_root = output_dir
+            if output_dir and len(paths) > 1:
+                dst_root = os.path.join(output_dir, os.path.basename(path))
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(
+                    i for i in dirs if os.path.abspath(os.path.join(root, i)) != skip_dir
+                )
+                out_dir = None
+                if dst_root:
+                    out_dir = os.path.normpath(
+                        os.path.join(dst_root, os.path.relpath(root, path))
+                    )
+                for fname in sorted(files):
+                    if fname.lower().endswith(VIDEO_EXTS):
+                        jobs.append((os.path.join(root, fname), out_dir))
+        elif os.path.isfile(path):
+            jobs.append((path, output_dir))
+    return jobs
+
+
+def collect_videos(paths, output_dir=None):
+    return [video for video, _ in collect_jobs(paths, output_dir)]
+
+
+class JobQueue:
+    # Persistent list of jobs. A job keeps its status between runs; the
+    # frames themselves resume from each job's manifest.
+
+    def __init__(self, fpath=QUEUE_FPATH):
+        self.fpath = fpath
+        self._lock = threading.Lock()
+        self.jobs = []
+        if os.path.exists(fpath):
+            try:
+                with open(fpath) as f:
+                    self.jobs = json.load(f)
+            except (OSError, ValueError):
+                self.jobs = []
+
+    def add(self, paths, output_dir, model, scale, tta, options=None):
+        # Returns the jobs of this call. Finished jobs of earlier runs are
+        # dropped first; their results are in the report files. A video
+        # that is still pending takes the settings of this call.
+        self.jobs = self.pending()
+        queued = {(i["input"], i["output_dir"]): i for i in self.jobs}
+        added = []
+        seen = set()
+        for video, out_dir in collect_jobs(paths, output_dir):
+            key = (os.path.abspath(video), out_dir)
+            if key in seen:
+                continue
+            seen.add(key)
+            item = queued.get(key)
+            if item is None:
+                item = {"input": key[0], "output_dir": out_dir}
+                self.jobs.append(item)
+            item.update(
+                model=model,
+                scale=str(scale),
+                tta=bool(tta),
+                options=options or {},
+                status=PENDING,
+                error=None,
+            )
+            added.append(item)
+        self.save()
+        return added
+
+    def pending(self):
+        return [i for i in self.jobs if i["status"] == PENDING]
+
+    def mark(self, item, status, error=None):
+        with self._lock:
+            item["status"] = status
+            item["error"] = error
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.fpath) or ".", exist_ok=True)
+        tmp_fpath = self.fpath + ".tmp"
+        with open(tmp_fpath, "w") as f:
+            json.dump(self.jobs, f, indent=2)
+        os.replace(tmp_fpath, self.fpath)
+
+
+def stage_limits(options=None):
+    # "stage_workers" is [decode, upscale, encode] worker threads.
+    workers = (options or {}).get("stage_workers") or (1, 1, 1)
+    return dict(zip((pipeline.DECODE, pipeline.UPSCALE, pipeline.ENCODE), workers))
+
+
+class BatchScheduler:
+    # Every stage has its own worker threads and the stages hand jobs on
+    # through small queues, so video N+1 decodes while video N upscales and
+    # video N-1 encodes. The hand-off queues are bounded to keep decoded
+    # frames from piling up on disk when the upscaler is the bottleneck.
+    # Jobs in streaming or segment mode (see job.job_mode) already overlap
+    # their stages inside the job, so they run whole, one after another, on
+    # a thread of their own next to the stage workers.
+
+    def __init__(self, job_queue, limits=None, progress=None, aborted=None):
+        self.job_queue = job_queue
+        self.limits = {pipeline.DECODE: 1, pipeline.UPSCALE: 1, pipeline.ENCODE: 1}
+        self.limits.update(limits or {})
+        self.progress = progress
+        self.aborted = aborted or (lambda: False)
+        self.telemetry = None
+        self._values = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def report(self, idx, stage, value, bytes_written=None):
+        with self._lock:
+            self._values[(idx, stage)] = value
+            if bytes_written is not None:
+                self._sizes[(idx, stage)] = bytes_written
+            total = sum(v for (_, s), v in self._values.items() if s == stage)
+            total_bytes = sum(v for (_, s), v in self._sizes.items() if s == stage)
+        if self.telemetry:
+            self.telemetry(stage, total, total_bytes)
+
+    def total_frames(self, items=None):
+        return sum(media.probe(i["input"]).frame_count for i in items or self.job_queue.pending())
+
+    def run(self, items=None):
+        # Runs the given jobs, or everything pending in the queue.
+        if items is None:
+            items = self.job_queue.pending()
+        if not items:
+            return []
+        # The callback gets the summed numbers over the whole batch; every
+        # job also keeps its own Telemetry for its report file.
+        self.telemetry = telemetry.Telemetry(self.total_frames(items), self.progress)
+        job_teles = {}
+        stage_qs = [
+            queue.Queue(),
+            queue.Queue(maxsize=self.limits[pipeline.UPSCALE]),
+            queue.Queue(maxsize=self.limits[pipeline.ENCODE]),
+        ]
+        staged = []
+        whole = []
+        for idx, item in enumerate(items):
+            if job.job_mode(item["options"]) == "folder":
+                staged.append(idx)
+                stage_qs[pipeline.DECODE].put((idx, item, None))
+            else:
+                whole.append(idx)
+
+        remaining = [len(staged)]
+        remaining_lock = threading.Lock()
+
+        def finish(item, status, error=None):
+            self.job_queue.mark(item, status, error)
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    for stage in (pipeline.UPSCALE, pipeline.ENCODE):
+                        for _ in range(self.limits[stage]):
+                            stage_qs[stage].put(None)
+
+        def run_stage(idx, item, manifest, stage):
+            def forward(s, value, stats):
+                self.report(idx, s, value, stats["bytes"])
+
+            if idx not in job_teles:
+                job_teles[idx] = telemetry.Telemetry(media.probe(item["input"]).frame_count, forward)
+            progress = job_teles[idx]
+
+            if stage == pipeline.DECODE:
+                os.makedirs(item["output_dir"], exist_ok=True)
+                manifest = job.manifest_for(
+                    item["input"], item["output_dir"], item["model"], item["scale"],
+                    item["tta"], item["options"], "folder",
+                )
+                if manifest.data["encoded"] and all(
+                    os.path.exists(i) for i in job.output_fpaths_for(
+                        item["input"], item["output_dir"], item["options"]
+                    )
+                ):
+                    return manifest, True
+                ok = job.decode_stage(
+                    item["input"], item["scale"], item["options"], manifest,
+                    progress, self.aborted,
+                )
+            elif stage == pipeline.UPSCALE:
+                ok = job.upscale_stage(
+                    item["input"], item["model"], item["scale"], item["tta"],
+                    manifest, progress, self.aborted, item["options"],
+                )
+            else:
+                ok = job.encode_stage(
+                    item["input"], item["output_dir"], manifest, progress, self.aborted,
+                    item["options"],
+                )
+                if ok:
+                    manifest.set(encoded=True)
+                    job.print_dedup(manifest)
+                job.write_report(progress, manifest, item["input"], item["output_dir"], ok)
+            return manifest, ok
+
+        def worker(stage):
+            while True:
+                if stage == pipeline.DECODE:
+                    try:
+                        task = stage_qs[stage].get_nowait()
+                    except queue.Empty:
+                        return
+                else:
+                    task = stage_qs[stage].get()
+                    if task is None:
+                        return
+                idx, item, manifest = task
+                if self.aborted():
+                    finish(item, PENDING)
+                    continue
+                try:
+                    manifest, ok = run_stage(idx, item, manifest, stage)
+                except Exception:
+                    finish(item, FAILED, traceback.format_exc())
+                    continue
+                if not ok:
+                    finish(item, PENDING if self.aborted() else FAILED)
+                elif stage == pipeline.ENCODE or manifest.data["encoded"]:
+                    for s in (pipeline.DECODE, pipeline.UPSCALE, pipeline.ENCODE):
+                        self.report(idx, s, manifest.data["decoded"])
+                    finish(item, DONE)
+                else:
+                    stage_qs[stage + 1].put((idx, item, manifest))
+
+        def whole_worker():
+            for idx in whole:
+                self.run_whole(idx, items[idx])
+
+        threads = [
+            threading.Thread(target=worker, args=(stage,), daemon=True)
+            for stage in (pipeline.DECODE, pipeline.UPSCALE, pipeline.ENCODE)
+            for _ in range(self.limits[stage])
+        ] if staged else []
+        if whole:
+            threads.append(threading.Thread(target=whole_worker, daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return items
+
+    def run_whole(self, idx, item):
+        if self.aborted():
+            self.job_queue.mark(item, PENDING)
+            return
+
+        def forward(stage, value, stats):
+            self.report(idx, stage, value, stats["bytes"])
+
+        try:
+            os.makedirs(item["output_dir"], exist_ok=True)
+            ok = job.run_job(
+                item["input"], item["output_dir"], item["model"], item["scale"], item["tta"],
+                item["options"], forward, self.aborted,
+            )
+        except Exception:
+            self.job_queue.mark(item, FAILED, traceback.format_exc())
+            return
+        if ok:
+            self.job_queue.mark(item, DONE)
+        else:
+            self.job_queue.mark(item, PENDING if self.aborted() else FAILED)
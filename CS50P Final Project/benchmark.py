@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+import config
+import job
+import telemetry
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Synthetic clips: name, width, height, seconds at 24 fps.
+CLIPS = [
+    ("240p", 426, 240, 4),
+    ("480p", 854, 480, 4),
+    ("720p", 1280, 720, 2),
+]
+MODES = {
+    "folder": {},
+    "stream": {"stream": True},
+    "segments": {"jobs": 2},
+}
+METRICS = ("wall_seconds", "peak_disk_bytes", "peak_rss_bytes")
+BENCH_DIR = os.path.join(config.CACHE_DIR, "bench")
+# Timings only compare on the same machine, so the baseline sits with the
+# other per-user caches.
+BASELINE_FPATH = os.path.join(BENCH_DIR, "baseline.json")
+STUB_FPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_upscaler.py")
+
+
+def make_clip(name, width, height, seconds, clip_dir=None):
+    clip_dir = clip_dir or os.path.join(BENCH_DIR, "clips")
+    fpath = os.path.join(clip_dir, name + ".mp4")
+    if os.path.exists(fpath):
+        return fpath
+    os.makedirs(clip_dir, exist_ok=True)
+    cmd = [
+        "ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+        "-i", f"testsrc=size={width}x{height}:rate=24:duration={seconds}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", fpath + ".tmp.mp4",
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(fpath + ".tmp.mp4", fpath)
+    return fpath
+
+
+def stub_command():
+    return subprocess.list2cmdline([sys.executable, STUB_FPATH])
+
+
+def max_rss(rusage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    if rusage is None:
+        return None
+    return rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+
+
+def wait(process):
+    if resource is None or not hasattr(os, "wait4"):
+        process.wait()
+        return process.returncode, None
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, rusage
+
+
+def run_case(clip_fpath, mode, scale=2, upscaler=None, backend="ncnn"):
+    # Runs one job in a child process so its peak RSS (and that of the
+    # ffmpeg and upscaler processes it waits for) can be read back, while a
+    # thread here samples the size of its output and scratch folders.
+    work_dir = tempfile.mkdtemp(prefix="ai2x_bench_")
+    try:
+        input_fpath = os.path.join(work_dir, os.path.basename(clip_fpath))
+        shutil.copyfile(clip_fpath, input_fpath)
+        out_dir = os.path.join(work_dir, "out")
+        scratch_dir = os.path.join(work_dir, "scratch")
+        os.makedirs(out_dir)
+        os.makedirs(scratch_dir)
+        options = {"frame_format": "jpg", "scratch": scratch_dir, "backend": backend}
+        options.update(MODES[mode])
+
+        env = dict(os.environ)
+        env["AI2X_UPSCALER"] = upscaler or env.get("AI2X_UPSCALER") or stub_command()
+        env["AI2X_CACHE_DIR"] = os.path.join(work_dir, "cache")
+        case = {"input": input_fpath, "output_dir": out_dir, "scale": scale, "options": options}
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)],
+            env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.DEVNULL,
+        )
+
+        peak = [0]
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(0.05):
+                peak[0] = max(peak[0], telemetry.dir_size(out_dir) + telemetry.dir_size(scratch_dir))
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        returncode, rusage = wait(process)
+        stop.set()
+        sampler.join()
+
+        result = {
+            "clip": os.path.splitext(os.path.basename(clip_fpath))[0],
+            "mode": mode,
+            "backend": backend,
+            "ok": returncode == 0,
+            "wall_seconds": None,
+            "fps": {},
+            "peak_disk_bytes": peak[0],
+            "peak_rss_bytes": max_rss(rusage),
+        }
+        report_fpath = job.report_fpath_for(input_fpath, out_dir)
+        if os.path.exists(report_fpath):
+            with open(report_fpath) as f:
+                report = json.load(f)
+            result["wall_seconds"] = report["wall_seconds"]
+            result["fps"] = {k: v["fps"] for k, v in report["stages"].items()}
+        return result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_child(case):
+    done = job.run_job(
+        case["input"], case["output_dir"], "realesr-animevideov3", str(case["scale"]),
+        False, case["options"],
+    )
+    return 0 if done else 1
+
+
+def compare(results, baseline, threshold):
+    # Returns a line per metric that got worse than the baseline by more
+    # than the threshold (0.25 = 25 % slower or bigger).
+    regressions = []
+    def key(result):
+        return result["clip"], result["mode"], result.get("backend", "ncnn")
+
+    base = {key(i): i for i in baseline}
+    for result in results:
+        if not result["ok"]:
+            regressions.append("{clip}/{mode}: failed".format(**result))
+            continue
+        old = base.get(key(result))
+        if old is None:
+            continue
+        for metric in METRICS:
+            if not old.get(metric) or result.get(metric) is None:
+                continue
+            ratio = result[metric] / old[metric]
+            if ratio > 1 + threshold:
+                regressions.append("{}/{}: {} {} -> {} ({:+.0%})".format(
+                    result["clip"], result["mode"], metric, old[metric], result[metric], ratio - 1
+                ))
+    return regressions
+
+
+def load_baseline(fpath):
+    try:
+        with open(fpath) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def save_results(fpath, results):
+    os.makedirs(os.path.dirname(fpath) or ".", exist_ok=True)
+    tmp_fpath = fpath + ".tmp"
+    with open(tmp_fpath, "w") as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_fpath, fpath)
+
+
+def print_result(result):
+    fps = " ".join("{}={:.1f}".format(k, v) for k, v in result["fps"].items())
+    print("{:<6} {:<9} {:>8} s  disk {:>7.1f} MB  rss {:>7} MB  {}".format(
+        result["clip"],
+        result["mode"],
+        result["wall_seconds"] if result["ok"] else "FAILED",
+        result["peak_disk_bytes"] / 2 ** 20,
+        round(result["peak_rss_bytes"] / 2 ** 20, 1) if result["peak_rss_bytes"] else "-",
+        fps,
+    ))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the upscale pipeline on synthetic clips with a stand-in upscaler"
+    )
+    parser.add_argument("--clips", nargs="+", default=[i[0] for i in CLIPS],
+                        choices=[i[0] for i in CLIPS])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--scale", type=int, default=2, choices=[2, 3, 4])
+    parser.add_argument("--upscaler", help="upscaler command, default: stub_upscaler.py")
+    parser.add_argument("--backend", default="ncnn", choices=["ncnn", "lanczos"])
+    parser.add_argument("--baseline", default=BASELINE_FPATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown or growth against the baseline")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--case"]:
+        return run_child(json.loads(argv[1]))
+    args = parse_args(argv)
+    clips = {name: (w, h, s) for name, w, h, s in CLIPS}
+    results = []
+    for name in args.clips:
+        clip_fpath = make_clip(name, *clips[name])
+        for mode in args.modes:
+            result = run_case(clip_fpath, mode, args.scale, args.upscaler, args.backend)
+            print_result(result)
+            results.append(result)
+    if args.output:
+        save_results(args.output, results)
+    if args.save_baseline:
+        save_results(args.baseline, results)
+        return 0
+    regressions = compare(results, load_baseline(args.baseline), args.threshold)
+    for line in regressions:
+        print("REGRESSION " + line)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
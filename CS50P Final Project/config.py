@@ -0,0 +1,12 @@
+import os
+
+
+# Per-user caches (probe results, tuned settings, ...) live here so they
+# survive between runs and are shared by the GUI and the command line.
+CACHE_DIR = os.environ.get(
+    "AI2X_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".ai2x")
+)
+
+# Command line of the upscaler, when it isn't realesrgan-ncnn-vulkan in the
+# working folder.
+UPSCALER = os.environ.get("AI2X_UPSCALER")
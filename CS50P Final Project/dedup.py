@@ -0,0 +1,106 @@
+import hashlib
+import io
+import os
+import shutil
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Hamming distance on the 256 bit dHash. Anything above a few bits starts
+# to merge small motion such as mouth flaps, so the default only accepts
+# frames whose hashes are equal.
+DEFAULT_THRESHOLD = 0
+
+
+def exact_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def dhash(image, size=16):
+    small = image.convert("L").resize((size + 1, size))
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class Deduper:
+    # Held frames are consecutive, so every frame is only compared with the
+    # last unique one. That also stops a slow pan from drifting through a
+    # chain of "almost equal" frames.
+
+    def __init__(self, threshold=None):
+        if threshold is not None and Image is None:
+            raise RuntimeError("Perceptual dedup needs Pillow, see requirements.txt")
+        self.threshold = threshold
+        self.last = None
+        self.total = 0
+        self.unique = 0
+
+    def is_duplicate(self, data, image=None):
+        self.total += 1
+        digest = exact_hash(data)
+        phash = None
+        if self.threshold is not None:
+            if image is None:
+                image = Image.open(io.BytesIO(data))
+            phash = dhash(image)
+        if self.last is not None:
+            last_digest, last_phash = self.last
+            if digest == last_digest:
+                return True
+            if phash is not None and hamming(phash, last_phash) <= self.threshold:
+                return True
+        self.last = (digest, phash)
+        self.unique += 1
+        return False
+
+    def report(self):
+        return merge_reports([{"frames": self.total, "unique": self.unique}])
+
+
+def merge_reports(reports):
+    total = sum(i["frames"] for i in reports)
+    unique = sum(i["unique"] for i in reports)
+    return {
+        "frames": total,
+        "unique": unique,
+        "ratio": round(total / unique, 3) if unique else 1.0,
+    }
+
+
+def dedup_frames(pic_dir, fnames, deduper):
+    # Returns {duplicate frame: unique frame it repeats}.
+    frame_map = {}
+    source = None
+    for fname in fnames:
+        with open(os.path.join(pic_dir, fname), "rb") as f:
+            data = f.read()
+        if deduper.is_duplicate(data):
+            frame_map[fname] = source
+        else:
+            source = fname
+    return frame_map
+
+
+def rebuild_frames(scaled_pics_dir, frame_map, ext="jpg"):
+    for dup, source in frame_map.items():
+        dst = os.path.join(scaled_pics_dir, os.path.splitext(dup)[0] + "." + ext)
+        if os.path.exists(dst):
+            continue
+        src = os.path.join(scaled_pics_dir, os.path.splitext(source)[0] + "." + ext)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
@@ -0,0 +1,178 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import config
+import media
+import pipeline
+
+
+ENCODING_FPATH = os.path.join(config.CACHE_DIR, "encoding.json")
+# "default" is what pics_to_video always did: libx264 with its defaults.
+# "mezzanine" is intra-only 4:2:2 H.264, which cuts anywhere and keeps the
+# .mp4 output that ProRes or DNxHR would need a .mov for.
+PROFILES = {
+    "default": {"codec": "libx264", "preset": "medium", "crf": 23},
+    "fast": {"codec": "libx264", "preset": "veryfast", "crf": 20},
+    "quality": {"codec": "libx264", "preset": "slow", "crf": 16},
+    "animation": {"codec": "libx264", "preset": "slow", "crf": 18, "tune": "animation"},
+    "hevc": {"codec": "libx265", "preset": "medium", "crf": 20},
+    "mezzanine": {
+        "codec": "libx264", "preset": "veryfast", "crf": 10, "gop": 1, "pix_fmt": "yuv422p",
+    },
+}
+# Fastest first; the calibration stops at the first preset that is too slow.
+PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower")
+REALTIME_FACTOR = 0.5
+SAMPLE_FRAMES = 48
+_cache_lock = threading.Lock()
+
+
+def encoder_args(profile):
+    args = ["-c:v", profile["codec"], "-preset", profile["preset"], "-crf", str(profile["crf"])]
+    if profile.get("tune"):
+        args += ["-tune", profile["tune"]]
+    if profile.get("gop"):
+        args += ["-g", str(profile["gop"])]
+    if profile.get("threads"):
+        args += ["-threads", str(profile["threads"])]
+    if profile["codec"] == "libx265":
+        # Lets QuickTime and Safari play the file.
+        args += ["-tag:v", "hvc1"]
+    return args + ["-pix_fmt", profile.get("pix_fmt", "yuv420p")]
+
+
+def parse_rendition(value):
+    # "720p" or "720p:fast"; the profile defaults to "default".
+    height, _, name = value.partition(":")
+    height = int(height.lower().rstrip("p"))
+    if height <= 0 or height % 2:
+        raise ValueError(f"Rendition height has to be even: {value}")
+    name = name or "default"
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encoder profile in rendition {value}")
+    return {"name": f"{height}p", "height": height, "profile": dict(PROFILES[name])}
+
+
+def renditions(options):
+    return [parse_rendition(i) for i in options.get("renditions") or ()]
+
+
+def rendition_outputs(renditions):
+    # (name, height, encoder args) for pipeline.output_args.
+    return [(i["name"], i["height"], encoder_args(i["profile"])) for i in renditions]
+
+
+def encoders():
+    output = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-encoders"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+    ).stdout
+    return {line.split()[1] for line in output.splitlines() if len(line.split()) > 1}
+
+
+def cache_key(profile, width, height, target):
+    fields = [profile.get(i) for i in ("codec", "crf", "tune", "gop", "threads", "pix_fmt")]
+    return "|".join(
+        [platform.node(), f"{width}x{height}", str(target)] + [str(i) for i in fields]
+    )
+
+
+def load_cache():
+    try:
+        with open(ENCODING_FPATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(ENCODING_FPATH), exist_ok=True)
+    tmp_fpath = "{}.{}.tmp".format(ENCODING_FPATH, os.getpid())
+    with open(tmp_fpath, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_fpath, ENCODING_FPATH)
+
+
+def sample_frames(input_fpath, scale, sample_dir, fmt="jpg", count=SAMPLE_FRAMES):
+    # Frames from the middle of the video, blown up to the output size and
+    # stored like the real scaled frames, so the encoder reads the same
+    # kind of input it gets in pics_to_video.
+    info = media.probe(input_fpath)
+    cmd = [
+        "ffmpeg", "-v", "error", "-y", "-ss", f"{info.duration / 2:.3f}", "-i", input_fpath,
+        "-frames:v", str(count), "-vf", f"scale=iw*{scale}:ih*{scale}:flags=bicubic",
+        *pipeline.FRAME_FORMATS[fmt], "-vsync", "0",
+        os.path.join(sample_dir, "frame%08d." + fmt),
+    ]
+    subprocess.run(cmd, check=True)
+    return pipeline.list_frames(sample_dir)
+
+
+def measure(sample_dir, fps, profile, fmt="jpg"):
+    fnames = pipeline.list_frames(sample_dir)
+    cmd = [
+        "ffmpeg", "-v", "error", "-y", "-f", "image2", "-framerate", fps,
+        "-i", os.path.join(sample_dir, "frame%08d." + fmt),
+        *encoder_args(profile), "-f", "null", "-",
+    ]
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    return len(fnames) / (time.perf_counter() - started)
+
+
+def calibrate(input_fpath, scale, profile, target=REALTIME_FACTOR, aborted=None):
+    # Picks the slowest (best compressing) preset that still encodes at
+    # target times the video's own frame rate.
+    info = media.probe(input_fpath)
+    sample_dir = tempfile.mkdtemp(prefix="ai2x_encode_")
+    measurements = []
+    best = PRESETS[0]
+    try:
+        sample_frames(input_fpath, scale, sample_dir)
+        for preset in PRESETS:
+            if aborted and aborted():
+                break
+            fps = measure(sample_dir, info.fps_str, dict(profile, preset=preset))
+            factor = fps / float(info.fps)
+            measurements.append({"preset": preset, "fps": round(fps, 2), "realtime_factor": round(factor, 3)})
+            if factor < target:
+                break
+            best = preset
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
+    return {"preset": best, "measurements": measurements}
+
+
+def resolve(input_fpath, scale, options, aborted=None):
+    # Turns the profile/preset/crf/encode_threads options into a profile.
+    # preset "auto" runs the calibration once per output size and machine.
+    profile = dict(PROFILES[options.get("profile") or "default"])
+    for name, key in (("crf", "crf"), ("encode_threads", "threads")):
+        if options.get(name) is not None:
+            profile[key] = options[name]
+    if profile["codec"] not in encoders():
+        raise RuntimeError("ffmpeg has no {} encoder".format(profile["codec"]))
+    preset = options.get("preset")
+    if preset != "auto":
+        profile["preset"] = preset or profile["preset"]
+        return profile
+    info = media.probe(input_fpath)
+    target = options.get("realtime_factor") or REALTIME_FACTOR
+    key = cache_key(profile, info.width * int(scale), info.height * int(scale), target)
+    with _cache_lock:
+        cached = load_cache().get(key)
+    if cached is None:
+        cached = calibrate(input_fpath, int(scale), profile, target, aborted)
+        if not (aborted and aborted()):
+            with _cache_lock:
+                cache = load_cache()
+                cache[key] = cached
+                save_cache(cache)
+    profile["preset"] = cached["preset"]
+    return profile
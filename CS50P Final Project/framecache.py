@@ -0,0 +1,158 @@
+import hashlib
+import os
+import shutil
+import threading
+
+import config
+import pipeline
+
+
+FRAMES_DIR = os.path.join(config.CACHE_DIR, "frames")
+DEFAULT_MAX_GB = 20
+
+
+def namespace(backend, model, scale, tta):
+    # Everything besides the frame itself that decides the upscaled result.
+    # realesrgan is identified by its command line, like in tuning.py.
+    parts = [backend.name, str(model), str(scale), str(bool(tta))]
+    if backend.name.startswith("ncnn"):
+        parts.append(" ".join(pipeline.upscaler_cmd()))
+    return "|".join(parts)
+
+
+class FrameCache:
+    # Upscaled frames shared by all jobs, stored by the hash of the decoded
+    # frame plus the namespace, so a re-delivered cut only upscales the
+    # shots that changed. Entries are plain files; a hit touches the file,
+    # and trim() removes the least recently used ones above max_bytes.
+
+    def __init__(self, namespace, max_bytes, root=FRAMES_DIR):
+        self.namespace = namespace.encode()
+        self.max_bytes = max_bytes
+        self.root = root
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def key(self, data):
+        return hashlib.blake2b(self.namespace + b"\0" + data, digest_size=20).hexdigest()
+
+    def path(self, key, ext):
+        return os.path.join(self.root, key[:2], key + "." + ext)
+
+    def get(self, key, ext):
+        # Path of the cached frame, or None.
+        fpath = self.path(key, ext)
+        try:
+            os.utime(fpath)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return fpath
+
+    def read(self, key, ext):
+        fpath = self.get(key, ext)
+        if fpath is None:
+            return None
+        try:
+            with open(fpath, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put_file(self, key, src, ext):
+        # Copied, not linked: the scaled frame is rewritten in place when a
+        # job is resumed or its duplicates are filled in, and a linked cache
+        # entry would change with it.
+        fpath = self.path(key, ext)
+        if os.path.exists(fpath):
+            return
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        tmp_fpath = "{}.{}.{}.tmp".format(fpath, os.getpid(), threading.get_ident())
+        shutil.copyfile(src, tmp_fpath)
+        os.replace(tmp_fpath, fpath)
+        with self.lock:
+            self.stored += 1
+
+    def put_bytes(self, key, data, ext):
+        fpath = self.path(key, ext)
+        if os.path.exists(fpath):
+            return
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        tmp_fpath = "{}.{}.{}.tmp".format(fpath, os.getpid(), threading.get_ident())
+        with open(tmp_fpath, "wb") as f:
+            f.write(data)
+        os.replace(tmp_fpath, fpath)
+        with self.lock:
+            self.stored += 1
+
+    def trim(self):
+        # Other jobs may be trimming at the same time, so files that are
+        # already gone are fine.
+        entries = []
+        total = 0
+        for sub in os.scandir(self.root) if os.path.isdir(self.root) else ():
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, fpath in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(fpath)
+                self.evicted += 1
+            except OSError:
+                pass
+            total -= size
+        return total
+
+    def report(self):
+        return {
+            "hits": self.hits, "misses": self.misses,
+            "stored": self.stored, "evicted": self.evicted,
+        }
+
+
+def lookup_frames(cache, pic_dir, fnames, scaled_pics_dir, ext):
+    # Copies the cached frames into the scaled folder and returns
+    # ({frame: key} for the ones still to upscale, [cached frames]).
+    missing = {}
+    cached = []
+    for fname in fnames:
+        with open(os.path.join(pic_dir, fname), "rb") as f:
+            key = cache.key(f.read())
+        fpath = cache.get(key, ext)
+        if fpath is None:
+            missing[fname] = key
+            continue
+        dst = os.path.join(scaled_pics_dir, os.path.splitext(fname)[0] + "." + ext)
+        try:
+            shutil.copyfile(fpath, dst + ".tmp")
+        except OSError:
+            # Evicted by another job since get(); upscale it after all.
+            missing[fname] = key
+            continue
+        os.replace(dst + ".tmp", dst)
+        cached.append(fname)
+    return missing, cached
+
+
+def merge_reports(reports):
+    reports = [i for i in reports if i]
+    if not reports:
+        return None
+    return {name: sum(i[name] for i in reports) for name in reports[0]}
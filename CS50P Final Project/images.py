@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import time
+
+import backends
+import pipeline
+import telemetry
+import tuning
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# What realesrgan-ncnn-vulkan can read. JPEGs come out as JPEG, everything
+# else as PNG, like the scaled frames of a video.
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+REPORT_NAME = "images.report.json"
+
+
+def output_ext(fname):
+    return "jpg" if fname.lower().endswith((".jpg", ".jpeg")) else "png"
+
+
+def collect_images(paths, output_dir):
+    # [(source, output)]. A single folder is mirrored into output_dir, and
+    # with several inputs every folder gets a subfolder named after it.
+    images = []
+    skip_dir = os.path.abspath(output_dir)
+    for path in paths:
+        path = os.path.normpath(path)
+        if os.path.isdir(path):
+            dst_root = output_dir
+            if len(paths) > 1:
+                dst_root = os.path.join(output_dir, os.path.basename(path))
+            for root, dirs, files in os.walk(path):
+                # An output folder inside the input isn't read back in.
+                dirs[:] = sorted(
+                    i for i in dirs if os.path.abspath(os.path.join(root, i)) != skip_dir
+                )
+                rel = os.path.relpath(root, path)
+                for fname in sorted(files):
+                    if not fname.lower().endswith(IMAGE_EXTS):
+                        continue
+                    dst = os.path.join(
+                        dst_root, rel, os.path.splitext(fname)[0] + "." + output_ext(fname)
+                    )
+                    images.append((os.path.join(root, fname), os.path.normpath(dst)))
+        elif os.path.isfile(path) and path.lower().endswith(IMAGE_EXTS):
+            fname = os.path.basename(path)
+            dst = os.path.join(output_dir, os.path.splitext(fname)[0] + "." + output_ext(fname))
+            images.append((path, dst))
+    return images
+
+
+def is_current(src, dst):
+    try:
+        return os.path.getmtime(dst) >= os.path.getmtime(src)
+    except OSError:
+        return False
+
+
+def pixels(fpath):
+    if Image is None:
+        return 0
+    try:
+        with Image.open(fpath) as image:
+            return image.width * image.height
+    except OSError:
+        return 0
+
+
+def stage_images(images, stage_dir):
+    # The upscaler works on one flat folder, so the images are linked in
+    # under frame numbers; returns {frame name without extension: output}.
+    os.makedirs(stage_dir)
+    targets = {}
+    for idx, (src, dst) in enumerate(images, 1):
+        name = f"frame{idx:08d}"
+        staged = os.path.join(stage_dir, name + os.path.splitext(src)[1].lower())
+        try:
+            os.link(src, staged)
+        except OSError:
+            shutil.copyfile(src, staged)
+        targets[name] = dst
+    return targets
+
+
+def upscale_images(
+    paths, output_dir, model, scale, tta, options=None, progress=None, aborted=None
+):
+    # Images are grouped by output format, and each group is upscaled by one
+    # realesrgan run (or one per shard), so the model loads once per group
+    # rather than once per image. progress(stage, images, stats) reports
+    # the upscale stage like telemetry.Telemetry does for videos.
+    options = options or {}
+    aborted = aborted or (lambda: False)
+    images = collect_images(paths, output_dir)
+    pending = [(src, dst) for src, dst in images if not is_current(src, dst)]
+    tele = telemetry.Telemetry(len(pending), progress)
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.monotonic()
+
+    groups = {}
+    for src, dst in pending:
+        groups.setdefault(output_ext(dst), []).append((src, dst))
+    done = []
+    written = [0]
+    for ext, group in sorted(groups.items()):
+        if aborted():
+            break
+        work_dir = tempfile.mkdtemp(prefix="ai2x_images_", dir=output_dir)
+        try:
+            stage_dir = os.path.join(work_dir, "frames")
+            targets = stage_images(group, stage_dir)
+            tuned = tuning.resolve(None, model, scale, tta, options, stage_dir, aborted)
+            backend = backends.make_backend(options, tuning.upscaler_args(tuned))
+            scaled_dir = os.path.join(stage_dir, "scaled")
+            offset, offset_bytes = len(done), written[0]
+
+            def on_done(fname):
+                name = os.path.splitext(fname)[0]
+                dst = targets[name]
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.replace(os.path.join(scaled_dir, name + "." + ext), dst)
+                done.append(dst)
+
+            def on_progress(stage, count, bytes_written=None):
+                if bytes_written is not None:
+                    written[0] = offset_bytes + bytes_written
+                tele(stage, offset + count, written[0])
+
+            pipeline.upscale(
+                stage_dir, model, scale, tta, on_progress, aborted, (), on_done, ext,
+                backend, tuned["shards"],
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    seconds = time.monotonic() - started
+    megapixels = sum(pixels(i) for i in done) / 1e6
+    throughput = {
+        "images": len(images),
+        "upscaled": len(done),
+        "skipped": len(images) - len(pending),
+        "failed": len(pending) - len(done),
+        "seconds": round(seconds, 3),
+        "images_per_second": round(len(done) / seconds, 3) if seconds > 0 else 0.0,
+        "output_megapixels_per_second": round(megapixels / seconds, 3) if seconds > 0 else 0.0,
+    }
+    tele.write_report(os.path.join(output_dir, REPORT_NAME), **throughput)
+    return throughput
@@ -0,0 +1,323 @@
+import os
+import shutil
+import sys
+
+import backends
+import dedup
+import encoding
+import framecache
+import letterbox
+import media
+import pipeline
+import segments
+import staging
+import telemetry
+import tuning
+from manifest import JobManifest, frame_number
+
+
+# Options that change the frames on disk; a manifest written with other
+# values for these can't be resumed.
+KEY_OPTIONS = (
+    "jobs", "dedup", "dedup_threshold", "frame_format", "scratch", "backend", "crop",
+    "route_threshold",
+)
+
+
+def job_mode(options):
+    # Progressive output needs the encoder running while frames arrive,
+    # which only the streaming pipeline does.
+    if options.get("progressive"):
+        return "stream"
+    if options.get("jobs", 1) > 1:
+        return "segments"
+    return "stream" if options.get("stream", False) else "folder"
+
+
+def manifest_for(input_fpath, output_dir, model, scale, tta, options, mode=None):
+    key = {"mode": mode or job_mode(options)}
+    key.update({i: options.get(i) for i in KEY_OPTIONS})
+    return JobManifest.for_job(input_fpath, output_dir, model, scale, tta, key)
+
+
+def output_fpath_for(input_fpath, output_dir):
+    fname = os.path.basename(input_fpath).split(".")[0]
+    return os.path.join(output_dir, fname + ".mp4")
+
+
+def output_fpaths_for(input_fpath, output_dir, options):
+    output_fpath = output_fpath_for(input_fpath, output_dir)
+    return [output_fpath] + [
+        pipeline.rendition_fpath(output_fpath, i["name"]) for i in encoding.renditions(options)
+    ]
+
+
+def make_deduper(options):
+    if not options.get("dedup", False):
+        return None
+    return dedup.Deduper(options.get("dedup_threshold"))
+
+
+def make_frame_cache(options, backend, model, scale, tta):
+    # frame_cache is the size cap in GB; nothing is cached without it.
+    if not options.get("frame_cache"):
+        return None
+    return framecache.FrameCache(
+        framecache.namespace(backend, model, scale, tta),
+        int(options["frame_cache"] * 1024 ** 3),
+    )
+
+
+def print_dedup(manifest):
+    if manifest.data.get("dedup"):
+        # stderr, so the JSON progress of the command line stays parseable.
+        print("Dedup: {frames} frames, {unique} unique, ratio {ratio}".format(
+            **manifest.data["dedup"]
+        ), file=sys.stderr)
+
+
+def print_routing(manifest):
+    routing = manifest.data.get("routing")
+    if routing:
+        frames = sum(v for k, v in routing.items() if k not in ("threshold", "ratio"))
+        print("Routing: {} of {} frames to lanczos, ratio {}".format(
+            routing["lanczos"], frames, routing["ratio"],
+        ), file=sys.stderr)
+
+
+def report_fpath_for(input_fpath, output_dir):
+    fname = os.path.basename(input_fpath).split(".")[0]
+    return os.path.join(output_dir, fname + ".report.json")
+
+
+def write_report(tele, manifest, input_fpath, output_dir, done):
+    return tele.write_report(
+        report_fpath_for(input_fpath, output_dir),
+        input=os.path.abspath(input_fpath),
+        ok=done,
+        key=manifest.key,
+        staging=manifest.data.get("staging"),
+        crop=manifest.data.get("crop"),
+        tuning=manifest.data.get("tuning"),
+        encoding=manifest.data.get("encoding"),
+        renditions=manifest.data.get("renditions"),
+        dedup=manifest.data.get("dedup"),
+        frame_cache=manifest.data.get("frame_cache"),
+        routing=manifest.data.get("routing"),
+    )
+
+
+def run_job(input_fpath, output_dir, model, scale, tta, options=None, progress=None, aborted=None):
+    # progress(stage, frames, stats) gets the per-stage numbers from
+    # telemetry.Telemetry; the same numbers end up in <name>.report.json.
+    options = options or {}
+    aborted = aborted or (lambda: False)
+    mode = job_mode(options)
+    manifest = manifest_for(input_fpath, output_dir, model, scale, tta, options, mode)
+    if manifest.data["encoded"] and all(
+        os.path.exists(i) for i in output_fpaths_for(input_fpath, output_dir, options)
+    ):
+        return True
+    tele = telemetry.Telemetry(media.probe(input_fpath).frame_count, progress)
+    progress = tele
+
+    if mode == "segments":
+        done = segments.parallel_upscale(
+            input_fpath, output_dir, model, scale, tta, options, progress, aborted, manifest
+        )
+    elif mode == "stream":
+        deduper = make_deduper(options)
+        scratch = options.get("scratch")
+        if scratch == "auto":
+            scratch = staging.scratch_candidates()[0]
+        # Every batch is a separate realesrgan run, so only -j and -t apply.
+        tuned = tuning.resolve(input_fpath, model, scale, tta, options, aborted=aborted)
+        profile = encoding.resolve(input_fpath, scale, options, aborted)
+        crop = letterbox.resolve(input_fpath, options)
+        renditions = encoding.renditions(options)
+        manifest.set(tuning=tuned, encoding=profile, crop=crop, renditions=renditions)
+        backend = backends.make_backend(options, tuning.upscaler_args(tuned))
+        frame_cache = make_frame_cache(options, backend, model, scale, tta)
+        done = pipeline.stream_video(
+            input_fpath, output_dir, model, scale, tta, progress, aborted,
+            batch_size=options.get("batch_size"),
+            deduper=deduper, scratch_dir=scratch, backend=backend,
+            encoder_args=encoding.encoder_args(profile), crop=crop, frame_cache=frame_cache,
+            renditions=encoding.rendition_outputs(renditions),
+            progressive=options.get("progressive"),
+        )
+        if deduper:
+            manifest.set(dedup=deduper.report())
+        if frame_cache:
+            frame_cache.trim()
+            manifest.set(frame_cache=frame_cache.report())
+        if isinstance(backend, backends.RoutedBackend):
+            manifest.set(routing=backend.report())
+    else:
+        done = run_folder(
+            input_fpath, output_dir, model, scale, tta, options, manifest, progress, aborted
+        )
+    if done:
+        manifest.set(encoded=True)
+        print_dedup(manifest)
+        print_routing(manifest)
+    write_report(tele, manifest, input_fpath, output_dir, done)
+    return done
+
+
+def staged(input_fpath, manifest):
+    choice = manifest.data.get("staging") or {}
+    fmt = choice.get("format") or "jpg"
+    pic_dir = choice.get("pic_dir") or pipeline.pic_dir_for(input_fpath, choice.get("scratch"))
+    return pic_dir, fmt
+
+
+def decode_stage(input_fpath, scale, options, manifest, progress=None, aborted=None):
+    aborted = aborted or (lambda: False)
+    pic_dir, fmt = staged(input_fpath, manifest)
+    if not (manifest.data["decoded"] and os.path.isdir(pic_dir)):
+        if os.path.isdir(pic_dir):
+            shutil.rmtree(pic_dir)
+        manifest.reset()
+        choice = staging.resolve(input_fpath, scale, options)
+        crop = letterbox.resolve(input_fpath, options)
+        manifest.set(
+            staging={
+                "scratch": choice["scratch"], "format": choice["format"],
+                "pic_dir": pipeline.pic_dir_for(input_fpath, choice["scratch"]),
+            },
+            crop=crop,
+        )
+        pic_dir, fmt = staged(input_fpath, manifest)
+        decoded = pipeline.video_to_pics(
+            input_fpath, progress, aborted, fmt, choice["scratch"],
+            letterbox.crop_filter(crop) if crop else None,
+        )
+        if aborted():
+            return False
+        if not decoded:
+            # A partial folder must not be checkpointed as the whole video.
+            raise RuntimeError("ffmpeg could not decode {}".format(input_fpath))
+        manifest.set(decoded=len(pipeline.list_frames(pic_dir)))
+    elif progress:
+        progress(pipeline.DECODE, manifest.data["decoded"])
+
+    # Held frames are left out of the upscale and filled back in from the
+    # frame map before encoding.
+    deduper = make_deduper(options)
+    if deduper and manifest.data.get("duplicates") is None:
+        frame_map = dedup.dedup_frames(pic_dir, pipeline.list_frames(pic_dir), deduper)
+        manifest.set(duplicates=frame_map, dedup=deduper.report())
+    return True
+
+
+def upscale_stage(
+    input_fpath, model, scale, tta, manifest, progress=None, aborted=None, options=None
+):
+    aborted = aborted or (lambda: False)
+    options = options or {}
+    pic_dir, fmt = staged(input_fpath, manifest)
+    frame_map = manifest.data.get("duplicates") or {}
+    scaled_pics_dir = os.path.join(pic_dir, "scaled")
+    finished = set()
+    if os.path.isdir(scaled_pics_dir):
+        finished = {frame_number(i) for i in os.listdir(scaled_pics_dir)}
+    skip = {
+        i for i in pipeline.list_frames(pic_dir)
+        if frame_number(i) in manifest.upscaled and frame_number(i) in finished
+    }
+    skip.update(frame_map)
+    if len(skip) < manifest.data["decoded"]:
+        tuned = options.get("tuned") or tuning.resolve(
+            input_fpath, model, scale, tta, options, pic_dir, aborted
+        )
+        manifest.set(tuning=tuned)
+        backend = backends.make_backend(options, tuning.upscaler_args(tuned))
+        frame_cache = make_frame_cache(options, backend, model, scale, tta)
+        ext = pipeline.scaled_ext(fmt)
+        missing = {}
+        if frame_cache:
+            # Frames seen in an earlier job come from the cache; the others
+            # go into it as soon as they are upscaled.
+            os.makedirs(scaled_pics_dir, exist_ok=True)
+            missing, cached = framecache.lookup_frames(
+                frame_cache, pic_dir,
+                [i for i in pipeline.list_frames(pic_dir) if i not in skip],
+                scaled_pics_dir, ext,
+            )
+            for fname in cached:
+                manifest.add_upscaled(fname)
+            skip.update(cached)
+
+        def on_done(fname):
+            manifest.add_upscaled(fname)
+            if fname in missing:
+                frame_cache.put_file(
+                    missing[fname],
+                    os.path.join(scaled_pics_dir, os.path.splitext(fname)[0] + "." + ext),
+                    ext,
+                )
+
+        if len(skip) < manifest.data["decoded"]:
+            pipeline.upscale(
+                pic_dir, model, scale, tta, progress, aborted, skip, on_done, fmt,
+                backend, tuned["shards"],
+            )
+        elif progress:
+            progress(pipeline.UPSCALE, manifest.data["decoded"])
+        if frame_cache:
+            frame_cache.trim()
+            manifest.set(frame_cache=frame_cache.report())
+        if isinstance(backend, backends.RoutedBackend):
+            # A resumed job only counts the frames of this run.
+            manifest.set(routing=backend.report())
+        manifest.save()
+        if aborted():
+            return False
+        if len(manifest.upscaled) + len(frame_map) < manifest.data["decoded"]:
+            raise RuntimeError("realesrgan-ncnn-vulkan did not upscale every frame")
+    elif progress:
+        progress(pipeline.UPSCALE, manifest.data["decoded"])
+    return True
+
+
+def encode_stage(input_fpath, output_dir, manifest, progress=None, aborted=None, options=None):
+    options = options or {}
+    pic_dir, fmt = staged(input_fpath, manifest)
+    profile = options.get("encoding") or encoding.resolve(
+        input_fpath, manifest.key["scale"], options, aborted
+    )
+    renditions = encoding.renditions(options)
+    manifest.set(encoding=profile, renditions=renditions)
+    scaled_pics_dir = os.path.join(pic_dir, "scaled")
+    dedup.rebuild_frames(
+        scaled_pics_dir, manifest.data.get("duplicates") or {}, pipeline.scaled_ext(fmt)
+    )
+    crop = manifest.data.get("crop")
+    done = pipeline.pics_to_video(
+        scaled_pics_dir, input_fpath, output_dir, progress, aborted, fmt,
+        encoding.encoder_args(profile),
+        letterbox.pad_filter(crop, manifest.key["scale"]) if crop else None,
+        encoding.rendition_outputs(renditions),
+    )
+    if done:
+        shutil.rmtree(pic_dir)
+    return done
+
+
+def run_folder(
+    input_fpath,
+    output_dir,
+    model,
+    scale,
+    tta,
+    options,
+    manifest,
+    progress=None,
+    aborted=None,
+):
+    return (
+        decode_stage(input_fpath, scale, options, manifest, progress, aborted)
+        and upscale_stage(input_fpath, model, scale, tta, manifest, progress, aborted, options)
+        and encode_stage(input_fpath, output_dir, manifest, progress, aborted, options)
+    )
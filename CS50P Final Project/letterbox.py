@@ -0,0 +1,106 @@
+import re
+import subprocess
+
+import media
+
+
+# Bars have to take at least this share of the width or height before
+# cropping is worth a different frame size.
+MIN_BAR = 0.02
+# Fewer keyframes than this and every n-th frame is checked instead.
+MIN_SAMPLES = 8
+SAMPLES = 64
+LIMIT = 24
+
+
+def parse_crops(output):
+    # cropdetect logs "... t:12.5 ... crop=w:h:x:y" per frame; black frames
+    # come out with a negative size and carry no information.
+    crops = []
+    for line in output.splitlines():
+        match = re.search(r"t:\s*([\d.]+).*crop=(-?\d+):(-?\d+):(\d+):(\d+)", line)
+        if not match:
+            continue
+        t = float(match.group(1))
+        w, h, x, y = (int(i) for i in match.groups()[1:])
+        if w > 0 and h > 0:
+            crops.append((t, {"w": w, "h": h, "x": x, "y": y}))
+    return crops
+
+
+def run_cropdetect(input_fpath, keyframes=True, step=1):
+    cmd = ["ffmpeg", "-hide_banner"]
+    vfilter = f"cropdetect=limit={LIMIT}:round=2:reset=1"
+    if keyframes:
+        cmd += ["-skip_frame", "nokey"]
+    else:
+        vfilter = f"select='not(mod(n\\,{step}))'," + vfilter
+    cmd += ["-i", input_fpath, "-map", "0:v:0", "-vf", vfilter, "-an", "-f", "null", "-"]
+    output = subprocess.run(
+        cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+    ).stderr
+    return parse_crops(output)
+
+
+def scenes(crops):
+    # Runs of samples with the same rectangle; keyframes mostly sit on cuts,
+    # so these line up with the scenes.
+    result = []
+    for t, crop in crops:
+        if not result or result[-1]["crop"] != crop:
+            result.append({"start": round(t, 3), "crop": crop})
+    return result
+
+
+def detect(input_fpath):
+    # One rectangle for the whole video, the union of the active picture in
+    # every scene, so no scene loses picture. None when there are no bars.
+    info = media.probe(input_fpath)
+    crops = run_cropdetect(input_fpath)
+    if len(crops) < MIN_SAMPLES:
+        crops = run_cropdetect(input_fpath, False, max(info.frame_count // SAMPLES, 1))
+    if not crops:
+        return None
+    x1 = min(c["x"] for _, c in crops)
+    y1 = min(c["y"] for _, c in crops)
+    x2 = max(c["x"] + c["w"] for _, c in crops)
+    y2 = max(c["y"] + c["h"] for _, c in crops)
+    x2, y2 = min(x2, info.width), min(y2, info.height)
+    w, h = (x2 - x1) // 2 * 2, (y2 - y1) // 2 * 2
+    if w >= info.width * (1 - MIN_BAR) and h >= info.height * (1 - MIN_BAR):
+        return None
+    return {
+        "w": w, "h": h, "x": x1, "y": y1,
+        "width": info.width, "height": info.height,
+        "scenes": scenes(crops),
+    }
+
+
+def parse_crop(value, info):
+    w, h, x, y = (int(i) for i in value.split(":"))
+    return {"w": w, "h": h, "x": x, "y": y, "width": info.width, "height": info.height}
+
+
+def resolve(input_fpath, options):
+    # The crop option is "auto", "w:h:x:y" or empty; segments get the
+    # rectangle already detected on the whole video.
+    value = options.get("crop")
+    if not value:
+        return None
+    if isinstance(value, dict):
+        return value
+    if value == "auto":
+        return detect(input_fpath)
+    return parse_crop(value, media.probe(input_fpath))
+
+
+def crop_filter(crop):
+    return "crop={w}:{h}:{x}:{y}".format(**crop)
+
+
+def pad_filter(crop, scale):
+    # Puts the upscaled picture back into a frame of the original shape.
+    s = int(scale)
+    return "pad={}:{}:{}:{}:black".format(
+        crop["width"] * s, crop["height"] * s, crop["x"] * s, crop["y"] * s
+    )
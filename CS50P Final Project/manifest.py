@@ -0,0 +1,92 @@
+import json
+import os
+import time
+
+
+def to_ranges(numbers):
+    ranges = []
+    for n in sorted(numbers):
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return ranges
+
+
+def from_ranges(ranges):
+    return {n for start, end in ranges for n in range(start, end + 1)}
+
+
+def frame_number(fname):
+    return int("".join(i for i in os.path.splitext(os.path.basename(fname))[0] if i.isdigit()))
+
+
+class JobManifest:
+    # Stored next to the output as <name>.ai2x.json. A job whose input file
+    # or upscale settings changed since the manifest was written starts over.
+    save_interval = 2.0
+
+    def __init__(self, fpath, key):
+        self.fpath = fpath
+        self.key = key
+        self._last_save = 0.0
+        self.upscaled = set()
+        self.data = None
+        if os.path.exists(fpath):
+            try:
+                with open(fpath) as f:
+                    data = json.load(f)
+                if data.get("key") == key:
+                    self.data = data
+            except (OSError, ValueError):
+                pass
+        if self.data is None:
+            self.reset()
+        self.upscaled = from_ranges(self.data["upscaled"])
+
+    @classmethod
+    def for_job(cls, input_fpath, output_dir, model, scale, tta, options=None):
+        stat = os.stat(input_fpath)
+        key = {
+            "input": os.path.abspath(input_fpath),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "model": model,
+            "scale": str(scale),
+            "tta": bool(tta),
+        }
+        if options:
+            key.update(options)
+        fname = os.path.basename(input_fpath).split(".")[0]
+        return cls(os.path.join(output_dir, fname + ".ai2x.json"), key)
+
+    def reset(self):
+        self.data = {
+            "key": self.key,
+            "decoded": 0,
+            "upscaled": [],
+            "segments": [],
+            "segments_done": [],
+            "duplicates": None,
+            "dedup": None,
+            "encoded": False,
+        }
+        self.upscaled = set()
+        self.save()
+
+    def add_upscaled(self, fname):
+        self.upscaled.add(frame_number(fname))
+        if time.monotonic() - self._last_save > self.save_interval:
+            self.save()
+
+    def set(self, **values):
+        self.data.update(values)
+        self.save()
+
+    def save(self):
+        self.data["upscaled"] = to_ranges(self.upscaled)
+        tmp_fpath = self.fpath + ".tmp"
+        with open(tmp_fpath, "w") as f:
+            json.dump(self.data, f)
+        os.replace(tmp_fpath, self.fpath)
+        self._last_save = time.monotonic()
@@ -0,0 +1,141 @@
+import json
+import os
+import subprocess
+import threading
+from fractions import Fraction
+
+import config
+
+
+CACHE_FPATH = os.path.join(config.CACHE_DIR, "probe_cache.json")
+_cache_lock = threading.Lock()
+
+
+class MediaInfo:
+    def __init__(self, fps, frame_count, duration, width, height, audio_streams):
+        self.fps = fps
+        self.frame_count = frame_count
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.audio_streams = audio_streams
+
+    @property
+    def fps_str(self):
+        # ffmpeg accepts the rational form, so 24000/1001 stays exact.
+        return "{}/{}".format(self.fps.numerator, self.fps.denominator)
+
+    def to_dict(self):
+        return {
+            "fps": self.fps_str,
+            "frame_count": self.frame_count,
+            "duration": self.duration,
+            "width": self.width,
+            "height": self.height,
+            "audio_streams": self.audio_streams,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            Fraction(data["fps"]),
+            data["frame_count"],
+            data["duration"],
+            data["width"],
+            data["height"],
+            data["audio_streams"],
+        )
+
+
+def parse_rate(rate):
+    try:
+        return Fraction(rate)
+    except (ValueError, ZeroDivisionError, TypeError):
+        return None
+
+
+def count_frames(video_fpath):
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+        "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", video_fpath,
+    ]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    return int(process.stdout.strip().split(",")[0])
+
+
+def run_probe(video_fpath):
+    cmd = [
+        "ffprobe", "-v", "error", "-show_streams", "-show_format", "-of", "json",
+        video_fpath,
+    ]
+    process = subprocess.run(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    if process.returncode != 0:
+        raise ValueError("ffprobe failed on {}: {}".format(video_fpath, process.stderr.strip()))
+    data = json.loads(process.stdout)
+    streams = data.get("streams", [])
+    video = next((i for i in streams if i.get("codec_type") == "video"), None)
+    if video is None:
+        raise ValueError("No video stream in {}".format(video_fpath))
+
+    fps = parse_rate(video.get("r_frame_rate")) or parse_rate(video.get("avg_frame_rate"))
+    duration = float(video.get("duration") or data.get("format", {}).get("duration") or 0)
+    if "nb_frames" in video:
+        frame_count = int(video["nb_frames"])
+    else:
+        # Matroska and friends don't store a frame count in the header.
+        frame_count = count_frames(video_fpath)
+    audio_streams = [
+        {
+            "index": i["index"],
+            "codec": i.get("codec_name"),
+            "channels": i.get("channels"),
+            "sample_rate": i.get("sample_rate"),
+        }
+        for i in streams
+        if i.get("codec_type") == "audio"
+    ]
+    return MediaInfo(
+        fps, frame_count, duration, video["width"], video["height"], audio_streams
+    )
+
+
+def cache_key(video_fpath):
+    stat = os.stat(video_fpath)
+    return "{}|{}|{}".format(os.path.abspath(video_fpath), stat.st_size, stat.st_mtime_ns)
+
+
+def load_cache():
+    try:
+        with open(CACHE_FPATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(CACHE_FPATH), exist_ok=True)
+    tmp_fpath = "{}.{}.tmp".format(CACHE_FPATH, os.getpid())
+    with open(tmp_fpath, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_fpath, CACHE_FPATH)
+
+
+def probe(video_fpath, use_cache=True):
+    if not use_cache:
+        return run_probe(video_fpath)
+    key = cache_key(video_fpath)
+    with _cache_lock:
+        cache = load_cache()
+        if key in cache:
+            return MediaInfo.from_dict(cache[key])
+    info = run_probe(video_fpath)
+    with _cache_lock:
+        cache = load_cache()
+        # A stale entry for the same path is replaced, not kept around.
+        path = key.rsplit("|", 2)[0]
+        cache = {k: v for k, v in cache.items() if k.rsplit("|", 2)[0] != path}
+        cache[key] = info.to_dict()
+        save_cache(cache)
+    return info
@@ -0,0 +1,576 @@
+import hashlib
+import os
+import queue
+import shlex
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+
+import config
+import dedup
+import letterbox
+import media
+import telemetry
+
+
+DECODE, UPSCALE, ENCODE = 0, 1, 2
+
+
+def upscaler_cmd():
+    # AI2X_UPSCALER swaps in another command with the same arguments, such
+    # as the Pillow stand-in used by the benchmarks.
+    if config.UPSCALER:
+        return shlex.split(config.UPSCALER, posix=os.name != "nt")
+    return [os.path.join(os.getcwd(), "realesrgan-ncnn-vulkan")]
+
+
+def run_process(cmd, on_line=None, aborted=None):
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    for line in process.stdout:
+        if aborted and aborted():
+            process.terminate()
+            break
+        if on_line:
+            on_line(line)
+    process.wait()
+    return process.returncode == 0
+
+
+# ffmpeg output options per intermediate frame format. realesrgan can't
+# write BMP, so lossless inputs come back as PNG.
+FRAME_FORMATS = {
+    "jpg": ["-qscale:v", "1", "-qmin", "1", "-qmax", "1"],
+    "png": ["-compression_level", "1"],
+    "bmp": [],
+}
+
+
+# libx264 with ffmpeg's defaults; encoding.py builds the other settings.
+DEFAULT_ENCODER = ("-c:v", "libx264", "-pix_fmt", "yuv420p")
+
+
+def scaled_ext(fmt):
+    return "jpg" if fmt == "jpg" else "png"
+
+
+def rendition_fpath(output_fpath, name):
+    base, ext = os.path.splitext(output_fpath)
+    return f"{base}_{name}{ext}"
+
+
+# Seconds per fMP4 fragment or HLS segment. HLS segments have to start on
+# a keyframe, so keyframes are forced at that interval.
+FRAGMENT_SECONDS = 2
+HLS_SECONDS = 4
+
+
+def progressive_output(output_fpath, progressive=None):
+    # Muxer options and file name for output that can be watched while it
+    # is still written. "fmp4" writes the .mp4 as fragments behind an empty
+    # moov; "hls" writes a growing playlist of fMP4 segments.
+    if progressive == "fmp4":
+        return [
+            "-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+            "-frag_duration", str(FRAGMENT_SECONDS * 1000000), "-flush_packets", "1",
+        ], output_fpath
+    if progressive == "hls":
+        base = os.path.splitext(output_fpath)[0]
+        return [
+            "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SECONDS})",
+            "-f", "hls", "-hls_time", str(HLS_SECONDS), "-hls_playlist_type", "event",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", os.path.basename(base) + "_init.mp4",
+            "-hls_segment_filename", base + "_%05d.m4s",
+        ], base + ".m3u8"
+    return [], output_fpath
+
+
+def finish_progressive(output_fpath, progressive=None):
+    # The playlist stays for whoever is watching it; the .mp4 every other
+    # mode writes is remuxed from it.
+    if progressive != "hls":
+        return True
+    cmd = [
+        "ffmpeg", "-y", "-v", "error", "-i", progressive_output(output_fpath, progressive)[1],
+        "-map", "0", "-c", "copy", output_fpath,
+    ]
+    return subprocess.run(cmd).returncode == 0
+
+
+def output_args(
+    output_fpath, encoder_args, vfilter=None, renditions=(), fps=None, progressive=None
+):
+    # Output options of an encoder with the frames as input 0 and the
+    # source video, for the audio, as input 1. Renditions are split off the
+    # master's filter chain and scaled down, so the frames are decoded once
+    # and every output gets its own encoder settings.
+    common = ["-map", "1:a:0?", "-c:a", "copy"]
+    if fps:
+        common += ["-r", fps]
+
+    def output(fpath):
+        mux_args, fpath = progressive_output(fpath, progressive)
+        return [*mux_args, fpath]
+
+    if not renditions:
+        vf = ["-vf", vfilter] if vfilter else []
+        return ["-map", "0:v:0", *common, *vf, *encoder_args, *output(output_fpath)]
+    labels = "".join(f"[s{n}]" for n in range(len(renditions)))
+    chains = [
+        "[0:v]{}split={}[master]{}".format(
+            vfilter + "," if vfilter else "", len(renditions) + 1, labels
+        )
+    ]
+    chains += [
+        f"[s{n}]scale=-2:{height}:flags=lanczos[r{n}]"
+        for n, (_, height, _) in enumerate(renditions)
+    ]
+    args = ["-filter_complex", ";".join(chains)]
+    args += ["-map", "[master]", *common, *encoder_args, *output(output_fpath)]
+    for n, (name, _, rendition_args) in enumerate(renditions):
+        args += [
+            "-map", f"[r{n}]", *common, *rendition_args,
+            *output(rendition_fpath(output_fpath, name)),
+        ]
+    return args
+
+
+def pic_dir_for(input_fpath, scratch_dir=None):
+    # A shared scratch folder sees equal file names from different jobs,
+    # such as the seg0000.mkv of every segment job, so the folder name there
+    # also carries a hash of the full input path.
+    temp_dirname = os.path.basename(input_fpath) + "Temp"
+    if scratch_dir:
+        digest = hashlib.blake2b(
+            os.path.abspath(input_fpath).encode(), digest_size=6
+        ).hexdigest()
+        temp_dirname = "{}.{}Temp".format(os.path.basename(input_fpath), digest)
+    temp_path = scratch_dir or os.path.dirname(input_fpath)
+    return os.path.join(temp_path, temp_dirname)
+
+
+def video_to_pics(
+    input_fpath, progress=None, aborted=None, fmt="jpg", scratch_dir=None, vfilter=None
+):
+    pic_dir = pic_dir_for(input_fpath, scratch_dir)
+    os.makedirs(pic_dir)
+    temp_output_path = os.path.join(pic_dir, "frame%08d." + fmt)
+    cmd = ["ffmpeg", "-nostats", "-progress", "pipe:1", "-i", input_fpath]
+    if vfilter:
+        cmd += ["-vf", vfilter]
+    cmd += FRAME_FORMATS[fmt] + ["-vsync", "0", temp_output_path]
+    if progress:
+        progress(DECODE, 0)
+    if not run_process(cmd, telemetry.ProgressParser(DECODE, progress), aborted):
+        return False
+    if progress:
+        # image2 doesn't report total_size, so count the folder once at the end.
+        progress(DECODE, len(list_frames(pic_dir)), telemetry.dir_size(pic_dir))
+    return True
+
+
+def list_frames(pic_dir):
+    return sorted(
+        i for i in os.listdir(pic_dir) if os.path.isfile(os.path.join(pic_dir, i))
+    )
+
+
+def link_frames(src_dir, dst_dir, fnames):
+    os.makedirs(dst_dir, exist_ok=True)
+    for fname in fnames:
+        src = os.path.join(src_dir, fname)
+        dst = os.path.join(dst_dir, fname)
+        if os.path.exists(dst):
+            continue
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+
+def upscale(
+    pic_dir,
+    model,
+    scale,
+    tta,
+    progress=None,
+    aborted=None,
+    skip=(),
+    on_done=None,
+    fmt="jpg",
+    backend=None,
+    shards=1,
+):
+    # Frames in skip are already upscaled; the rest are linked into pending
+    # folders so realesrgan never sees the finished ones. With shards > 1
+    # the frames are split into that many folders, each upscaled by its own
+    # realesrgan process, which keeps the GPU busy while the others load
+    # and save images.
+    if backend is None:
+        # backends builds on this module, so it is only imported here.
+        import backends
+
+        backend = backends.NcnnBackend()
+    scaled_pics_dir = os.path.join(pic_dir, "scaled")
+    os.makedirs(scaled_pics_dir, exist_ok=True)
+    frames = [i for i in list_frames(pic_dir) if i not in skip]
+    shards = max(1, min(shards, len(frames) // 2))
+    input_dirs = [pic_dir]
+    if skip or shards > 1:
+        input_dirs = []
+        size = -(-len(frames) // shards)
+        for n in range(shards):
+            input_dir = os.path.join(pic_dir, "pending" if shards == 1 else f"pending{n}")
+            shutil.rmtree(input_dir, ignore_errors=True)
+            link_frames(pic_dir, input_dir, frames[n * size:(n + 1) * size])
+            input_dirs.append(input_dir)
+
+    done = [len(skip), 0]
+    lock = threading.Lock()
+
+    def on_frame(src, out):
+        try:
+            out_size = os.path.getsize(out)
+        except OSError:
+            out_size = 0
+        with lock:
+            done[0] += 1
+            done[1] += out_size
+            if on_done:
+                on_done(os.path.basename(src))
+            if progress:
+                progress(UPSCALE, done[0], done[1])
+
+    if progress:
+        progress(UPSCALE, done[0])
+
+    def run(input_dir):
+        backend.upscale_dir(
+            input_dir, scaled_pics_dir, model, scale, tta, scaled_ext(fmt), on_frame, aborted
+        )
+
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in input_dirs[1:]]
+    for thread in threads:
+        thread.start()
+    run(input_dirs[0])
+    for thread in threads:
+        thread.join()
+    for input_dir in input_dirs:
+        if input_dir != pic_dir:
+            shutil.rmtree(input_dir, ignore_errors=True)
+    return scaled_pics_dir
+
+
+def pics_to_video(
+    scaled_pics_dir,
+    input_fpath,
+    output_dir,
+    progress=None,
+    aborted=None,
+    fmt="jpg",
+    encoder_args=DEFAULT_ENCODER,
+    vfilter=None,
+    renditions=(),
+):
+    # renditions are (name, height, encoder args) and end up next to the
+    # output as <name>_<rendition>.mp4.
+    fps = media.probe(input_fpath).fps_str
+    scaled_pics_path = os.path.join(scaled_pics_dir, "frame%08d." + scaled_ext(fmt))
+    fname = os.path.basename(input_fpath).split(".")[0]
+    output_fpath = os.path.join(output_dir, fname + ".mp4")
+    cmd = [
+        "ffmpeg", "-y", "-nostats", "-progress", "pipe:1",
+        "-f", "image2", "-framerate", fps, "-i", scaled_pics_path, "-i", input_fpath,
+        *output_args(output_fpath, encoder_args, vfilter, renditions, fps),
+    ]
+    if progress:
+        progress(ENCODE, 0)
+    return run_process(cmd, telemetry.ProgressParser(ENCODE, progress), aborted)
+
+
+def bmp_header(width, height):
+    # Negative height marks a top-down bitmap, so rawvideo rows can be
+    # written in the order ffmpeg produces them.
+    stride = (width * 3 + 3) & ~3
+    image_size = stride * height
+    file_header = struct.pack("<2sIHHI", b"BM", 54 + image_size, 0, 0, 54)
+    info_header = struct.pack(
+        "<IiiHHIIiiII", 40, width, -height, 1, 24, 0, image_size, 2835, 2835, 0, 0
+    )
+    return file_header + info_header
+
+
+def write_bmp(fpath, frame, width, height):
+    row_size = width * 3
+    padding = b"\0" * (((row_size + 3) & ~3) - row_size)
+    with open(fpath, "wb") as f:
+        f.write(bmp_header(width, height))
+        if not padding:
+            f.write(frame)
+            return
+        for y in range(height):
+            f.write(frame[y * row_size:(y + 1) * row_size])
+            f.write(padding)
+
+
+def log_tail(log, lines=5):
+    log.seek(0)
+    text = log.read().decode(errors="replace").strip().splitlines()
+    log.close()
+    return "\n".join(text[-lines:])
+
+
+# Frames per upscaler call in streaming mode. realesrgan loads the model
+# again for every batch, so ncnn batches are as large as NCNN_BATCH_BYTES of
+# raw frames allows; the in-memory backends don't pay for small batches.
+STREAM_BATCH = 16
+NCNN_BATCH_BYTES = 512 * 1024 ** 2
+NCNN_MAX_BATCH = 256
+
+
+def stream_batch_size(backend, width, height):
+    if not backend.name.startswith("ncnn"):
+        return STREAM_BATCH
+    return max(STREAM_BATCH, min(NCNN_MAX_BATCH, NCNN_BATCH_BYTES // (width * height * 3)))
+
+
+def put(q, item, aborted):
+    while True:
+        if aborted and aborted():
+            return False
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+
+
+def stream_video(
+    input_fpath,
+    output_dir,
+    model,
+    scale,
+    tta,
+    progress=None,
+    aborted=None,
+    batch_size=None,
+    queue_batches=2,
+    deduper=None,
+    scratch_dir=None,
+    backend=None,
+    encoder_args=DEFAULT_ENCODER,
+    crop=None,
+    frame_cache=None,
+    renditions=(),
+    progressive=None,
+):
+    # Decode, upscale and encode run concurrently. Frames travel as rawvideo
+    # through bounded queues; only the batch currently inside realesrgan
+    # touches disk, because the executable can only read and write files.
+    # Other backends upscale the batch in memory.
+    if backend is None:
+        import backends
+
+        backend = backends.NcnnBackend()
+    info = media.probe(input_fpath)
+    width, height = info.width, info.height
+    decode_filter, encode_filter = [], None
+    if crop:
+        # Only the active picture is upscaled; the bars are padded back on.
+        width, height = crop["w"], crop["h"]
+        decode_filter = ["-vf", letterbox.crop_filter(crop)]
+        encode_filter = letterbox.pad_filter(crop, scale)
+    fps = info.fps_str
+    frame_size = width * height * 3
+    batch_size = batch_size or stream_batch_size(backend, width, height)
+    fname = os.path.basename(input_fpath).split(".")[0]
+    output_fpath = os.path.join(output_dir, fname + ".mp4")
+
+    frames_q = queue.Queue(maxsize=batch_size * queue_batches)
+    scaled_q = queue.Queue(maxsize=queue_batches)
+    errors = []
+    stop = threading.Event()
+
+    def stopped():
+        return stop.is_set() or bool(aborted and aborted())
+
+    # stderr goes to temp files rather than pipes nobody reads, so a full
+    # pipe can't stall ffmpeg and a failure can be explained.
+    decoder_log = tempfile.TemporaryFile()
+    encoder_log = tempfile.TemporaryFile()
+    decoder = subprocess.Popen(
+        [
+            "ffmpeg", "-v", "error", "-i", input_fpath, "-map", "0:v:0", *decode_filter,
+            "-vsync", "0", "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=decoder_log,
+    )
+    encoder = subprocess.Popen(
+        [
+            "ffmpeg", "-y", "-v", "error", "-f", "image2pipe", "-framerate", fps,
+            "-c:v", "png", "-i", "pipe:0", "-i", input_fpath,
+            *output_args(output_fpath, encoder_args, encode_filter, renditions, None, progressive),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=encoder_log,
+    )
+    decoded = [0]
+
+    def decode():
+        try:
+            while not stopped():
+                frame = decoder.stdout.read(frame_size)
+                if len(frame) < frame_size:
+                    break
+                if not put(frames_q, frame, stopped):
+                    break
+                decoded[0] += 1
+                if progress:
+                    progress(DECODE, decoded[0], decoded[0] * frame_size)
+        finally:
+            put(frames_q, None, lambda: stop.is_set())
+
+    def encode():
+        encoded = 0
+        try:
+            while True:
+                batch = scaled_q.get()
+                if batch is None:
+                    break
+                for png in batch:
+                    encoder.stdin.write(png)
+                    encoded += 1
+                    if progress:
+                        progress(ENCODE, encoded)
+        except (BrokenPipeError, OSError) as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            try:
+                encoder.stdin.close()
+            except OSError:
+                pass
+
+    last_png = [None]
+
+    def upscale_batch(batch, work_dir):
+        # Held frames are not upscaled; they reuse the previous frame's
+        # upscaled PNG when the batch is put back together.
+        uniques = []
+        for frame in batch:
+            if deduper:
+                image = None
+                if deduper.threshold is not None:
+                    image = dedup.Image.frombytes("RGB", (width, height), frame)
+                if deduper.is_duplicate(frame, image):
+                    uniques.append(None)
+                    continue
+            uniques.append(frame)
+        frames = [i for i in uniques if i is not None]
+        pngs = [None] * len(frames)
+        keys = []
+        if frame_cache:
+            keys = [frame_cache.key(i) for i in frames]
+            pngs = [frame_cache.read(i, "png") for i in keys]
+        missing = [n for n, png in enumerate(pngs) if png is None]
+        if missing:
+            scaled = backend.upscale_frames(
+                [frames[n] for n in missing], width, height, model, scale, tta, work_dir, stopped
+            )
+            if scaled is None:
+                return None
+            for n, png in zip(missing, scaled):
+                pngs[n] = png
+                if frame_cache:
+                    frame_cache.put_bytes(keys[n], png, "png")
+        pngs = iter(pngs)
+        scaled = []
+        for frame in uniques:
+            if frame is not None:
+                last_png[0] = next(pngs)
+            scaled.append(last_png[0])
+        return scaled
+
+    if progress:
+        for stage in (DECODE, UPSCALE, ENCODE):
+            progress(stage, 0)
+    decode_thread = threading.Thread(target=decode, daemon=True)
+    encode_thread = threading.Thread(target=encode, daemon=True)
+    decode_thread.start()
+    encode_thread.start()
+
+    batch_dir = tempfile.mkdtemp(prefix="ai2x_", dir=scratch_dir)
+    upscaled = 0
+    upscaled_bytes = 0
+    try:
+        done = False
+        while not done and not stopped():
+            batch = []
+            while len(batch) < batch_size:
+                try:
+                    frame = frames_q.get(timeout=0.2)
+                except queue.Empty:
+                    if stopped():
+                        break
+                    continue
+                if frame is None:
+                    done = True
+                    break
+                batch.append(frame)
+            if not batch or stopped():
+                continue
+            scaled = upscale_batch(batch, batch_dir)
+            if scaled is None or not put(scaled_q, scaled, stopped):
+                break
+            upscaled += len(scaled)
+            upscaled_bytes += sum(len(i) for i in scaled)
+            if progress:
+                progress(UPSCALE, upscaled, upscaled_bytes)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        if stopped() or errors:
+            stop.set()
+            decoder.terminate()
+            encoder.terminate()
+        put(scaled_q, None, lambda: not encode_thread.is_alive())
+        decode_thread.join()
+        encode_thread.join()
+        decoder.wait()
+        encoder.wait()
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        logs = [log_tail(decoder_log), log_tail(encoder_log)]
+
+    if errors:
+        if isinstance(errors[0], OSError) and logs[1]:
+            # The encoder quit and closed its pipe; its log says why.
+            raise RuntimeError("Encoding {} failed: {}".format(output_fpath, logs[1])) from errors[0]
+        raise errors[0]
+    if stop.is_set():
+        return False
+    # A decoder that dies early ends the read loop like the end of the file
+    # does; only its exit code tells them apart. The container's frame count
+    # is no use here, an edit list or a bad header makes it wrong.
+    if decoder.returncode != 0:
+        raise RuntimeError("Decoding {} stopped after {} frames (exit code {}) {}".format(
+            input_fpath, decoded[0], decoder.returncode, logs[0],
+        ).strip())
+    if encoder.returncode != 0:
+        raise RuntimeError("Encoding {} failed (exit code {}) {}".format(
+            output_fpath, encoder.returncode, logs[1],
+        ).strip())
+    done = True
+    for fpath in [output_fpath] + [rendition_fpath(output_fpath, i[0]) for i in renditions]:
+        done = finish_progressive(fpath, progressive) and done
+    if done and progress:
+        progress(ENCODE, upscaled, os.path.getsize(output_fpath))
+    return done
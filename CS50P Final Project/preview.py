@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import backends
+import media
+import pipeline
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+
+PREVIEW_FRAMES = 6
+SCENE_THRESHOLD = 0.3
+# Source pixels shown per contact sheet cell; every option is cropped to
+# the same region and drawn at the size of the largest scale.
+CROP = 96
+LABEL_HEIGHT = 18
+
+
+def model_scales(models_dir="models"):
+    # {model: [scales]} from the .param files. realesr-animevideov3 ships
+    # one file per scale, the x4plus models only upscale 4x.
+    scales = {}
+    try:
+        fnames = sorted(os.listdir(models_dir))
+    except FileNotFoundError:
+        return scales
+    for fname in fnames:
+        name, ext = os.path.splitext(fname)
+        if ext != ".param":
+            continue
+        match = re.match(r"(.+)-x(\d)$", name)
+        if match:
+            scales.setdefault(match.group(1), []).append(int(match.group(2)))
+        else:
+            match = re.search(r"x(\d)", name)
+            scales.setdefault(name, []).append(int(match.group(1)) if match else 4)
+    return scales
+
+
+def preview_options(scales, models_dir="models"):
+    return [
+        (model, scale)
+        for model, supported in model_scales(models_dir).items()
+        for scale in scales
+        if scale in supported
+    ]
+
+
+def scene_times(input_fpath, threshold=SCENE_THRESHOLD):
+    # Only keyframes are decoded; encoders put them on most cuts anyway, and
+    # it keeps the scan short on long videos.
+    cmd = [
+        "ffmpeg", "-hide_banner", "-skip_frame", "nokey", "-i", input_fpath,
+        "-vf", f"select='gt(scene,{threshold})',showinfo", "-an", "-f", "null", "-",
+    ]
+    output = subprocess.run(
+        cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+    ).stderr
+    return [float(i) for i in re.findall(r"pts_time:\s*([\d.]+)", output)]
+
+
+def pick_times(scenes, duration, count=PREVIEW_FRAMES):
+    # A frame a little after each cut, spread over the video; evenly spaced
+    # frames fill up when there are fewer cuts than wanted.
+    if len(scenes) > count:
+        step = len(scenes) / count
+        scenes = [scenes[int(i * step)] for i in range(count)]
+    times = [min(t + 0.5, max(duration - 0.1, 0)) for t in scenes]
+    gap = duration / (count * 2) if duration else 0
+    for i in range(count):
+        if len(times) >= count:
+            break
+        t = (i + 0.5) * duration / count
+        if all(abs(t - j) > gap for j in times):
+            times.append(t)
+    return sorted(times)[:count]
+
+
+def extract_frames(input_fpath, times, sample_dir):
+    os.makedirs(sample_dir, exist_ok=True)
+    for idx, t in enumerate(times, 1):
+        cmd = [
+            "ffmpeg", "-v", "error", "-y", "-ss", f"{t:.3f}", "-i", input_fpath,
+            "-frames:v", "1", os.path.join(sample_dir, f"frame{idx:08d}.png"),
+        ]
+        subprocess.run(cmd, check=True)
+    return pipeline.list_frames(sample_dir)
+
+
+def measure_option(sample_dir, out_dir, model, scale, tta=False, aborted=None, backend=None):
+    # Seconds per frame come from the gaps between finished frames, so the
+    # model load and GPU setup at the start don't count per frame.
+    backend = backend or backends.NcnnBackend()
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    done = []
+    started = time.monotonic()
+    ok = backend.upscale_dir(
+        sample_dir, out_dir, model, scale, tta, "png",
+        lambda src, out: done.append(time.monotonic()), aborted,
+    )
+    result = {"model": model, "scale": scale, "ok": ok and bool(done), "dir": out_dir}
+    if not result["ok"]:
+        return result
+    if len(done) > 1:
+        per_frame = (done[-1] - done[0]) / (len(done) - 1)
+    else:
+        per_frame = done[0] - started
+    result["seconds_per_frame"] = round(per_frame, 4)
+    result["startup_seconds"] = round(max(done[0] - started - per_frame, 0), 3)
+    return result
+
+
+def contact_sheet(sample_dir, results, fpath):
+    # One row per sample frame: the source blown up with bicubic, then
+    # every option, all cropped to the same region.
+    fnames = pipeline.list_frames(sample_dir)
+    results = [i for i in results if i["ok"]]
+    cell = CROP * max([i["scale"] for i in results] or [1])
+    columns = [("source", None)] + [
+        ("{model} x{scale}  {seconds_per_frame:.2f}s".format(**i), i) for i in results
+    ]
+    sheet = Image.new(
+        "RGB", (cell * len(columns), (cell + LABEL_HEIGHT) * len(fnames)), "white"
+    )
+    draw = ImageDraw.Draw(sheet)
+    for row, fname in enumerate(fnames):
+        with Image.open(os.path.join(sample_dir, fname)) as source:
+            width, height = source.size
+            size = min(CROP, width, height)
+            left, top = (width - size) // 2, (height - size) // 2
+            y = row * (cell + LABEL_HEIGHT)
+            for col, (label, result) in enumerate(columns):
+                if result is None:
+                    tile = source.crop((left, top, left + size, top + size))
+                else:
+                    s = result["scale"]
+                    scaled = os.path.join(result["dir"], os.path.splitext(fname)[0] + ".png")
+                    with Image.open(scaled) as image:
+                        tile = image.crop((left * s, top * s, (left + size) * s, (top + size) * s))
+                tile = tile.convert("RGB").resize((cell, cell), Image.BICUBIC)
+                sheet.paste(tile, (col * cell, y + LABEL_HEIGHT))
+                draw.text((col * cell + 4, y + 3), label, fill="black")
+    sheet.save(fpath)
+    return fpath
+
+
+def preview_dir_for(input_fpath, output_dir):
+    fname = os.path.basename(input_fpath).split(".")[0]
+    return os.path.join(output_dir, fname + "Preview")
+
+
+def run_preview(
+    input_fpath,
+    output_dir,
+    scales=(2, 3, 4),
+    tta=False,
+    frames=PREVIEW_FRAMES,
+    models_dir="models",
+    workers=2,
+    aborted=None,
+):
+    if Image is None:
+        raise RuntimeError("Preview needs Pillow, see requirements.txt")
+    options = preview_options(scales, models_dir)
+    if not options:
+        raise RuntimeError("No model in {} supports scale {}".format(
+            models_dir, ", ".join(str(i) for i in scales)
+        ))
+    info = media.probe(input_fpath)
+    preview_dir = preview_dir_for(input_fpath, output_dir)
+    sample_dir = os.path.join(preview_dir, "samples")
+    shutil.rmtree(sample_dir, ignore_errors=True)
+    times = pick_times(scene_times(input_fpath), info.duration, frames)
+    extract_frames(input_fpath, times, sample_dir)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                measure_option, sample_dir,
+                os.path.join(preview_dir, f"{model}-x{scale}"), model, scale, tta, aborted,
+            )
+            for model, scale in options
+        ]
+        results = [i.result() for i in futures]
+    for result in results:
+        if result["ok"]:
+            result["projected_seconds"] = round(
+                result["startup_seconds"] + result["seconds_per_frame"] * info.frame_count, 1
+            )
+
+    report = {
+        "input": os.path.abspath(input_fpath),
+        "frame_count": info.frame_count,
+        "sample_times": [round(i, 3) for i in times],
+        "workers": workers,
+        "options": results,
+        "sheet": None,
+    }
+    if any(i["ok"] for i in results):
+        report["sheet"] = contact_sheet(
+            sample_dir, results, os.path.join(preview_dir, "contact_sheet.png")
+        )
+    with open(os.path.join(preview_dir, "preview.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
@@ -1,13 +1,30 @@
+import argparse
+import json
 import sys
 import os
-import subprocess
-import widget
+import shutil
+import config
+import media
 import time
 
-from PySide6 import QtWidgets
 
+STAGE_NAMES = ["decode", "upscale", "encode"]
+MODELS = [
+    "realesrgan-x4plus",
+    "realesr-animevideov3",
+    "realesrgan-x4plus-anime",
+    "realesrnet-x4plus",
+]
 
-def main():
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.input or args.resume_queue:
+        sys.exit(main_cli(args))
+    main_gui()
+
+
+def main_gui():
     if not (check_ffmpeg() and check_Real_ESRGAN_ncnn_Vulkan()):
         print("Missing required files, see requirement.txt and README.MD for more information.")
         print("This window will close after 5 seconds")
@@ -22,6 +39,11 @@ def main():
         print("1")
         time.sleep(1)
         sys.exit()
+    # Qt is only imported for the GUI, so scripts and render nodes can use
+    # this module without PySide6 installed.
+    import widget
+    from PySide6 import QtWidgets
+
     app = QtWidgets.QApplication(sys.argv)
 
     window = widget.Widget()
@@ -30,7 +52,285 @@ def main():
     app.exec()
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Upscale videos with Real-ESRGAN ncnn Vulkan. "
+        "Without --input the GUI is opened."
+    )
+    parser.add_argument("--input", nargs="+", help="video files or folders")
+    parser.add_argument("--output", default=os.getcwd(), help="output folder")
+    parser.add_argument("--model", default=MODELS[0], choices=MODELS)
+    parser.add_argument("--scale", type=int, default=2, choices=[2, 3, 4])
+    parser.add_argument("--tta", action="store_true", help="enable TTA mode")
+    parser.add_argument(
+        "--backend", default="ncnn", choices=["ncnn", "lanczos"],
+        help="lanczos is a CPU draft that doesn't need Vulkan",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="upscale keyframe segments in N processes"
+    )
+    parser.add_argument("--stream", action="store_true", help="use the streaming pipeline")
+    parser.add_argument(
+        "--batch-size", type=int, default=None,
+        help="frames per upscaler run in streaming mode (default: as many as fit in 512 MB "
+        "for ncnn, 16 otherwise)",
+    )
+    parser.add_argument(
+        "--images", action="store_true",
+        help="upscale the images in --input (folders are walked) instead of videos",
+    )
+    parser.add_argument(
+        "--stage-workers", type=int, nargs=3, default=None,
+        metavar=("DECODE", "UPSCALE", "ENCODE"),
+        help="worker threads per stage when several videos run as a batch (1 1 1)",
+    )
+    parser.add_argument("--dedup", action="store_true", help="skip held frames")
+    parser.add_argument(
+        "--dedup-threshold", type=int, default=None,
+        help="perceptual hash distance for --dedup (needs Pillow)",
+    )
+    parser.add_argument(
+        "--frame-format", default="jpg", choices=["auto", "jpg", "png", "bmp"],
+        help="intermediate frame format, auto runs a quick calibration",
+    )
+    parser.add_argument(
+        "--scratch", default=None,
+        help="folder for temp frames (e.g. a RAM disk), or auto",
+    )
+    parser.add_argument(
+        "--crop", default=None,
+        help="auto to find letterbox/pillarbox bars, or w:h:x:y; bars are padded back on",
+    )
+    parser.add_argument(
+        "--frame-cache", type=float, default=None, metavar="GB",
+        help="reuse upscaled frames across jobs, keeping up to GB in ~/.ai2x/frames",
+    )
+    parser.add_argument(
+        "--route-flat", type=float, nargs="?", const=True, default=None, metavar="THRESHOLD",
+        help="upscale flat frames (fades, black, title cards) with lanczos instead of the model",
+    )
+    parser.add_argument(
+        "--renditions", nargs="+", default=None, metavar="HEIGHTp[:PROFILE]",
+        help="also write smaller renditions from the same encode, e.g. 1080p 720p:fast",
+    )
+    parser.add_argument(
+        "--progressive", default=None, choices=["fmp4", "hls"],
+        help="write output that can be watched while the job runs (uses streaming mode)",
+    )
+    parser.add_argument(
+        "--shards", type=int, default=None,
+        help="split the frames over N realesrgan processes",
+    )
+    parser.add_argument("--threads", help="realesrgan -j load:proc:save threads")
+    parser.add_argument("--tile", type=int, default=None, help="realesrgan -t tile size")
+    parser.add_argument(
+        "--tune", action="store_true",
+        help="calibrate -j, -t and shards once per machine and model",
+    )
+    parser.add_argument(
+        "--profile", default="default",
+        choices=["default", "fast", "quality", "animation", "hevc", "mezzanine"],
+        help="encoder profile",
+    )
+    parser.add_argument(
+        "--preset", default=None,
+        choices=["auto", "ultrafast", "superfast", "veryfast", "faster", "fast", "medium",
+                 "slow", "slower", "veryslow"],
+        help="encoder preset, auto picks the slowest one that keeps --realtime-factor",
+    )
+    parser.add_argument("--crf", type=int, default=None)
+    parser.add_argument("--encode-threads", type=int, default=None)
+    parser.add_argument(
+        "--realtime-factor", type=float, default=None,
+        help="encode speed for --preset auto, relative to the video frame rate (0.5)",
+    )
+    parser.add_argument(
+        "--resume-queue", action="store_true",
+        help="run the jobs an earlier batch left pending in the queue, with their own settings",
+    )
+    parser.add_argument(
+        "--preview", action="store_true",
+        help="only upscale a few sample frames with every model and report the timings",
+    )
+    parser.add_argument(
+        "--preview-scales", type=int, nargs="+", default=[2, 3, 4], choices=[2, 3, 4],
+    )
+    return parser.parse_args(argv)
+
+
+def json_progress(out=sys.stdout):
+    last = {}
+
+    def progress(stage, value, stats=None):
+        # Repeats are left out, but a stage's last event often repeats the
+        # frame count with the final byte count, so bytes count as a change.
+        key = (value, stats["bytes"] if stats else None)
+        if last.get(stage) == key:
+            return
+        last[stage] = key
+        event = {"event": "progress", "stage": STAGE_NAMES[stage], "frames": value}
+        if stats:
+            event.update(
+                fps=stats["fps"], bytes=stats["bytes"], elapsed=stats["elapsed"], eta=stats["eta"]
+            )
+        emit(event, out)
+
+    return progress
+
+
+def emit(event, out=sys.stdout):
+    out.write(json.dumps(event) + "\n")
+    out.flush()
+
+
+def main_cli(args):
+    if not (check_ffmpeg() and (args.backend != "ncnn" or check_Real_ESRGAN_ncnn_Vulkan())):
+        emit({"event": "error", "message": "ffmpeg or realesrgan-ncnn-vulkan not found"})
+        return 1
+    if args.preview:
+        return preview_cli(args)
+    if args.images:
+        return images_cli(args)
+    if args.resume_queue:
+        return resume_cli(args)
+    options = {
+        "backend": args.backend,
+        "jobs": args.jobs,
+        "stream": args.stream,
+        "batch_size": args.batch_size,
+        "stage_workers": args.stage_workers,
+        "dedup": args.dedup or args.dedup_threshold is not None,
+        "dedup_threshold": args.dedup_threshold,
+        "frame_format": args.frame_format,
+        "scratch": args.scratch,
+        "crop": args.crop,
+        "frame_cache": args.frame_cache,
+        "route_threshold": args.route_flat,
+        "shards": args.shards,
+        "threads": args.threads,
+        "tile": args.tile,
+        "tune": args.tune,
+        "profile": args.profile,
+        "preset": args.preset,
+        "crf": args.crf,
+        "encode_threads": args.encode_threads,
+        "realtime_factor": args.realtime_factor,
+        "renditions": args.renditions,
+        "progressive": args.progressive,
+    }
+    started = time.monotonic()
+    try:
+        done = upscale_videos(
+            args.input, args.output, args.model, args.scale, args.tta, options,
+            json_progress(),
+        )
+    except Exception as e:
+        emit({"event": "error", "message": str(e)})
+        return 1
+    emit({"event": "done", "ok": done, "seconds": round(time.monotonic() - started, 3)})
+    return 0 if done else 1
+
+
+def preview_cli(args):
+    import batch
+    import preview
+
+    os.makedirs(args.output, exist_ok=True)
+    try:
+        for video in batch.collect_videos(args.input, args.output):
+            report = preview.run_preview(video, args.output, args.preview_scales, args.tta)
+            emit({"event": "preview", **report})
+    except Exception as e:
+        emit({"event": "error", "message": str(e)})
+        return 1
+    return 0
+
+
+def resume_cli(args):
+    started = time.monotonic()
+    try:
+        done = resume_queue(json_progress(), stage_workers=args.stage_workers)
+    except Exception as e:
+        emit({"event": "error", "message": str(e)})
+        return 1
+    emit({"event": "done", "ok": done, "seconds": round(time.monotonic() - started, 3)})
+    return 0 if done else 1
+
+
+def images_cli(args):
+    import images
+
+    options = {
+        "backend": args.backend, "shards": args.shards, "threads": args.threads,
+        "tile": args.tile, "tune": args.tune,
+    }
+    try:
+        report = images.upscale_images(
+            args.input, args.output, args.model, args.scale, args.tta, options, json_progress()
+        )
+    except Exception as e:
+        emit({"event": "error", "message": str(e)})
+        return 1
+    emit({"event": "done", "ok": report["failed"] == 0, **report})
+    return 0 if report["failed"] == 0 else 1
+
+
+def upscale_video(
+    input_fpath, output_dir, model=MODELS[0], scale=2, tta=False, options=None,
+    progress=None, aborted=None,
+):
+    import job
+
+    os.makedirs(output_dir, exist_ok=True)
+    return job.run_job(
+        input_fpath, output_dir, model, scale, tta, options or {}, progress, aborted
+    )
+
+
+def upscale_videos(
+    input_paths, output_dir, model=MODELS[0], scale=2, tta=False, options=None,
+    progress=None, aborted=None,
+):
+    # One file runs through run_job with all its options; folders or several
+    # files go through the batch queue so their stages overlap.
+    import batch
+
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+    videos = batch.collect_videos(input_paths, output_dir)
+    if not videos:
+        raise FileNotFoundError("No input videos in {}".format(", ".join(input_paths)))
+    if len(videos) == 1 and videos[0] == input_paths[0]:
+        return upscale_video(
+            videos[0], output_dir, model, scale, tta, options, progress, aborted
+        )
+    os.makedirs(output_dir, exist_ok=True)
+    job_queue = batch.JobQueue()
+    added = job_queue.add(input_paths, output_dir, model, scale, tta, options)
+    scheduler = batch.BatchScheduler(
+        job_queue, batch.stage_limits(options), progress=progress, aborted=aborted
+    )
+    items = scheduler.run(added)
+    return all(i["status"] == batch.DONE for i in items)
+
+
+def resume_queue(progress=None, aborted=None, stage_workers=None, queue_fpath=None):
+    # Runs what is still pending in the batch queue, such as the rest of a
+    # batch that was aborted or whose machine went down.
+    import batch
+
+    job_queue = batch.JobQueue(queue_fpath or batch.QUEUE_FPATH)
+    scheduler = batch.BatchScheduler(
+        job_queue, batch.stage_limits({"stage_workers": stage_workers}),
+        progress=progress, aborted=aborted,
+    )
+    items = scheduler.run()
+    return all(i["status"] == batch.DONE for i in items)
+
+
 def check_ffmpeg():
+    if shutil.which("ffmpeg") and shutil.which("ffprobe"):
+        return True
     sys_env = os.environ.get("PATH")
     usr_env = os.getenv("PATH")
     in_sys = [i for i in sys_env.split(";") if "ffmpeg" in i]
@@ -39,7 +339,11 @@ def check_ffmpeg():
 
 
 def check_Real_ESRGAN_ncnn_Vulkan():
+    if config.UPSCALER:
+        return True
     requirement = ["realesrgan-ncnn-vulkan.exe", "vcomp140.dll", "vcomp140d.dll"]
+    if os.name != "nt":
+        requirement = ["realesrgan-ncnn-vulkan"]
     return all([i in os.listdir() for i in requirement])
 
 
@@ -54,29 +358,11 @@ def check_models():
 
 
 def get_fps(video_fpath):
-    cmd1 = "ffprobe -v error -select_streams v -of default=noprint_wrappers=1:nokey=1"
-    cmd2 = " -show_entries stream=r_frame_rate {}".format(video_fpath)
-    process = subprocess.Popen(
-        cmd1 + cmd2,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-    )
-    fps = [i for i in process.stdout]
-    return fps[0]
+    return media.probe(video_fpath).fps_str
 
 
 def get_frame_count(video_fpath):
-    cmd1 = "ffprobe -v error -select_streams v:0 -count_packets -show_entries"
-    cmd2 = " stream=nb_read_packets -of csv=p=0 {}".format(video_fpath)
-    process = subprocess.Popen(
-        cmd1 + cmd2,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        universal_newlines=True,
-    )
-    frame_count = [i for i in process.stdout]
-    return frame_count[0]
+    return str(media.probe(video_fpath).frame_count)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,267 @@
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import Manager
+
+import backends
+import dedup
+import encoding
+import framecache
+import letterbox
+import job
+import pipeline
+import staging
+import tuning
+
+
+def keyframe_indices(video_fpath):
+    # Packet order is the order the segment muxer counts frames in.
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=flags", "-of", "csv=p=0", video_fpath,
+    ]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    flags = [i.strip() for i in process.stdout.splitlines() if i.strip()]
+    return [idx for idx, flag in enumerate(flags) if "K" in flag], len(flags)
+
+
+def split_frames(keyframes, frame_count, segment_count):
+    # Pick the keyframe closest to each evenly spaced cut point. Without
+    # keyframes the video stays in one piece.
+    cuts = []
+    if not keyframes:
+        return cuts
+    for i in range(1, segment_count):
+        target = frame_count * i // segment_count
+        best = min(keyframes, key=lambda k: abs(k - target))
+        if 0 < best < frame_count and best not in cuts:
+            cuts.append(best)
+    return sorted(cuts)
+
+
+def split_video(input_fpath, segment_dir, cuts):
+    os.makedirs(segment_dir, exist_ok=True)
+    cmd = ["ffmpeg", "-v", "error", "-i", input_fpath, "-map", "0:v:0", "-c", "copy"]
+    if cuts:
+        cmd += ["-f", "segment", "-segment_frames", ",".join(str(i) for i in cuts)]
+    else:
+        cmd += ["-f", "segment", "-segment_time", "999999"]
+    cmd += ["-reset_timestamps", "1", os.path.join(segment_dir, "seg%04d.mkv")]
+    subprocess.run(cmd, check=True)
+    return sorted(
+        os.path.join(segment_dir, i) for i in os.listdir(segment_dir) if i.endswith(".mkv")
+    )
+
+
+def upscale_segment(idx, seg_fpath, output_dir, model, scale, tta, options, progress_q, abort_event):
+    def progress(stage, value, bytes_written=None):
+        progress_q.put((idx, stage, value, bytes_written))
+
+    aborted = abort_event.is_set
+    if options.get("stream"):
+        deduper = job.make_deduper(options)
+        backend = backends.make_backend(options, tuning.upscaler_args(options["tuned"]))
+        frame_cache = job.make_frame_cache(options, backend, model, scale, tta)
+        done = pipeline.stream_video(
+            seg_fpath, output_dir, model, scale, tta, progress, aborted,
+            batch_size=options.get("batch_size"), deduper=deduper, scratch_dir=options.get("scratch"), backend=backend,
+            encoder_args=encoding.encoder_args(options["encoding"]),
+            crop=options.get("crop"), frame_cache=frame_cache,
+            renditions=encoding.rendition_outputs(encoding.renditions(options)),
+        )
+        if frame_cache:
+            frame_cache.trim()
+        return done, {
+            "dedup": deduper.report() if deduper else None,
+            "frame_cache": frame_cache.report() if frame_cache else None,
+            "routing": backend.report() if isinstance(backend, backends.RoutedBackend) else None,
+        }
+    # Each segment keeps its own manifest, so an aborted segment resumes
+    # frame by frame like a single video.
+    seg_manifest = job.manifest_for(
+        seg_fpath, os.path.dirname(seg_fpath), model, scale, tta, options, "folder"
+    )
+    done = job.run_folder(
+        seg_fpath, output_dir, model, scale, tta, options, seg_manifest, progress, aborted
+    )
+    return done, {i: seg_manifest.data.get(i) for i in ("dedup", "frame_cache", "routing")}
+
+
+def concat_segments(segment_fpaths, input_fpath, output_fpath):
+    list_fpath = output_fpath + ".txt"
+    with open(list_fpath, "w") as f:
+        for fpath in segment_fpaths:
+            f.write("file '{}'\n".format(os.path.abspath(fpath).replace("'", "'\\''")))
+    cmd = [
+        "ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_fpath,
+        "-i", input_fpath, "-map", "0:v:0", "-map", "1:a:0?", "-c", "copy", output_fpath,
+    ]
+    done = subprocess.run(cmd).returncode == 0
+    os.remove(list_fpath)
+    return done
+
+
+def parallel_upscale(
+    input_fpath,
+    output_dir,
+    model,
+    scale,
+    tta,
+    options,
+    progress=None,
+    aborted=None,
+    manifest=None,
+):
+    jobs = options.get("jobs", 1)
+    fname = os.path.basename(input_fpath).split(".")[0]
+    work_dir = os.path.join(output_dir, fname + "Segments")
+    seg_src_dir = os.path.join(work_dir, "src")
+    seg_out_dir = os.path.join(work_dir, "out")
+
+    # The manifest lists every segment with its frame count, so a resumed
+    # job reuses the split and skips segments that were already encoded.
+    planned = manifest.data["segments"] if manifest else []
+    if not planned or not all(
+        os.path.exists(os.path.join(seg_src_dir, name)) for name, _ in planned
+    ):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        keyframes, frame_count = keyframe_indices(input_fpath)
+        # A few segments per worker keeps the pool busy when segments differ
+        # in length or content.
+        cuts = split_frames(keyframes, frame_count, jobs * 3)
+        seg_fpaths = split_video(input_fpath, seg_src_dir, cuts)
+        bounds = [0] + cuts + [frame_count]
+        planned = [
+            [os.path.basename(i), bounds[idx + 1] - bounds[idx]]
+            for idx, i in enumerate(seg_fpaths)
+        ]
+        if manifest:
+            manifest.set(segments=planned, segments_done=[])
+    os.makedirs(seg_out_dir, exist_ok=True)
+
+    def out_fpath(name):
+        return os.path.join(seg_out_dir, name.split(".")[0] + ".mp4")
+
+    finished = set(manifest.data["segments_done"]) if manifest else set()
+    finished = {i for i in finished if os.path.exists(out_fpath(i))}
+
+    # Staging is calibrated once on the whole video and handed to every
+    # segment as a fixed choice.
+    choice = manifest.data.get("staging") if manifest else None
+    if not choice:
+        choice = staging.resolve(input_fpath, scale, options)
+        choice = {"scratch": choice["scratch"], "format": choice["format"]}
+        if manifest:
+            manifest.set(staging=choice)
+    # The segments already run side by side, so they don't shard further.
+    tuned = dict(tuning.resolve(input_fpath, model, scale, tta, options, aborted=aborted), shards=1)
+    profile = encoding.resolve(input_fpath, scale, options, aborted)
+    # The crop is found on the whole video, so every segment uses the same one.
+    crop = manifest.data.get("crop") if manifest else None
+    if crop is None:
+        crop = letterbox.resolve(input_fpath, options)
+    renditions = encoding.renditions(options)
+    if manifest:
+        manifest.set(tuning=tuned, encoding=profile, crop=crop, renditions=renditions)
+    seg_options = dict(
+        options, jobs=1, frame_format=choice["format"], scratch=choice["scratch"], tuned=tuned,
+        encoding=profile, crop=crop,
+    )
+    reports = dict(manifest.data.get("segment_dedup") or {}) if manifest else {}
+    cache_reports = []
+    routing_reports = []
+
+    manager = Manager()
+    progress_q = manager.Queue()
+    abort_event = manager.Event()
+    values = {}
+    sizes = {}
+    for idx, (name, frames) in enumerate(planned):
+        if name in finished:
+            for stage in (pipeline.DECODE, pipeline.UPSCALE, pipeline.ENCODE):
+                values[(idx, stage)] = frames
+
+    def forward_progress():
+        while True:
+            item = progress_q.get()
+            if item is None:
+                break
+            idx, stage, value, bytes_written = item
+            values[(idx, stage)] = value
+            if bytes_written is not None:
+                sizes[(idx, stage)] = bytes_written
+            if progress:
+                total = sum(v for (_, s), v in values.items() if s == stage)
+                total_bytes = sum(v for (_, s), v in sizes.items() if s == stage)
+                progress(stage, total, total_bytes)
+
+    reporter = threading.Thread(target=forward_progress, daemon=True)
+    reporter.start()
+
+    # A segment that raises ends the job, but the reporter thread and the
+    # Manager process are stopped first either way.
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(
+                    upscale_segment, idx, os.path.join(seg_src_dir, name), seg_out_dir,
+                    model, scale, tta, seg_options, progress_q, abort_event,
+                ): name
+                for idx, (name, _) in enumerate(planned)
+                if name not in finished
+            }
+            pending = set(futures)
+            try:
+                while pending:
+                    if aborted and aborted():
+                        abort_event.set()
+                    completed, pending = wait(pending, timeout=0.5)
+                    for future in completed:
+                        done, seg_reports = future.result()
+                        dedup_report = seg_reports["dedup"]
+                        cache_reports.append(seg_reports["frame_cache"])
+                        routing_reports.append(seg_reports["routing"])
+                        if done:
+                            name = futures[future]
+                            finished.add(name)
+                            if dedup_report:
+                                reports[name] = dedup_report
+                            if manifest:
+                                manifest.set(
+                                    segments_done=sorted(finished), segment_dedup=reports
+                                )
+            except BaseException:
+                # The other segments stop instead of running to the end.
+                abort_event.set()
+                for future in pending:
+                    future.cancel()
+                raise
+    finally:
+        progress_q.put(None)
+        reporter.join()
+        manager.shutdown()
+
+    done = len(finished) == len(planned) and not (aborted and aborted())
+    if manifest and reports:
+        manifest.set(dedup=dedup.merge_reports(list(reports.values())))
+    if manifest and framecache.merge_reports(cache_reports):
+        manifest.set(frame_cache=framecache.merge_reports(cache_reports))
+    if manifest and backends.merge_reports(routing_reports):
+        manifest.set(routing=backends.merge_reports(routing_reports))
+    if done:
+        output_fpath = os.path.join(output_dir, fname + ".mp4")
+        done = concat_segments(
+            [out_fpath(name) for name, _ in planned], input_fpath, output_fpath
+        )
+        # Every segment wrote its renditions too; they are joined the same way.
+        for rendition in renditions:
+            name = rendition["name"]
+            done = done and concat_segments(
+                [pipeline.rendition_fpath(out_fpath(i), name) for i, _ in planned],
+                input_fpath, pipeline.rendition_fpath(output_fpath, name),
+            )
+    if done:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return done
@@ -0,0 +1,119 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import media
+import pipeline
+
+
+# Keep this much of the volume free on top of the estimated frame size.
+SPACE_MARGIN = 1.1
+# Places in the video the calibration frames are taken from.
+SAMPLE_POINTS = 4
+
+
+def scratch_candidates(extra=()):
+    # RAM backed folders first; None stands for "next to the source video".
+    dirs = [i for i in extra if i]
+    if os.path.isdir("/dev/shm"):
+        dirs.append("/dev/shm")
+    dirs.append(tempfile.gettempdir())
+    dirs.append(None)
+    seen = []
+    for d in dirs:
+        if d is not None and (not os.path.isdir(d) or not os.access(d, os.W_OK)):
+            continue
+        if d not in seen:
+            seen.append(d)
+    return seen
+
+
+def free_space(path):
+    return shutil.disk_usage(path).free
+
+
+def sample_starts(duration, points):
+    # Seconds to sample from, spread over the video so a black leader or
+    # a title card doesn't stand in for the whole of it.
+    if not duration or duration <= 0:
+        return [0]
+    return [duration * (i + 0.5) / points for i in range(points)]
+
+
+def measure(input_fpath, scratch_dir, fmt, sample_frames, duration=None):
+    # Decodes a few frames into the candidate folder and reads them back,
+    # which is the I/O every frame pays before and after realesrgan.
+    sample_dir = tempfile.mkdtemp(
+        prefix="ai2x_calibrate_", dir=scratch_dir or os.path.dirname(os.path.abspath(input_fpath))
+    )
+    try:
+        pattern = os.path.join(sample_dir, "frame%08d." + fmt)
+        starts = sample_starts(duration, SAMPLE_POINTS)
+        per_start = max(sample_frames // len(starts), 1)
+        written = 0
+        for idx, start in enumerate(starts):
+            cmd = [
+                "ffmpeg", "-v", "error", "-ss", "{:.3f}".format(start), "-i", input_fpath,
+                "-frames:v", str(per_start), "-start_number", str(idx * per_start + 1),
+            ]
+            cmd += pipeline.FRAME_FORMATS[fmt] + ["-vsync", "0", pattern]
+            started = time.perf_counter()
+            subprocess.run(cmd, check=True)
+            written += time.perf_counter() - started
+        fnames = pipeline.list_frames(sample_dir)
+        if not fnames:
+            return None
+        total_bytes = 0
+        started = time.perf_counter()
+        for fname in fnames:
+            with open(os.path.join(sample_dir, fname), "rb") as f:
+                total_bytes += len(f.read())
+        read = time.perf_counter() - started
+        return {
+            "seconds_per_frame": (written + read) / len(fnames),
+            "bytes_per_frame": total_bytes / len(fnames),
+        }
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
+
+
+def calibrate(input_fpath, scale, candidates=None, formats=("bmp", "png", "jpg"), sample_frames=24):
+    info = media.probe(input_fpath)
+    results = []
+    for scratch_dir in candidates or scratch_candidates():
+        free = free_space(scratch_dir or os.path.dirname(os.path.abspath(input_fpath)))
+        for fmt in formats:
+            result = measure(input_fpath, scratch_dir, fmt, sample_frames, info.duration)
+            if result is None:
+                continue
+            # The upscaled copy is scale^2 times larger and comes back as
+            # PNG or JPEG, which compress about as well as the input.
+            ratio = 1 if fmt != "bmp" else 0.5
+            needed = info.frame_count * result["bytes_per_frame"] * (1 + scale * scale * ratio)
+            result.update(
+                scratch=scratch_dir,
+                format=fmt,
+                needed_bytes=int(needed),
+                free_bytes=free,
+                fits=needed * SPACE_MARGIN < free,
+            )
+            results.append(result)
+    fitting = [i for i in results if i["fits"]]
+    if not fitting:
+        return {"scratch": None, "format": "jpg", "measurements": results}
+    best = min(fitting, key=lambda i: i["seconds_per_frame"])
+    return {"scratch": best["scratch"], "format": best["format"], "measurements": results}
+
+
+def resolve(input_fpath, scale, options):
+    # Turns the frame_format/scratch options into a concrete choice; "auto"
+    # for either one runs the calibration over the open choices.
+    fmt = options.get("frame_format", "jpg")
+    scratch = options.get("scratch")
+    if fmt != "auto" and scratch != "auto":
+        return {"scratch": scratch, "format": fmt}
+    candidates = scratch_candidates() if scratch == "auto" else [scratch]
+    formats = tuple(pipeline.FRAME_FORMATS) if fmt == "auto" else (fmt,)
+    return calibrate(input_fpath, int(scale), candidates, formats)
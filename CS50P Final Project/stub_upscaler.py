@@ -0,0 +1,59 @@
+import argparse
+import os
+import sys
+
+from PIL import Image
+
+
+# Stand-in for realesrgan-ncnn-vulkan with the same command line, for
+# machines without Vulkan. It only resizes, so the output is useless but
+# the pipeline around it runs exactly as with the real upscaler.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-i", dest="input", required=True)
+    parser.add_argument("-o", dest="output", required=True)
+    parser.add_argument("-s", dest="scale", type=int, default=4)
+    parser.add_argument("-f", dest="format", default="png")
+    parser.add_argument("-n", dest="model")
+    parser.add_argument("-m", dest="model_path")
+    parser.add_argument("-t", dest="tile_size")
+    parser.add_argument("-g", dest="gpu_id")
+    parser.add_argument("-j", dest="threads")
+    parser.add_argument("-x", dest="tta", action="store_true")
+    parser.add_argument("-v", dest="verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def upscale_file(src, dst, scale, resample=Image.BICUBIC):
+    with Image.open(src) as image:
+        image = image.convert("RGB")
+        image.resize((image.width * scale, image.height * scale), resample).save(dst)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if os.path.isdir(args.input):
+        os.makedirs(args.output, exist_ok=True)
+        jobs = [
+            (
+                os.path.join(args.input, fname),
+                os.path.join(args.output, os.path.splitext(fname)[0] + "." + args.format),
+            )
+            for fname in sorted(os.listdir(args.input))
+            if os.path.isfile(os.path.join(args.input, fname))
+        ]
+    else:
+        jobs = [(args.input, args.output)]
+    for src, dst in jobs:
+        print("0.00%", flush=True)
+        upscale_file(src, dst, args.scale)
+        print("100.00%", flush=True)
+        if args.verbose:
+            print("{} -> {} done".format(src, dst), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
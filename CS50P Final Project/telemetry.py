@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+
+
+STAGE_NAMES = ("decode", "upscale", "encode")
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            try:
+                total += os.path.getsize(os.path.join(root, fname))
+            except OSError:
+                pass
+    return total
+
+
+class ProgressParser:
+    # ffmpeg -progress writes key=value blocks that end in progress=continue
+    # or progress=end; every finished block is reported once.
+
+    def __init__(self, stage, progress):
+        self.stage = stage
+        self.progress = progress
+        self.block = {}
+
+    def __call__(self, line):
+        key, sep, value = line.strip().partition("=")
+        if not sep or " " in key:
+            return
+        self.block[key] = value
+        if key != "progress":
+            return
+        block, self.block = self.block, {}
+        if self.progress is None:
+            return
+        try:
+            frame = int(block.get("frame", 0))
+        except ValueError:
+            return
+        size = block.get("total_size", "N/A")
+        self.progress(self.stage, frame, int(size) if size.isdigit() else None)
+
+
+class Telemetry:
+    # Wraps a progress(stage, frames, stats) callback. The pipeline reports
+    # progress(stage, frames, bytes_written=None); this adds throughput,
+    # elapsed time and ETA per stage and keeps the numbers for the report.
+
+    def __init__(self, total_frames=None, callback=None):
+        self.total_frames = total_frames
+        self.callback = callback
+        self.started = time.monotonic()
+        self.stages = {
+            stage: {"frames": 0, "bytes": 0, "started": None, "updated": None}
+            for stage in range(len(STAGE_NAMES))
+        }
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, frames, bytes_written=None):
+        now = time.monotonic()
+        with self._lock:
+            info = self.stages[stage]
+            if info["started"] is None:
+                info["started"] = now
+            info["frames"] = frames
+            info["updated"] = now
+            if bytes_written is not None:
+                info["bytes"] = bytes_written
+            stats = self.stats(stage)
+        if self.callback:
+            self.callback(stage, frames, stats)
+
+    def stats(self, stage):
+        info = self.stages[stage]
+        elapsed = 0.0
+        if info["started"] is not None:
+            elapsed = info["updated"] - info["started"]
+        fps = info["frames"] / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total_frames and fps > 0:
+            eta = max(self.total_frames - info["frames"], 0) / fps
+        return {
+            "stage": STAGE_NAMES[stage],
+            "frames": info["frames"],
+            "fps": round(fps, 3),
+            "bytes": info["bytes"],
+            "elapsed": round(elapsed, 3),
+            "eta": round(eta, 1) if eta is not None else None,
+        }
+
+    def report(self, **extra):
+        with self._lock:
+            report = {
+                "total_frames": self.total_frames,
+                "wall_seconds": round(time.monotonic() - self.started, 3),
+                "stages": {STAGE_NAMES[s]: self.stats(s) for s in self.stages},
+            }
+        report.update(extra)
+        return report
+
+    def write_report(self, fpath, **extra):
+        report = self.report(**extra)
+        tmp_fpath = fpath + ".tmp"
+        with open(tmp_fpath, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_fpath, fpath)
+        return report
@@ -13,3 +13,631 @@ def test_get_fps():
 
 def test_get_frame_count():
     assert project.get_frame_count(r"crag.mp4").rstrip() == "24"
+
+
+def test_split_frames():
+    import segments
+
+    keyframes = [0, 48, 96, 144, 192]
+    assert segments.split_frames(keyframes, 240, 2) == [96]
+    assert segments.split_frames(keyframes, 240, 5) == [48, 96, 144, 192]
+    assert segments.split_frames([0], 240, 4) == []
+    assert segments.split_frames([], 0, 4) == []
+
+
+def test_manifest_ranges():
+    import manifest
+
+    frames = {1, 2, 3, 7, 9, 10}
+    assert manifest.to_ranges(frames) == [[1, 3], [7, 7], [9, 10]]
+    assert manifest.from_ranges(manifest.to_ranges(frames)) == frames
+    assert manifest.frame_number("scaled/frame00000042.jpg") == 42
+
+
+def test_deduper_exact():
+    import dedup
+
+    deduper = dedup.Deduper()
+    frames = [b"a", b"a", b"b", b"b", b"b", b"a"]
+    assert [deduper.is_duplicate(i) for i in frames] == [False, True, False, True, True, False]
+    assert deduper.report() == {"frames": 6, "unique": 3, "ratio": 2.0}
+
+
+def test_probe_cache(tmp_path, monkeypatch):
+    import media
+
+    monkeypatch.setattr(media, "CACHE_FPATH", str(tmp_path / "probe_cache.json"))
+    info = media.probe("crag.mp4")
+    assert (info.fps, info.frame_count, info.width, info.height) == (24, 24, 960, 540)
+
+    def no_probe(video_fpath):
+        raise AssertionError("probed twice")
+
+    monkeypatch.setattr(media, "run_probe", no_probe)
+    assert media.probe("crag.mp4").fps_str == "24/1"
+
+
+def test_parse_rate():
+    import media
+
+    assert str(media.parse_rate("24000/1001")) == "24000/1001"
+    assert media.parse_rate("0/0") is None
+
+
+def test_job_queue(tmp_path):
+    import os
+    import batch
+
+    (tmp_path / "sub").mkdir()
+    for name in ["b.mp4", "a.mkv", "notes.txt", "sub/c.flv"]:
+        (tmp_path / name).write_bytes(b"")
+    job_queue = batch.JobQueue(str(tmp_path / "queue.json"))
+    added = job_queue.add([str(tmp_path)], "out", "realesr-animevideov3", 2, False)
+    assert [i["input"][len(str(tmp_path)) + 1:] for i in added] == ["a.mkv", "b.mp4", "sub/c.flv"]
+    assert [i["output_dir"] for i in added] == ["out", "out", os.path.join("out", "sub")]
+    # A pending video is queued once and takes the newer settings.
+    again = job_queue.add([str(tmp_path / "b.mp4")], "out", "realesr-animevideov3", 4, False)
+    assert again == [added[1]] and added[1]["scale"] == "4"
+    assert len(batch.JobQueue(str(tmp_path / "queue.json")).pending()) == 3
+    # Finished jobs are dropped when the next batch is added.
+    job_queue.mark(added[0], batch.DONE)
+    job_queue.add([], "out", "realesr-animevideov3", 2, False)
+    assert [i["input"] for i in batch.JobQueue(str(tmp_path / "queue.json")).jobs] == [
+        added[1]["input"], added[2]["input"]
+    ]
+    assert batch.stage_limits({"stage_workers": [1, 2, 3]}) == {0: 1, 1: 2, 2: 3}
+
+
+def test_batch_overlaps_whole_jobs(tmp_path, monkeypatch):
+    import shutil
+    import threading
+    import batch
+    import job
+    import media
+
+    monkeypatch.setattr(media, "CACHE_FPATH", str(tmp_path / "probe_cache.json"))
+    for name in ["a.mp4", "b.mp4"]:
+        shutil.copy("crag.mp4", tmp_path / name)
+    out = str(tmp_path / "out")
+    job_queue = batch.JobQueue(str(tmp_path / "queue.json"))
+    items = job_queue.add([str(tmp_path / "a.mp4")], out, "realesr-animevideov3", 2, False)
+    items += job_queue.add(
+        [str(tmp_path / "b.mp4")], out, "realesr-animevideov3", 2, False, {"stream": True}
+    )
+    # The staged job only decodes once the streaming job has started.
+    started = threading.Event()
+
+    def run_job(*args, **kwargs):
+        started.set()
+        return True
+
+    def decode_stage(input_fpath, scale, options, manifest, progress=None, aborted=None):
+        assert started.wait(10)
+        manifest.set(decoded=24)
+        return True
+
+    monkeypatch.setattr(job, "run_job", run_job)
+    monkeypatch.setattr(job, "decode_stage", decode_stage)
+    monkeypatch.setattr(job, "upscale_stage", lambda *args: True)
+    monkeypatch.setattr(job, "encode_stage", lambda *args: True)
+    monkeypatch.setattr(job, "write_report", lambda *args: None)
+    batch.BatchScheduler(job_queue).run(items)
+    assert [i["status"] for i in items] == [batch.DONE, batch.DONE]
+
+
+def test_batch_checks_renditions(tmp_path, monkeypatch):
+    import os
+    import shutil
+    import batch
+    import job
+    import media
+
+    monkeypatch.setattr(media, "CACHE_FPATH", str(tmp_path / "probe_cache.json"))
+    shutil.copy("crag.mp4", tmp_path / "a.mp4")
+    out = str(tmp_path / "out")
+    os.makedirs(out)
+    options = {"renditions": ["480p"]}
+    job_queue = batch.JobQueue(str(tmp_path / "queue.json"))
+    items = job_queue.add([str(tmp_path / "a.mp4")], out, "realesr-animevideov3", 2, False, options)
+    # Encoded before, but the 480p file is gone.
+    job.manifest_for(
+        items[0]["input"], out, "realesr-animevideov3", "2", False, options, "folder"
+    ).set(encoded=True, decoded=24)
+    open(os.path.join(out, "a.mp4"), "wb").close()
+    decoded = []
+
+    def decode_stage(input_fpath, scale, options, manifest, progress=None, aborted=None):
+        decoded.append(input_fpath)
+        return True
+
+    monkeypatch.setattr(job, "decode_stage", decode_stage)
+    monkeypatch.setattr(job, "upscale_stage", lambda *args: True)
+    monkeypatch.setattr(job, "encode_stage", lambda *args: True)
+    monkeypatch.setattr(job, "write_report", lambda *args: None)
+    batch.BatchScheduler(job_queue).run(items)
+    assert decoded == [items[0]["input"]]
+
+
+def test_preview_folder_input(tmp_path, monkeypatch):
+    import os
+    import preview
+
+    (tmp_path / "in" / "sub").mkdir(parents=True)
+    for name in ["a.mp4", "sub/b.mkv"]:
+        (tmp_path / "in" / name).write_bytes(b"")
+    seen = []
+
+    def fake_preview(video, output_dir, scales, tta):
+        seen.append(os.path.relpath(video, tmp_path / "in"))
+        return {"input": video}
+
+    monkeypatch.setattr(preview, "run_preview", fake_preview)
+    events = []
+    monkeypatch.setattr(project, "emit", events.append)
+    args = project.parse_args(
+        ["--preview", "--input", str(tmp_path / "in"), "--output", str(tmp_path / "out")]
+    )
+    assert project.preview_cli(args) == 0
+    assert seen == ["a.mp4", os.path.join("sub", "b.mkv")]
+    assert [i["event"] for i in events] == ["preview", "preview"]
+
+
+IMPORT_BUDGET = 0.5  # seconds
+
+
+def test_import_without_qt():
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, time; t = time.perf_counter(); import project; "
+        "print(time.perf_counter() - t, 'PySide6' in sys.modules)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout.split()
+    assert out[1] == "False"
+    assert float(out[0]) < IMPORT_BUDGET
+
+
+def test_parse_args():
+    args = project.parse_args(["--input", "a.mp4", "--scale", "4", "--jobs", "3"])
+    assert (args.input, args.scale, args.jobs, args.model) == (["a.mp4"], 4, 3, "realesrgan-x4plus")
+    assert project.parse_args([]).input is None
+
+
+def test_staging_calibrate(tmp_path, monkeypatch):
+    import media
+    import staging
+
+    monkeypatch.setattr(media, "CACHE_FPATH", str(tmp_path / "probe_cache.json"))
+    assert staging.resolve("crag.mp4", 2, {"frame_format": "png"}) == {"scratch": None, "format": "png"}
+    choice = staging.calibrate("crag.mp4", 2, [str(tmp_path)], ("jpg", "bmp"), sample_frames=4)
+    assert choice["scratch"] == str(tmp_path)
+    assert choice["format"] in ("jpg", "bmp")
+    assert len(choice["measurements"]) == 2
+    assert staging.sample_starts(8.0, 4) == [1.0, 3.0, 5.0, 7.0]
+    assert staging.sample_starts(None, 4) == [0]
+
+
+def test_pic_dir_for(tmp_path):
+    import os
+    import pipeline
+
+    assert pipeline.pic_dir_for(os.path.join("a", "seg0000.mkv")) == os.path.join("a", "seg0000.mkvTemp")
+    first = pipeline.pic_dir_for(os.path.join("a", "seg0000.mkv"), str(tmp_path))
+    second = pipeline.pic_dir_for(os.path.join("b", "seg0000.mkv"), str(tmp_path))
+    assert os.path.dirname(first) == str(tmp_path) and first != second
+
+
+def test_telemetry():
+    import telemetry
+
+    events = []
+    tele = telemetry.Telemetry(100, lambda stage, frames, stats: events.append(stats))
+    parser = telemetry.ProgressParser(0, tele)
+    for line in ["frame=10", "fps=0.0", "total_size=N/A", "progress=continue",
+                 "frame=50", "total_size=2048", "progress=end"]:
+        parser(line)
+    assert [(i["frames"], i["bytes"]) for i in events] == [(10, 0), (50, 2048)]
+    assert events[-1]["stage"] == "decode"
+    report = tele.report(ok=True)
+    assert report["ok"] and report["stages"]["decode"]["frames"] == 50
+    assert report["stages"]["upscale"]["frames"] == 0
+
+
+def test_benchmark_compare():
+    import benchmark
+
+    base = [{"clip": "240p", "mode": "stream", "ok": True, "wall_seconds": 10.0,
+             "peak_disk_bytes": 100, "peak_rss_bytes": None}]
+    same = [dict(base[0], wall_seconds=11.0)]
+    slow = [dict(base[0], wall_seconds=14.0)]
+    assert benchmark.compare(same, base, 0.25) == []
+    assert len(benchmark.compare(slow, base, 0.25)) == 1
+    assert benchmark.compare([dict(base[0], ok=False)], base, 0.25) == ["240p/stream: failed"]
+
+
+def test_stub_upscaler(tmp_path):
+    from PIL import Image
+    import stub_upscaler
+
+    Image.new("RGB", (8, 6)).save(tmp_path / "frame00000001.jpg")
+    assert stub_upscaler.main(["-i", str(tmp_path), "-o", str(tmp_path / "out"), "-s", "3", "-f", "png"]) == 0
+    assert Image.open(tmp_path / "out" / "frame00000001.png").size == (24, 18)
+
+
+def test_preview_options(tmp_path):
+    import preview
+
+    for name in ["realesr-animevideov3-x2", "realesr-animevideov3-x4", "realesrgan-x4plus"]:
+        (tmp_path / (name + ".param")).write_text("")
+    assert preview.preview_options([2, 4], str(tmp_path)) == [
+        ("realesr-animevideov3", 2), ("realesr-animevideov3", 4), ("realesrgan-x4plus", 4),
+    ]
+    assert preview.pick_times([], 12.0, 4) == [1.5, 4.5, 7.5, 10.5]
+    assert len(preview.pick_times([float(i) for i in range(20)], 20.0, 4)) == 4
+
+
+def test_tuning_resolve(tmp_path, monkeypatch):
+    import tuning
+
+    monkeypatch.setattr(tuning, "TUNING_FPATH", str(tmp_path / "tuning.json"))
+    tuning.save_cache({tuning.cache_key("m", 2, False): {"threads": "2:4:4", "tile": 256, "shards": 2}})
+    assert tuning.resolve("crag.mp4", "m", 2, False, {}) == tuning.DEFAULT
+    tuned = tuning.resolve("crag.mp4", "m", 2, False, {"tune": True, "shards": 3})
+    assert tuned == {"threads": "2:4:4", "tile": 256, "shards": 3}
+    assert tuning.upscaler_args(tuned) == ["-j", "2:4:4", "-t", "256"]
+
+
+def test_encoding_profiles(tmp_path, monkeypatch):
+    import encoding
+    import media
+
+    monkeypatch.setattr(media, "CACHE_FPATH", str(tmp_path / "probe_cache.json"))
+    monkeypatch.setattr(encoding, "ENCODING_FPATH", str(tmp_path / "encoding.json"))
+    monkeypatch.setattr(encoding, "PRESETS", ("ultrafast", "veryfast"))
+    assert encoding.encoder_args(encoding.PROFILES["default"]) == [
+        "-c:v", "libx264", "-preset", "medium", "-crf", "23", "-pix_fmt", "yuv420p",
+    ]
+    assert "-g" in encoding.encoder_args(encoding.PROFILES["mezzanine"])
+    assert encoding.resolve("crag.mp4", 2, {"profile": "fast", "crf": 18})["crf"] == 18
+    profile = encoding.resolve("crag.mp4", 2, {"preset": "auto", "realtime_factor": 0.01})
+    assert profile["preset"] in encoding.PRESETS
+    assert len(encoding.load_cache()) == 1
+
+
+def test_lanczos_backend(tmp_path):
+    import numpy as np
+    from PIL import Image
+    import backends
+
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (2, 12, 16, 3), dtype=np.uint8)
+    scaled = backends.lanczos_resize(frames, 3)
+    assert scaled.shape == (2, 36, 48, 3)
+    flat = np.full((1, 4, 4, 3), 77, np.uint8)
+    assert (backends.lanczos_resize(flat, 2) == 77).all()
+    reference = np.asarray(Image.fromarray(frames[0]).resize((48, 36), Image.LANCZOS))
+    assert np.abs(reference[3:-3, 3:-3].astype(int) - scaled[0, 3:-3, 3:-3]).mean() < 2
+
+    Image.fromarray(frames[0]).save(tmp_path / "frame00000001.png")
+    done = []
+    backend = backends.LanczosBackend(workers=2)
+    assert backend.upscale_dir(str(tmp_path), str(tmp_path / "out"), None, 2,
+                               on_done=lambda src, out: done.append(out))
+    assert Image.open(done[0]).size == (32, 24)
+
+    # Alpha survives, except in JPEG output.
+    (tmp_path / "alpha").mkdir()
+    alpha = np.dstack([frames[1], np.full((12, 16), 128, np.uint8)])
+    Image.fromarray(alpha).save(tmp_path / "alpha" / "frame00000001.png")
+    assert backend.upscale_dir(str(tmp_path / "alpha"), str(tmp_path / "alpha_out"), None, 2)
+    with Image.open(tmp_path / "alpha_out" / "frame00000001.png") as image:
+        assert image.mode == "RGBA"
+        assert (np.asarray(image)[..., 3] == 128).all()
+    assert backend.upscale_dir(str(tmp_path / "alpha"), str(tmp_path / "alpha_out"), None, 2, ext="jpg")
+    assert Image.open(tmp_path / "alpha_out" / "frame00000001.jpg").mode == "RGB"
+
+
+def test_stream_batch_size():
+    import backends
+    import pipeline
+
+    ncnn = backends.NcnnBackend()
+    assert pipeline.stream_batch_size(backends.LanczosBackend(), 3840, 2160) == 16
+    assert pipeline.stream_batch_size(ncnn, 960, 540) == 256
+    assert pipeline.stream_batch_size(ncnn, 3840, 2160) == 21
+    assert pipeline.stream_batch_size(ncnn, 7680, 4320) == 16
+
+
+def test_letterbox(tmp_path):
+    import subprocess
+    import letterbox
+
+    output = "\n".join([
+        "[Parsed_cropdetect_0 @ 0x1] x1:0 x2:639 y1:44 y2:315 w:640 h:272 x:0 y:44 pts:0 t:0.000000 limit:0.094 crop=640:272:0:44",
+        "[Parsed_cropdetect_0 @ 0x1] x1:639 x2:0 y1:359 y2:0 w:-624 h:-344 x:632 y:352 pts:1 t:0.500000 limit:0.094 crop=-624:-344:632:352",
+        "[Parsed_cropdetect_0 @ 0x1] x1:80 x2:559 y1:44 y2:315 w:480 h:272 x:80 y:44 pts:2 t:2.000000 limit:0.094 crop=480:272:80:44",
+    ])
+    crops = letterbox.parse_crops(output)
+    assert [t for t, _ in crops] == [0.0, 2.0]
+    assert len(letterbox.scenes(crops + crops[-1:])) == 2
+    crop = {"w": 640, "h": 272, "x": 0, "y": 44, "width": 640, "height": 360}
+    assert letterbox.crop_filter(crop) == "crop=640:272:0:44"
+    assert letterbox.pad_filter(crop, 2) == "pad=1280:720:0:88:black"
+
+    fpath = str(tmp_path / "bars.mp4")
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc=size=320x136:rate=24:duration=1",
+        "-vf", "pad=320:180:0:22:black", "-pix_fmt", "yuv420p", fpath,
+    ], check=True)
+    detected = letterbox.detect(fpath)
+    assert (detected["w"], detected["h"], detected["y"]) == (320, 136, 22)
+    assert letterbox.resolve(fpath, {"crop": None}) is None
+
+
+def test_frame_cache(tmp_path):
+    import os
+    import framecache
+
+    cache = framecache.FrameCache("lanczos|model|2|False", 10, str(tmp_path / "frames"))
+    key = cache.key(b"frame")
+    assert key != framecache.FrameCache("lanczos|model|4|False", 10).key(b"frame")
+    assert cache.read(key, "png") is None
+    cache.put_bytes(key, b"scaled", "png")
+    assert cache.read(key, "png") == b"scaled"
+    other = cache.key(b"other")
+    cache.put_bytes(other, b"scaled2", "png")
+    os.utime(cache.path(key, "png"), (0, 0))
+    assert cache.trim() == 7
+    assert cache.read(key, "png") is None and cache.read(other, "png") == b"scaled2"
+    assert cache.report() == {"hits": 2, "misses": 2, "stored": 2, "evicted": 1}
+
+    # Cache entries and scaled frames are separate files, so rewriting one
+    # leaves the other alone.
+    (tmp_path / "pics" / "scaled").mkdir(parents=True)
+    (tmp_path / "pics" / "frame00000001.jpg").write_bytes(b"other")
+    scaled = tmp_path / "pics" / "scaled" / "frame00000001.png"
+    missing, cached = framecache.lookup_frames(
+        cache, str(tmp_path / "pics"), ["frame00000001.jpg"], str(scaled.parent), "png"
+    )
+    assert (missing, cached) == ({}, ["frame00000001.jpg"])
+    scaled.write_bytes(b"rewritten")
+    assert cache.read(other, "png") == b"scaled2"
+    scaled.write_bytes(b"scaled3")
+    third = cache.key(b"third")
+    cache.put_file(third, str(scaled), "png")
+    scaled.write_bytes(b"rewritten")
+    assert cache.read(third, "png") == b"scaled3"
+
+
+def test_routed_backend():
+    import numpy as np
+    import backends
+
+    rng = np.random.default_rng(0)
+    flat = np.full((16, 16, 3), 12, np.uint8)
+    noise = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    assert backends.complexity(flat[..., 0], 1) == 0
+    assert backends.complexity(noise[..., 0], 1) > backends.ROUTE_THRESHOLD
+
+    class Model:
+        name = "model"
+
+        def upscale_frames(self, frames, *args):
+            return [b"model"] * len(frames)
+
+    routed = backends.RoutedBackend(Model(), 2.0)
+    pngs = routed.upscale_frames([flat.tobytes(), noise.tobytes()], 16, 16, None, 2)
+    assert pngs[0].startswith(b"\x89PNG") and pngs[1] == b"model"
+    assert routed.report() == {"model": 1, "lanczos": 1, "threshold": 2.0, "ratio": 0.5}
+    assert isinstance(backends.make_backend({"route_threshold": True}), backends.RoutedBackend)
+
+
+def test_renditions():
+    import pytest
+    import encoding
+    import pipeline
+
+    renditions = encoding.renditions({"renditions": ["720p", "480p:fast"]})
+    assert [(i["name"], i["profile"]["preset"]) for i in renditions] == [
+        ("720p", "medium"), ("480p", "veryfast"),
+    ]
+    with pytest.raises(ValueError):
+        encoding.parse_rendition("719p")
+    args = pipeline.output_args(
+        "out/a.mp4", ["-c:v", "libx264"], "pad=8:8", encoding.rendition_outputs(renditions)
+    )
+    assert args[1] == (
+        "[0:v]pad=8:8,split=3[master][s0][s1];"
+        "[s0]scale=-2:720:flags=lanczos[r0];[s1]scale=-2:480:flags=lanczos[r1]"
+    )
+    assert "out/a_720p.mp4" in args and args[-1] == "out/a_480p.mp4"
+    assert pipeline.output_args("a.mp4", [])[:2] == ["-map", "0:v:0"]
+
+
+def test_progressive_output():
+    import job
+    import pipeline
+
+    assert pipeline.progressive_output("out/a.mp4") == ([], "out/a.mp4")
+    args, fpath = pipeline.progressive_output("out/a.mp4", "fmp4")
+    assert fpath == "out/a.mp4" and "+frag_keyframe+empty_moov+default_base_moof" in args
+    args, fpath = pipeline.progressive_output("out/a.mp4", "hls")
+    assert fpath == "out/a.m3u8" and args[args.index("-hls_segment_filename") + 1] == "out/a_%05d.m4s"
+    assert pipeline.output_args("out/a.mp4", [], progressive="hls")[-1] == "out/a.m3u8"
+    assert job.job_mode({"jobs": 4, "progressive": "fmp4"}) == "stream"
+
+
+def test_upscale_images(tmp_path):
+    import os
+    from PIL import Image
+    import images
+
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    Image.new("RGB", (8, 6), "red").save(src / "a.png")
+    Image.new("RGB", (10, 10), "blue").save(src / "sub" / "b.jpeg")
+    (src / "notes.txt").write_text("not an image")
+    out = str(src / "out")
+    report = images.upscale_images([str(src)], out, None, 2, False, {"backend": "lanczos"})
+    assert (report["upscaled"], report["skipped"]) == (2, 0)
+    assert Image.open(os.path.join(out, "a.png")).size == (16, 12)
+    assert Image.open(os.path.join(out, "sub", "b.jpg")).size == (20, 20)
+    report = images.upscale_images([str(src)], out, None, 2, False, {"backend": "lanczos"})
+    assert (report["images"], report["upscaled"], report["skipped"]) == (2, 0, 2)
+
+
+def test_decode_failure_is_not_checkpointed(tmp_path, monkeypatch):
+    import shutil
+    import pytest
+    import job
+    import pipeline
+
+    video = str(tmp_path / "crag.mp4")
+    shutil.copy("crag.mp4", video)
+    manifest = job.manifest_for(video, str(tmp_path), None, 2, False, {}, "folder")
+    monkeypatch.setattr(pipeline, "run_process", lambda cmd, on_line=None, aborted=None: False)
+    with pytest.raises(RuntimeError):
+        job.decode_stage(video, 2, {}, manifest)
+    assert not manifest.data["decoded"]
+
+
+def stub_job(tmp_path, monkeypatch, keyframe_every=None):
+    # crag.mp4 in tmp_path, re-encoded with closer keyframes if asked, and
+    # the stub in place of realesrgan, also for the segment processes.
+    import os
+    import shlex
+    import shutil
+    import subprocess
+    import sys
+    import config
+    import media
+
+    stub = shlex.join([sys.executable, os.path.abspath("stub_upscaler.py")])
+    monkeypatch.setenv("AI2X_UPSCALER", stub)
+    monkeypatch.setattr(config, "UPSCALER", stub)
+    monkeypatch.setattr(media, "CACHE_FPATH", str(tmp_path / "probe_cache.json"))
+    video = str(tmp_path / "crag.mp4")
+    if keyframe_every:
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-i", "crag.mp4", "-c:v", "libx264",
+             "-g", str(keyframe_every), "-an", video],
+            check=True,
+        )
+    else:
+        shutil.copy("crag.mp4", video)
+    return video
+
+
+def test_resume_folder_job(tmp_path, monkeypatch):
+    import json
+    import os
+    import backends
+    import job
+    import media
+    import manifest
+    import pipeline
+
+    video = stub_job(tmp_path, monkeypatch)
+    out = str(tmp_path / "out")
+    os.makedirs(out)
+    upscaled = []
+    upscale_dir = backends.NcnnBackend.upscale_dir
+
+    def recording_upscale_dir(self, input_dir, *args, **kwargs):
+        upscaled.extend(pipeline.list_frames(input_dir))
+        return upscale_dir(self, input_dir, *args, **kwargs)
+
+    monkeypatch.setattr(backends.NcnnBackend, "upscale_dir", recording_upscale_dir)
+    counts = {}
+
+    def progress(stage, frames, stats=None):
+        counts[stage] = frames
+
+    def aborted():
+        return counts.get(pipeline.UPSCALE, 0) >= 8
+
+    assert not job.run_job(video, out, "realesr-animevideov3", 2, False, {}, progress, aborted)
+    with open(os.path.join(out, "crag.ai2x.json")) as f:
+        finished = manifest.from_ranges(json.load(f)["upscaled"])
+    assert 8 <= len(finished) < 24
+
+    upscaled.clear()
+    assert job.run_job(video, out, "realesr-animevideov3", 2, False, {})
+    assert len(upscaled) == 24 - len(finished)
+    assert not finished & {manifest.frame_number(i) for i in upscaled}
+    assert media.count_frames(os.path.join(out, "crag.mp4")) == 24
+
+
+def test_segments_job(tmp_path, monkeypatch):
+    import json
+    import os
+    import job
+    import media
+
+    video = stub_job(tmp_path, monkeypatch, keyframe_every=6)
+    out = str(tmp_path / "out")
+    os.makedirs(out)
+    assert job.run_job(video, out, "realesr-animevideov3", 2, False, {"jobs": 2})
+    with open(os.path.join(out, "crag.ai2x.json")) as f:
+        assert len(json.load(f)["segments"]) > 1
+    assert media.count_frames(os.path.join(out, "crag.mp4")) == 24
+
+
+def test_stream_job(tmp_path, monkeypatch):
+    import os
+    import job
+    import media
+    import pipeline
+
+    video = stub_job(tmp_path, monkeypatch)
+    out = str(tmp_path / "out")
+    os.makedirs(out)
+    encoded = []
+
+    def progress(stage, frames, stats=None):
+        if stage == pipeline.ENCODE:
+            encoded.append(frames)
+
+    assert job.run_job(
+        video, out, "realesr-animevideov3", 2, False, {"stream": True, "batch_size": 5}, progress
+    )
+    assert encoded[-1] == 24
+    assert media.count_frames(os.path.join(out, "crag.mp4")) == 24
+
+
+def test_json_progress():
+    import io
+    import json
+    import pipeline
+
+    out = io.StringIO()
+    progress = project.json_progress(out)
+    stats = {"fps": 1.0, "bytes": 0, "elapsed": 1.0, "eta": 0.0}
+    progress(pipeline.ENCODE, 24, stats)
+    progress(pipeline.ENCODE, 24, stats)
+    progress(pipeline.ENCODE, 24, dict(stats, bytes=1000))
+    events = [json.loads(i) for i in out.getvalue().splitlines()]
+    assert [(i["frames"], i["bytes"]) for i in events] == [(24, 0), (24, 1000)]
+
+
+def test_resume_queue(tmp_path, monkeypatch):
+    import os
+    import shutil
+    import batch
+    import media
+
+    monkeypatch.setattr(media, "CACHE_FPATH", str(tmp_path / "probe_cache.json"))
+    shutil.copy("crag.mp4", tmp_path / "a.mp4")
+    queue_fpath = str(tmp_path / "queue.json")
+    out = str(tmp_path / "out")
+    batch.JobQueue(queue_fpath).add(
+        [str(tmp_path / "a.mp4")], out, "realesr-animevideov3", 2, False, {"backend": "lanczos"}
+    )
+    assert project.resume_queue(queue_fpath=queue_fpath)
+    assert os.path.exists(os.path.join(out, "a.mp4"))
+    assert batch.JobQueue(queue_fpath).pending() == []
+    assert project.resume_queue(queue_fpath=queue_fpath)
+    assert project.parse_args(["--resume-queue"]).resume_queue
@@ -0,0 +1,154 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import backends
+import config
+import media
+import pipeline
+import preview
+
+
+TUNING_FPATH = os.path.join(config.CACHE_DIR, "tuning.json")
+# realesrgan's own defaults are -j 1:2:2 and an automatic tile size (-t 0);
+# None keeps those.
+DEFAULT = {"threads": None, "tile": None, "shards": 1}
+THREADS = ("2:2:2", "2:4:4", "4:4:4")
+TILES = (512, 256, 128)
+SHARDS = (2, 3, 4)
+SAMPLE_FRAMES = 8
+# A setting has to beat the current best by this much to replace it, so
+# noise between runs doesn't pick an arbitrary setting.
+MIN_GAIN = 1.03
+_cache_lock = threading.Lock()
+
+
+def upscaler_args(tuned):
+    args = []
+    if tuned.get("threads"):
+        args += ["-j", tuned["threads"]]
+    if tuned.get("tile"):
+        args += ["-t", str(tuned["tile"])]
+    return args
+
+
+def cache_key(model, scale, tta):
+    return "|".join([
+        platform.node(), " ".join(pipeline.upscaler_cmd()), model, str(scale), str(bool(tta)),
+    ])
+
+
+def load_cache():
+    try:
+        with open(TUNING_FPATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(TUNING_FPATH), exist_ok=True)
+    tmp_fpath = "{}.{}.tmp".format(TUNING_FPATH, os.getpid())
+    with open(tmp_fpath, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_fpath, TUNING_FPATH)
+
+
+def sample_frames(input_fpath, sample_dir, pic_dir=None, count=SAMPLE_FRAMES):
+    # Evenly spaced frames, taken from the decoded frames when there are
+    # some already and from the video otherwise.
+    if pic_dir:
+        fnames = pipeline.list_frames(pic_dir)
+        if fnames:
+            step = max(len(fnames) / count, 1)
+            picked = sorted({fnames[int(i * step)] for i in range(min(count, len(fnames)))})
+            pipeline.link_frames(pic_dir, sample_dir, picked)
+            return picked
+    duration = media.probe(input_fpath).duration
+    return preview.extract_frames(input_fpath, preview.pick_times([], duration, count), sample_dir)
+
+
+def measure(sample_dir, work_dir, model, scale, tta, tuned, aborted=None):
+    # Frames per second over all shards: every shard process works through
+    # the same samples at the same time, so they compete for the GPU the
+    # way they would in the real run.
+    backend = backends.NcnnBackend(upscaler_args(tuned))
+    shards = tuned.get("shards") or 1
+    with ThreadPoolExecutor(max_workers=shards) as pool:
+        results = list(pool.map(
+            lambda n: preview.measure_option(
+                sample_dir, os.path.join(work_dir, f"out{n}"), model, scale, tta, aborted, backend
+            ),
+            range(shards),
+        ))
+    if not all(i["ok"] for i in results):
+        return 0.0
+    return sum(1 / max(i["seconds_per_frame"], 1e-6) for i in results)
+
+
+def calibrate(sample_dir, model, scale, tta, aborted=None):
+    # Tries the -j settings first, then the tile sizes with the best -j, and
+    # then adds shards for as long as that still helps.
+    aborted = aborted or (lambda: False)
+    work_dir = tempfile.mkdtemp(prefix="ai2x_tune_")
+    measurements = []
+
+    def trial(tuned):
+        fps = measure(sample_dir, work_dir, model, scale, tta, tuned, aborted)
+        measurements.append(dict(tuned, fps=round(fps, 3)))
+        return fps
+
+    try:
+        best = dict(DEFAULT)
+        best_fps = trial(best)
+        for name, values in (("threads", THREADS), ("tile", TILES)):
+            for value in values:
+                if aborted():
+                    break
+                tuned = dict(best, **{name: value})
+                fps = trial(tuned)
+                if fps > best_fps * MIN_GAIN:
+                    best, best_fps = tuned, fps
+        for shards in SHARDS:
+            if aborted():
+                break
+            tuned = dict(best, shards=shards)
+            fps = trial(tuned)
+            if fps <= best_fps * MIN_GAIN:
+                break
+            best, best_fps = tuned, fps
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return dict(best, fps=round(best_fps, 3), measurements=measurements)
+
+
+def resolve(input_fpath, model, scale, tta, options, pic_dir=None, aborted=None):
+    # "tune" calibrates once per machine, model and scale and reuses the
+    # cached result; explicit threads/tile/shards options always win.
+    tuned = dict(DEFAULT)
+    # -j and -t only mean something to realesrgan.
+    if options.get("tune") and (options.get("backend") or "ncnn") == "ncnn":
+        key = cache_key(model, scale, tta)
+        with _cache_lock:
+            cached = load_cache().get(key)
+        if cached is None:
+            sample_dir = tempfile.mkdtemp(prefix="ai2x_samples_")
+            try:
+                sample_frames(input_fpath, sample_dir, pic_dir)
+                cached = calibrate(sample_dir, model, scale, tta, aborted)
+            finally:
+                shutil.rmtree(sample_dir, ignore_errors=True)
+            if not (aborted and aborted()):
+                with _cache_lock:
+                    cache = load_cache()
+                    cache[key] = cached
+                    save_cache(cache)
+        tuned.update({i: cached[i] for i in DEFAULT})
+    for name in DEFAULT:
+        if options.get(name) is not None:
+            tuned[name] = options[name]
+    return tuned
@@ -1,9 +1,13 @@
-import os
-import subprocess
-import shutil
-import project
-
-from PySide6.QtCore import Qt, Signal, QThread, QObject
+import batch
+import dedup
+import framecache
+import job
+import media
+import preview
+import time
+
+from PySide6.QtCore import Qt, Signal, QThread, QObject, QUrl
+from PySide6.QtGui import QDesktopServices
 from PySide6.QtWidgets import QWidget, QMessageBox
 from ai2x_ui import Ui_Form
 
@@ -11,7 +15,10 @@ from ai2x_ui import Ui_Form
 
 
 class Worker(QObject):
-    update_progress_sig = Signal(int, int)  # progress order, progress value
+    update_progress_sig = Signal(int, int, dict)  # progress order, progress value, stats
+    preview_done_sig = Signal(dict)  # preview report, or {"error": message}
+    job_done_sig = Signal(dict)  # {"ok": bool}, or {"error": message}
+    total_frames_sig = Signal(int)  # frames of the job or the whole batch
 
     def __init__(self):
         super().__init__()
@@ -21,100 +28,89 @@ class Worker(QObject):
         self._abort = True
         return
 
-    def main(self, input_fpath, output_dir, model, scale, tta):
+    def aborted(self):
+        return self._abort
+
+    def run_batch(self, input_fpaths, output_dir, model, scale, tta, options):
         self._abort = False
-        pic_dir = self.video_to_pics(input_fpath)
-        if not self._abort:
-            scaled_pics_dir = self.upscale(pic_dir, model, scale, tta)
-        done = False
-        if not self._abort:
-            done = self.pics_to_video(scaled_pics_dir, input_fpath, output_dir)
-        if done or self._abort:
-            shutil.rmtree(pic_dir)
-
-    def video_to_pics(self, input_fpath):
-        temp_dirname = os.path.basename(input_fpath) + "Temp"
-        temp_path = os.path.dirname(input_fpath)
-        pic_dir = os.path.join(temp_path, temp_dirname)
-        os.mkdir(pic_dir)
-        temp_output_path = os.path.join(pic_dir, "frame%08d.jpg")
-        cmd = f"ffmpeg -i {input_fpath} -qscale:v 1 -qmin 1 -qmax 1 -vsync 0 {temp_output_path}"
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-        )
-        for line in process.stdout:
-            if self._abort:
-                process.terminate()
-            if "frame=" not in line:
-                continue
-            frame = int(line.split(" fps")[0][7:])
-            self.update_progress_sig.emit(0, frame)
-        return pic_dir
-
-    def upscale(self, pic_dir, model, scale, tta):
-        scaled_pics_dir = os.path.join(pic_dir, "scaled")
-        os.mkdir(scaled_pics_dir)
-        exe = os.path.join(os.getcwd(), "realesrgan-ncnn-vulkan")
-        cmd = f"{exe} -i {pic_dir} -o {scaled_pics_dir} -n {model} -s {scale} -f jpg"
-        print (cmd)
-        if tta:
-            cmd += " -x"
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-        )
-        for line in process.stdout:
-            if self._abort:
-                process.terminate()
-            if line.startswith("0.00%"):
-                self.update_progress_sig.emit(1, 1)
-        return scaled_pics_dir
-
-    def pics_to_video(self, scaled_pics_dir, input_fpath, output_dir):
-        fps = project.get_fps(input_fpath)
-        scaled_pics_path = os.path.join(scaled_pics_dir, "frame%08d.jpg")
-        fname = os.path.basename(input_fpath).split(".")[0]
-        output_fpath = os.path.join(output_dir, fname + ".mp4")
-        cmd = (
-            f"ffmpeg -f image2 -framerate {fps} -i {scaled_pics_path} -i {input_fpath} "
-            f"-map 0:v:0 -map 1:a:0? -c:a copy -c:v libx264 -r {fps[:2]} -pix_fmt yuv420p {output_fpath}"
-        )
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-        )
-        for line in process.stdout:
-            if self._abort:
-                process.terminate()
-            if "frame=" not in line:
-                continue
-            frame = int(line.split(" fps")[0][7:])
-            self.update_progress_sig.emit(2, frame)
-        return True
+        try:
+            job_queue = batch.JobQueue()
+            added = job_queue.add(input_fpaths, output_dir, model, scale, tta, options)
+            scheduler = batch.BatchScheduler(
+                job_queue, batch.stage_limits(options), self.update_progress_sig.emit,
+                self.aborted,
+            )
+            self.total_frames_sig.emit(scheduler.total_frames(added))
+            items = scheduler.run(added)
+            failed = [i for i in items if i["status"] == batch.FAILED]
+            if failed:
+                # The last line of each traceback names the exception.
+                lines = [
+                    "{}: {}".format(i["input"], (i["error"] or "failed").strip().splitlines()[-1])
+                    for i in failed
+                ]
+                result = {"error": "\n".join(lines)}
+            else:
+                result = {"ok": all(i["status"] == batch.DONE for i in items)}
+        except Exception as e:
+            result = {"error": str(e)}
+        self.job_done_sig.emit(result)
+
+    def main(self, input_fpath, output_dir, model, scale, tta, options):
+        self._abort = False
+        try:
+            # Probing can read the whole file (Matroska has no frame count
+            # in the header), so it happens here rather than in the window.
+            self.total_frames_sig.emit(media.probe(input_fpath).frame_count)
+            done = job.run_job(
+                input_fpath,
+                output_dir,
+                model,
+                scale,
+                tta,
+                options,
+                self.update_progress_sig.emit,
+                self.aborted,
+            )
+            result = {"ok": done}
+        except Exception as e:
+            result = {"error": str(e)}
+        self.job_done_sig.emit(result)
 
+    def preview(self, input_fpath, output_dir, tta):
+        self._abort = False
+        try:
+            report = preview.run_preview(input_fpath, output_dir, tta=tta, aborted=self.aborted)
+        except Exception as e:
+            report = {"error": str(e)}
+        self.preview_done_sig.emit(report)
 
 
 class Widget(QWidget, Ui_Form):
-    # input_fpath,output_dir,model,scale,tta
-    send_data_sig = Signal(str, str, str, str, bool)
+    # input_fpath,output_dir,model,scale,tta,options
+    send_data_sig = Signal(str, str, str, str, bool, dict)
+    # input_fpaths,output_dir,model,scale,tta,options
+    send_batch_sig = Signal(list, str, str, str, bool, dict)
+    # input_fpath,output_dir,tta
+    send_preview_sig = Signal(str, str, bool)
 
     def __init__(self):
         super().__init__()
         self.setupUi(self)
         self.setWindowTitle("Video Ai Upscale")
+        self._progress = [0, 0, 0]
 
         worker = Worker()
         thread = QThread()
         self.send_data_sig.connect(worker.main)
+        self.send_batch_sig.connect(worker.run_batch)
+        self.send_preview_sig.connect(worker.preview)
         worker.update_progress_sig.connect(self.update_progress)
+        worker.preview_done_sig.connect(self.show_preview)
+        worker.job_done_sig.connect(self.show_job_done)
+        worker.total_frames_sig.connect(self.set_total_frames)
         self.start_button.clicked.connect(self.send_data)
+        self.preview_button.clicked.connect(self.send_preview)
         self.abort_button.clicked.connect(lambda: worker.abort())
         self.abort_button.clicked.connect(self.reset_progress)
         worker.moveToThread(thread)
@@ -136,24 +132,113 @@ class Widget(QWidget, Ui_Form):
                 self, "Output Path Is Empty", "Please specify the output path."
             )
             return
-        frame_cnt = int(project.get_frame_count(input_fpath)) * 3
-        self.progress_bar.setRange(0, frame_cnt)
+        # Several files separated by ";" or a folder make a batch.
+        input_paths = [i for i in input_fpath.split(";") if i.strip()]
+        input_fpaths = batch.collect_videos(input_paths, output_dir)
+        if not input_fpaths:
+            QMessageBox.warning(
+                self, "No Input Videos", "No video files found in the input."
+            )
+            return
+        self.set_total_frames(0)
         model = self.model_comboBox.currentText()
         scale = self.scale_comboBox.currentText()[0]
         tta = self.tta_checkBox.isChecked()
-        self.send_data_sig.emit(input_fpath, output_dir, model, scale, tta)
+        options = {
+            "stream": self.stream_checkBox.isChecked(),
+            "jobs": self.jobs_spinBox.value(),
+            "dedup": self.dedup_checkBox.isChecked(),
+            "frame_cache": (
+                framecache.DEFAULT_MAX_GB if self.frame_cache_checkBox.isChecked() else None
+            ),
+            "stage_workers": [
+                self.decode_workers_spinBox.value(),
+                self.upscale_workers_spinBox.value(),
+                self.encode_workers_spinBox.value(),
+            ],
+        }
+        if options["dedup"] and dedup.Image is not None:
+            options["dedup_threshold"] = dedup.DEFAULT_THRESHOLD
+        if len(input_fpaths) > 1 or input_fpaths[0] != input_fpath:
+            # The batch gets the folders themselves, so their structure is
+            # kept under the output folder.
+            self.send_batch_sig.emit(
+                input_paths, output_dir, model, scale, tta, options
+            )
+            return
+        self.send_data_sig.emit(input_fpath, output_dir, model, scale, tta, options)
 
+    def send_preview(self):
+        # Upscales a few scene-change frames with every model and scale, so
+        # the choice can be made before committing to the full run.
+        input_fpaths = batch.collect_videos(
+            [i for i in self.input_lineEdit.text().split(";") if i.strip()]
+        )
+        output_dir = self.output_lineEdit.text()
+        if not input_fpaths or output_dir == "":
+            QMessageBox.warning(
+                self, "Preview", "Please select the input file and the output path."
+            )
+            return
+        self.preview_button.setEnabled(False)
+        self.send_preview_sig.emit(input_fpaths[0], output_dir, self.tta_checkBox.isChecked())
 
-    def update_progress(self, order, val):
-        cur_val = self.progress_bar.value()
-        if order == 0:
-            self.progress_bar.setValue(val)
-        if order == 1:
-            self.progress_bar.setValue(cur_val + 1)
-        if order == 2:
-            self.progress_bar.setValue(cur_val + val)
+    def show_preview(self, report):
+        self.preview_button.setEnabled(True)
+        if "error" in report:
+            QMessageBox.warning(self, "Preview", report["error"])
+            return
+        lines = []
+        for option in report["options"]:
+            if not option["ok"]:
+                lines.append("{model} x{scale}: failed".format(**option))
+                continue
+            lines.append("{} x{}: {:.2f} s/frame, full video about {}".format(
+                option["model"], option["scale"], option["seconds_per_frame"],
+                time.strftime("%H:%M:%S", time.gmtime(option["projected_seconds"])),
+            ))
+        QMessageBox.information(self, "Preview", "\n".join(lines))
+        if report["sheet"]:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(report["sheet"]))
+
+    def set_total_frames(self, frame_cnt):
+        # A range of 0 shows the bars as busy until the worker has probed
+        # the input.
+        self.progress_bar.setRange(0, frame_cnt * 3)
+        self.progress_bar.setValue(0)
+        for bar in self.stage_bars():
+            bar.setRange(0, frame_cnt)
+            bar.setValue(0)
+        self._progress = [0, 0, 0]
+
+    def show_job_done(self, result):
+        # An aborted job already got its message from reset_progress.
+        if "error" in result:
+            QMessageBox.warning(self, "Upscale Failed", result["error"])
+        elif not result["ok"] and not self._worker.aborted():
+            QMessageBox.warning(self, "Upscale Failed", "The upscale did not finish.")
+
+    def stage_bars(self):
+        return [self.decode_bar, self.upscale_bar, self.encode_bar]
+
+    def update_progress(self, order, val, stats=None):
+        # Each stage reports its own frame count; in streaming mode the
+        # stages overlap, so the bar shows their sum.
+        self._progress[order] = val
+        self.progress_bar.setValue(sum(self._progress))
+        bar = self.stage_bars()[order]
+        bar.setValue(val)
+        if stats and stats.get("fps"):
+            text = "%p%  {:.1f} fps".format(stats["fps"])
+            if stats.get("eta") is not None:
+                text += "  ETA {}".format(time.strftime("%H:%M:%S", time.gmtime(stats["eta"])))
+            bar.setFormat(text)
 
     def reset_progress(self):
+        self._progress = [0, 0, 0]
         self.progress_bar.setValue(0)
+        for bar in self.stage_bars():
+            bar.setValue(0)
+            bar.setFormat("%p%")
         QMessageBox.warning(self, "Abort", "Aborted!")
         return